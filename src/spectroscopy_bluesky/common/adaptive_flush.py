@@ -0,0 +1,185 @@
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import bluesky.plan_stubs as bps
+from bluesky.utils import MsgGenerator, short_uid
+
+"""
+Flush policy for collecting data from detectors during a fly scan.
+Instead of collecting at a fixed period (e.g. flush_period=0.5 in
+`bps.collect_while_completing`), the period is adjusted using the frame rate
+observed from the detectors, to give a target number of frames per flush
+and/or a maximum latency.
+"""
+
+
+@dataclass
+class AdaptiveFlushPolicy:
+    """Settings used to calculate the time between flushes (seconds)
+
+    Args:
+        target_latency: maximum time between flushes. If target_frames is not
+            set, flushes are made at this period.
+        target_frames: number of frames to collect in each flush. The period is
+            calculated from the observed frame rate (and limited by target_latency).
+        min_period: shortest time between flushes
+        max_period: longest time between flushes
+        initial_period: time before first flush (before frame rate is known)
+        smoothing: weight given to the most recent frame rate measurement
+            (1 = only use the latest measurement)
+    """
+
+    target_latency: float | None = 0.5
+    target_frames: int | None = None
+    min_period: float = 0.05
+    max_period: float = 5.0
+    initial_period: float = 0.5
+    smoothing: float = 0.5
+
+    def next_period(self, frame_rate: float | None) -> float:
+        """Calculate time until next flush from frame rate (frames per second)"""
+        period = self.initial_period
+        if self.target_latency is not None:
+            period = self.target_latency
+
+        if self.target_frames is not None and frame_rate is not None:
+            period = (
+                self.target_frames / frame_rate if frame_rate > 0 else self.max_period
+            )
+            if self.target_latency is not None:
+                period = min(period, self.target_latency)
+
+        return min(max(period, self.min_period), self.max_period)
+
+    def update_rate(
+        self, frame_rate: float | None, num_frames: int, elapsed_time: float
+    ) -> float | None:
+        """Update frame rate estimate with frames collected over elapsed time"""
+        if elapsed_time <= 0:
+            return frame_rate
+        latest_rate = num_frames / elapsed_time
+        if frame_rate is None:
+            return latest_rate
+        return self.smoothing * latest_rate + (1 - self.smoothing) * frame_rate
+
+
+def get_frame_index(index_getters: list[Callable[[], Any]]) -> MsgGenerator[int | None]:
+    """Return number of frames written by the slowest detector
+    (None if none of the detectors provide get_index)"""
+    if not index_getters:
+        return None
+    tasks = yield from bps.wait_for(index_getters)
+    return min(task.result() for task in tasks)
+
+
+def wait_until_flush(
+    group: str,
+    period: float,
+    watch: Sequence[str] = (),
+    update: Callable[[], MsgGenerator] | None = None,
+    update_period: float = 0.2,
+) -> MsgGenerator[bool]:
+    """Wait for a group to finish, or until period seconds have elapsed.
+    If update is given, it is run every update_period seconds while waiting
+    (and once when waiting stops).
+
+    Returns:
+        True if the group has finished
+    """
+    if update is None:
+        return (
+            yield from bps.wait(
+                group=group, timeout=period, error_on_timeout=False, watch=watch
+            )
+        )
+
+    flush_time = time.monotonic() + period
+    while True:
+        timeout = min(update_period, flush_time - time.monotonic())
+        done = yield from bps.wait(
+            group=group, timeout=timeout, error_on_timeout=False, watch=watch
+        )
+        yield from update()
+        if done or time.monotonic() >= flush_time:
+            return done
+
+
+def collect_while_completing_adaptive(
+    flyers: Sequence[Any],
+    dets: Sequence[Any],
+    stream_name: str | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
+    watch: Sequence[str] = (),
+    update: Callable[[], MsgGenerator] | None = None,
+    update_period: float = 0.2,
+) -> MsgGenerator:
+    """Same as `bps.collect_while_completing`, but time between each collect is
+    calculated by the flush policy, using the rate at which detector frames are
+    written (from detector `get_index`). A collect is only done if new frames
+    have been written since the last one (or when the flyers have completed).
+
+    Args:
+        flyers: flyers to complete
+        dets: detectors to collect from
+        stream_name: name of stream to collect
+        flush_policy: policy to use to calculate time between flushes.
+            Default policy is used if None.
+        watch: additional groups to monitor while collecting
+        update: plan to run every update_period seconds between the collects
+            (e.g. to move another device, see :func:`wait_until_flush`)
+        update_period: time between each run of update (seconds)
+    """
+    if flush_policy is None:
+        flush_policy = AdaptiveFlushPolicy()
+
+    index_getters = [det.get_index for det in dets if hasattr(det, "get_index")]
+
+    group = short_uid(label="complete")
+    yield from bps.complete_all(*flyers, group=group, wait=False)
+
+    last_index = yield from get_frame_index(index_getters)
+    last_time = time.monotonic()
+    frame_rate = None
+    done = False
+    while not done:
+        period = flush_policy.next_period(frame_rate)
+        done = yield from wait_until_flush(group, period, watch, update, update_period)
+        index = yield from get_frame_index(index_getters)
+        now = time.monotonic()
+
+        if index is None or last_index is None:
+            yield from bps.collect(*dets, name=stream_name)
+            continue
+
+        if index > last_index or done:
+            yield from bps.collect(*dets, name=stream_name)
+        frame_rate = flush_policy.update_rate(
+            frame_rate, index - last_index, now - last_time
+        )
+        last_index, last_time = index, now
+
+
+def collect_while_completing(
+    flyers: Sequence[Any],
+    dets: Sequence[Any],
+    stream_name: str | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
+    flush_period: float = 0.5,
+    watch: Sequence[str] = (),
+) -> MsgGenerator:
+    """Collect while completing, using the adaptive flush policy if one is given,
+    otherwise `bps.collect_while_completing` with a fixed flush period."""
+    if flush_policy is None:
+        yield from bps.collect_while_completing(
+            flyers=flyers,
+            dets=dets,
+            stream_name=stream_name,
+            flush_period=flush_period,
+            watch=watch,
+        )
+    else:
+        yield from collect_while_completing_adaptive(
+            flyers, dets, stream_name, flush_policy, watch
+        )
@@ -0,0 +1,108 @@
+from typing import Any
+
+import bluesky.plan_stubs as bps
+import numpy as np
+from bluesky.utils import MsgGenerator
+from numpy.typing import NDArray
+from ophyd_async.core import Array1D, soft_signal_r_and_setter
+from ophyd_async.plan_stubs import ensure_connected
+
+"""
+Functions to keep large arrays out of the start document metadata.
+Arrays larger than a given size are replaced in the metadata by a short reference
+(stream name, data key, shape, dtype and summary statistics), and the array
+values are written to a separate event stream at the start of the run.
+"""
+
+# Name of stream used to record the arrays
+ARRAY_STREAM_NAME = "scan_arrays"
+
+# Arrays with more elements than this are moved to the array stream
+DEFAULT_MAX_ARRAY_SIZE = 16
+
+
+def summarise_array(
+    name: str, array: NDArray, stream_name: str = ARRAY_STREAM_NAME
+) -> dict[str, Any]:
+    """Compact description of an array to go in metadata in place of the array.
+
+    Args:
+        name: data key of the array in the stream
+        array: the array
+        stream_name: name of stream the array values are recorded in
+
+    Returns:
+        dict[str, Any]: stream, data key, shape, dtype (and min, max, mean,
+        first and last values for numeric arrays)
+    """
+    summary: dict[str, Any] = {
+        "stream": stream_name,
+        "data_key": name,
+        "shape": list(array.shape),
+        "dtype": str(array.dtype),
+    }
+    if array.size > 0 and np.issubdtype(array.dtype, np.number):
+        flat = array.ravel()
+        summary.update(
+            {
+                "min": float(np.min(flat)),
+                "max": float(np.max(flat)),
+                "mean": float(np.mean(flat)),
+                "first": float(flat[0]),
+                "last": float(flat[-1]),
+            }
+        )
+    return summary
+
+
+def externalise_arrays(
+    params: dict[str, Any],
+    max_array_size: int = DEFAULT_MAX_ARRAY_SIZE,
+    stream_name: str = ARRAY_STREAM_NAME,
+) -> tuple[dict[str, dict[str, Any]], dict[str, NDArray]]:
+    """Find the large numeric arrays in a dictionary of parameters.
+
+    Args:
+        params: dictionary of parameters
+        max_array_size: arrays with more elements than this are externalised
+        stream_name: name of stream the arrays will be recorded in
+
+    Returns:
+        tuple: (summary of each large array (see :func:`summarise_array`),
+        the large arrays), both keyed by parameter name
+    """
+    arrays = {
+        k: v
+        for k, v in params.items()
+        if isinstance(v, np.ndarray)
+        and v.size > max_array_size
+        and np.issubdtype(v.dtype, np.number)
+    }
+    summaries = {k: summarise_array(k, v, stream_name) for k, v in arrays.items()}
+    return summaries, arrays
+
+
+def record_arrays(
+    arrays: dict[str, NDArray], stream_name: str = ARRAY_STREAM_NAME
+) -> MsgGenerator:
+    """Record arrays in a single event in a separate stream (must be called
+    inside a run). Each array is flattened to 1-d - the shape is in the metadata
+    from :func:`summarise_array`."""
+    if not arrays:
+        return
+
+    signals = {}
+    for name, array in arrays.items():
+        flat = array.ravel()
+        if np.issubdtype(flat.dtype, np.integer):
+            signal, setter = soft_signal_r_and_setter(Array1D[np.int64], name=name)
+            flat = flat.astype(np.int64)
+        else:
+            signal, setter = soft_signal_r_and_setter(Array1D[np.float64], name=name)
+            flat = flat.astype(np.float64)
+        signals[signal] = (setter, flat)
+
+    yield from ensure_connected(*signals)
+    for setter, values in signals.values():
+        setter(values)
+    yield from bps.trigger_and_read(list(signals), name=stream_name)
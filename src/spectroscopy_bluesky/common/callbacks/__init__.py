@@ -0,0 +1,14 @@
+from .energy_rebinning import EnergyRebinner, RebinnedSpectrum
+from .sweep_splitter import Sweep, SweepSplitter, SweepSplitterCallback
+from .xas_normalisation import EdgeStep, NormalisedFrames, XasNormaliser
+
+__all__ = [
+    "EnergyRebinner",
+    "RebinnedSpectrum",
+    "Sweep",
+    "SweepSplitter",
+    "SweepSplitterCallback",
+    "EdgeStep",
+    "NormalisedFrames",
+    "XasNormaliser",
+]
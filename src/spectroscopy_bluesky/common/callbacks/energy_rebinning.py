@@ -0,0 +1,160 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+from spectroscopy_bluesky.common.quantity_conversion import (
+    bragg_angle_to_energy,
+    si_111_lattice_spacing,
+)
+
+from .sweep_splitter import Sweep, SweepSplitter
+
+"""
+Rebin the encoder positions captured by the PandA onto an energy grid
+(e.g. the grid from :func:`xas_energy_grid`).
+Encoder counts are converted to Bragg angle and then to energy, and the detector
+values of all the frames in each energy bin are averaged. The bin sums are
+accumulated as each block of frames arrives, so the spectrum for a sweep
+is available as soon as the last frames of the sweep have been added.
+"""
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class RebinnedSpectrum:
+    """Detector values averaged over the frames in each energy bin
+    (NaN for bins with no frames)"""
+
+    sweep_index: int
+    energy: NDArray
+    data: dict[str, NDArray]
+    frames_per_bin: NDArray
+
+
+def energy_bin_edges(energy_grid: ArrayLike) -> NDArray:
+    """Edges of bins centred on each point of an energy grid
+    (half way between adjacent points; first and last bins are symmetric)
+
+    Args:
+        energy_grid: energy of each point, in increasing order
+
+    Returns:
+        NDArray: bin edges (one more than the number of grid points)
+    """
+    grid = np.asarray(energy_grid, dtype=float)
+    if grid.size < 2 or np.any(np.diff(grid) <= 0):
+        raise ValueError("Energy grid needs at least 2 points, in increasing order")
+    midpoints = 0.5 * (grid[1:] + grid[:-1])
+    first = grid[0] - 0.5 * (grid[1] - grid[0])
+    last = grid[-1] + 0.5 * (grid[-1] - grid[-2])
+    return np.concatenate(([first], midpoints, [last]))
+
+
+class EnergyRebinner:
+    def __init__(
+        self,
+        energy_grid: ArrayLike,
+        position_key: str,
+        data_keys: list[str] | None = None,
+        counts_to_angle: Callable[[NDArray], ArrayLike] | None = None,
+        counts_per_degree: float | None = None,
+        angle_offset: float = 0.0,
+        lattice_spacing: float = si_111_lattice_spacing,
+    ):
+        """
+        Args:
+            energy_grid: energy of the centre of each bin (eV), in increasing order
+            position_key: data key of the captured encoder position
+            data_keys: data keys of values to rebin. If None, all data keys apart
+                from the position are rebinned.
+            counts_to_angle: function to convert encoder counts to Bragg angle
+                (degrees). E.g. for p51, use :func:`get_user_position` from
+                spectroscopy_bluesky.p51.plans.common, which uses the motor
+                resolution and encoder offset.
+            counts_per_degree: encoder counts per degree of Bragg angle
+                (used if counts_to_angle is not set)
+            angle_offset: Bragg angle (degrees) at encoder position 0
+                (used with counts_per_degree)
+            lattice_spacing: crystal lattice spacing (metres)
+        """
+        if counts_to_angle is None and counts_per_degree is None:
+            raise ValueError("Either counts_to_angle or counts_per_degree must be set")
+        self.energy = np.asarray(energy_grid, dtype=float)
+        self.bin_edges = energy_bin_edges(self.energy)
+        self.position_key = position_key
+        self.data_keys = data_keys
+        self.counts_to_angle = counts_to_angle
+        self.counts_per_degree = counts_per_degree
+        self.angle_offset = angle_offset
+        self.lattice_spacing = lattice_spacing
+        self.callbacks: list[Callable[[RebinnedSpectrum], None]] = []
+        self.reset()
+
+    def reset(self):
+        self._sums: dict[str, NDArray] = {}
+        self._frames_per_bin = np.zeros(len(self.energy), dtype=np.int64)
+
+    def counts_to_energy(self, counts: ArrayLike) -> NDArray:
+        """Convert encoder counts to energy (eV) using the Bragg relation"""
+        counts = np.asarray(counts, dtype=float)
+        if self.counts_to_angle is not None:
+            angle = np.asarray(self.counts_to_angle(counts), dtype=float)
+        else:
+            assert self.counts_per_degree is not None
+            angle = counts / self.counts_per_degree + self.angle_offset
+        return np.asarray(bragg_angle_to_energy(self.lattice_spacing, angle))
+
+    def bin_indices(self, energy: NDArray) -> NDArray:
+        """Index of the bin for each energy (-1 for energies outside the grid)"""
+        index = np.searchsorted(self.bin_edges, energy, side="right") - 1
+        index[(index < 0) | (index >= len(self.energy))] = -1
+        return index
+
+    def add_frames(self, data: dict[str, ArrayLike]):
+        """Add frames of data (dict of equal length arrays, keyed by data key)
+        to the bin sums."""
+        energy = self.counts_to_energy(data[self.position_key])
+        index = self.bin_indices(energy)
+        in_range = index >= 0
+        index = index[in_range]
+        num_bins = len(self.energy)
+
+        self._frames_per_bin += np.bincount(index, minlength=num_bins)
+        keys = self.data_keys or [k for k in data if k != self.position_key]
+        for key in keys:
+            values = np.asarray(data[key], dtype=float)[in_range]
+            sums = np.bincount(index, weights=values, minlength=num_bins)
+            if key in self._sums:
+                self._sums[key] += sums
+            else:
+                self._sums[key] = sums
+
+    def spectrum(self, sweep_index: int = 0) -> RebinnedSpectrum:
+        """Average values in each bin, for the frames added since the last reset"""
+        frames_per_bin = self._frames_per_bin.copy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            data = {k: v / frames_per_bin for k, v in self._sums.items()}
+        return RebinnedSpectrum(sweep_index, self.energy, data, frames_per_bin)
+
+    def attach(self, splitter: SweepSplitter):
+        """Rebin the frames from a :class:`SweepSplitter` as they arrive,
+        making one spectrum per sweep"""
+        splitter.frame_callbacks.append(self._add_sweep_frames)
+        splitter.callbacks.append(self._sweep_complete)
+
+    def _add_sweep_frames(self, sweep_index: int, data: dict[str, NDArray]):
+        self.add_frames(data)
+
+    def _sweep_complete(self, sweep: Sweep):
+        spectrum = self.spectrum(sweep.index)
+        self.reset()
+        LOGGER.debug(
+            f"Sweep {sweep.index} rebinned : {np.sum(spectrum.frames_per_bin)} of "
+            f"{sweep.num_frames} frames in energy range"
+        )
+        for callback in self.callbacks:
+            callback(spectrum)
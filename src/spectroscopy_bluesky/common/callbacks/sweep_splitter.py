@@ -0,0 +1,309 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import urlparse
+
+import numpy as np
+from bluesky.callbacks.core import CallbackBase
+from numpy.typing import ArrayLike, NDArray
+
+from spectroscopy_bluesky.common.panda_hdf_reader import PandaHdfReader
+
+"""
+Split a stream of PandA frames from a multi-sweep fly scan (e.g.
+seq_table_position_scan, fly_sweep_both_ways) into individual sweeps, as the
+data arrives. Sweeps are split either after a fixed number of frames (number of
+triggers per sweep), or using the start and end of sweep markers captured by the
+PandA (e.g. the outb1/outc1 outputs of the sequence table). The frames of reverse
+direction sweeps are flipped, so every sweep is in order of increasing position.
+
+Only the frames of the current sweep are buffered; each sweep is passed to the
+callback functions as soon as it is complete. Frame callbacks receive the frames
+of the current sweep as they arrive (e.g. to process each flush incrementally).
+"""
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Sweep:
+    """Data for one sweep, keyed by data key"""
+
+    index: int
+    data: dict[str, NDArray]
+    reversed: bool = False
+    complete: bool = True
+
+    @property
+    def num_frames(self) -> int:
+        return len(next(iter(self.data.values()), []))
+
+
+class SweepSplitter:
+    def __init__(
+        self,
+        frames_per_sweep: int | None = None,
+        end_marker_key: str | None = None,
+        start_marker_key: str | None = None,
+        position_key: str | None = None,
+        flip_reversed: bool = True,
+    ):
+        """
+        Args:
+            frames_per_sweep: number of frames in each sweep
+            end_marker_key: data key of end of sweep marker. Frame where this is
+                non-zero is the last frame of a sweep.
+            start_marker_key: data key of start of sweep marker. Frame where this is
+                non-zero is the first frame of a sweep; frames between the end of
+                one sweep and the start of the next are discarded.
+            position_key: data key of position, used to detect reverse sweeps.
+                If None, odd numbered sweeps are assumed to be reverse sweeps.
+            flip_reversed: flip the order of frames in reverse sweeps
+        """
+        if frames_per_sweep is None and end_marker_key is None:
+            raise ValueError("Either frames_per_sweep or end_marker_key must be set")
+        if frames_per_sweep is not None and frames_per_sweep < 1:
+            raise ValueError(f"frames_per_sweep ({frames_per_sweep}) must be > 0")
+
+        self.frames_per_sweep = frames_per_sweep
+        self.end_marker_key = end_marker_key
+        self.start_marker_key = start_marker_key
+        self.position_key = position_key
+        self.flip_reversed = flip_reversed
+        self.callbacks: list[Callable[[Sweep], None]] = []
+        # called with sweep index and frames (not flipped) as frames are buffered
+        self.frame_callbacks: list[Callable[[int, dict[str, NDArray]], None]] = []
+        self.reset()
+
+    def reset(self):
+        self.sweep_index = 0
+        self._chunks: dict[str, list[NDArray]] = {}
+        self._num_buffered = 0
+        self._in_sweep = self.start_marker_key is None
+
+    def add_frames(self, data: dict[str, ArrayLike]) -> list[Sweep]:
+        """Add frames of data (dict of equal length arrays, keyed by data key).
+
+        Returns:
+            list[Sweep]: the sweeps completed by these frames
+        """
+        frames = {k: np.asarray(v) for k, v in data.items()}
+        num_frames = len(next(iter(frames.values()), []))
+        if num_frames == 0:
+            return []
+
+        if self.end_marker_key is None:
+            return self._split_by_count(frames, num_frames)
+        return self._split_by_markers(frames, num_frames)
+
+    def flush(self) -> Sweep | None:
+        """Emit the frames buffered for the current (incomplete) sweep"""
+        if self._num_buffered == 0:
+            return None
+        return self._emit(complete=False)
+
+    def _split_by_count(self, frames: dict[str, NDArray], num_frames: int):
+        assert self.frames_per_sweep is not None
+        sweeps = []
+        pos = 0
+        while pos < num_frames:
+            num = min(self.frames_per_sweep - self._num_buffered, num_frames - pos)
+            self._buffer(frames, pos, pos + num)
+            pos += num
+            if self._num_buffered == self.frames_per_sweep:
+                sweeps.append(self._emit())
+        return sweeps
+
+    def _split_by_markers(self, frames: dict[str, NDArray], num_frames: int):
+        assert self.end_marker_key is not None
+        # (frame index, is end marker) - start marker sorted first on same frame
+        boundaries = [(i, True) for i in np.flatnonzero(frames[self.end_marker_key])]
+        if self.start_marker_key is not None:
+            boundaries += [
+                (i, False) for i in np.flatnonzero(frames[self.start_marker_key])
+            ]
+        boundaries.sort()
+
+        sweeps = []
+        pos = 0
+        for index, is_end in boundaries:
+            if not is_end:
+                if not self._in_sweep:
+                    # discard frames between end of last sweep and start of this one
+                    pos = index
+                    self._in_sweep = True
+                continue
+            if not self._in_sweep:
+                # end marker without a start marker - discard the frames
+                pos = index + 1
+                continue
+            self._buffer(frames, pos, index + 1)
+            pos = index + 1
+            sweeps.append(self._emit())
+            self._in_sweep = self.start_marker_key is None
+
+        if self._in_sweep:
+            self._buffer(frames, pos, num_frames)
+        return sweeps
+
+    def _buffer(self, frames: dict[str, NDArray], start: int, stop: int):
+        if stop <= start:
+            return
+        chunk = {key: values[start:stop] for key, values in frames.items()}
+        for key, values in chunk.items():
+            self._chunks.setdefault(key, []).append(values)
+        self._num_buffered += stop - start
+        for callback in self.frame_callbacks:
+            callback(self.sweep_index, chunk)
+
+    def _is_reversed(self, data: dict[str, NDArray]) -> bool:
+        if self.position_key is not None and self.position_key in data:
+            position = data[self.position_key]
+            if len(position) > 1:
+                return bool(position[-1] < position[0])
+        return self.sweep_index % 2 == 1
+
+    def _emit(self, complete: bool = True) -> Sweep:
+        data = {k: np.concatenate(v) for k, v in self._chunks.items()}
+        is_reversed = self._is_reversed(data)
+        if self.flip_reversed and is_reversed:
+            data = {k: v[::-1] for k, v in data.items()}
+
+        sweep = Sweep(self.sweep_index, data, is_reversed, complete)
+        self._chunks = {}
+        self._num_buffered = 0
+        self.sweep_index += 1
+
+        LOGGER.debug(
+            f"Sweep {sweep.index} : {sweep.num_frames} frames, reversed={is_reversed}"
+        )
+        for callback in self.callbacks:
+            callback(sweep)
+        return sweep
+
+
+class SweepSplitterCallback(CallbackBase):
+    """Callback that passes the data from a stream to a :class:`SweepSplitter`.
+    Data is taken from events and event pages, and from the HDF files referred to
+    by StreamResource and StreamDatum documents (e.g. from a PandA).
+
+    Stream data from only one detector in the stream is used (the frames of
+    different detectors are collected separately, so cannot be combined into
+    one set of sweeps).
+    """
+
+    def __init__(
+        self,
+        splitter: SweepSplitter,
+        stream_name: str = "primary",
+        detector_name: str | None = None,
+    ):
+        """
+        Args:
+            splitter: splitter to pass the data to
+            stream_name: name of the stream to take data from
+            detector_name: name of the detector to take stream data from (key in
+                the descriptor object_keys). If None, the first detector to send a
+                StreamDatum is used.
+        """
+        super().__init__()
+        self.splitter = splitter
+        self.stream_name = stream_name
+        self.detector_name = detector_name
+        self._detector_name = detector_name
+        self._descriptors: dict[str, dict[str, Any]] = {}
+        self._resources: dict[str, dict[str, Any]] = {}
+        self._readers: dict[str, PandaHdfReader] = {}
+        # columns of data for each descriptor, detector and range of indices,
+        # until all the data keys of the detector are read
+        self._pending: dict[tuple[str, str | None, int, int], dict[str, NDArray]] = {}
+
+    def start(self, doc):
+        self.splitter.reset()
+        self._detector_name = self.detector_name
+        self._descriptors = {}
+        self._resources = {}
+        self._pending = {}
+        self._close_files()
+        return super().start(doc)
+
+    def descriptor(self, doc):
+        if doc.get("name") == self.stream_name:
+            self._descriptors[doc["uid"]] = doc
+        return super().descriptor(doc)
+
+    def event(self, doc):
+        if doc["descriptor"] in self._descriptors:
+            self.splitter.add_frames({k: [v] for k, v in doc["data"].items()})
+        return super().event(doc)
+
+    def event_page(self, doc):
+        if doc["descriptor"] in self._descriptors:
+            self.splitter.add_frames(doc["data"])
+        return super().event_page(doc)
+
+    def stream_resource(self, doc):
+        self._resources[doc["uid"]] = doc
+        return super().stream_resource(doc)
+
+    def stream_datum(self, doc):
+        descriptor = self._descriptors.get(doc["descriptor"])
+        if descriptor is not None:
+            data_key = self._resources[doc["stream_resource"]]["data_key"]
+            detector, detector_keys = self._detector_keys(descriptor, data_key)
+            if self._detector_name is None:
+                self._detector_name = detector
+            if detector == self._detector_name:
+                self._add_stream_datum(doc, data_key, detector, detector_keys)
+        return super().stream_datum(doc)
+
+    def _detector_keys(
+        self, descriptor: dict[str, Any], data_key: str
+    ) -> tuple[str | None, set[str]]:
+        """Name of the detector that a data key belongs to, and the data keys of
+        the detector that have stream resources (all the stream data keys in the
+        descriptor if it has no object_keys)"""
+        resource_keys = {r["data_key"] for r in self._resources.values()}
+        for name, keys in descriptor.get("object_keys", {}).items():
+            if data_key in keys:
+                return name, resource_keys.intersection(keys)
+        return None, resource_keys.intersection(descriptor["data_keys"])
+
+    def _add_stream_datum(
+        self,
+        doc: dict[str, Any],
+        data_key: str,
+        detector: str | None,
+        detector_keys: set[str],
+    ):
+        resource = self._resources[doc["stream_resource"]]
+        start, stop = doc["indices"]["start"], doc["indices"]["stop"]
+        pending_key = (doc["descriptor"], detector, start, stop)
+        columns = self._pending.setdefault(pending_key, {})
+        columns[data_key] = self._read_rows(resource, start, stop)
+        if detector_keys.issubset(columns):
+            self.splitter.add_frames(self._pending.pop(pending_key))
+
+    def stop(self, doc):
+        for (_, detector, start, stop), columns in self._pending.items():
+            LOGGER.warning(
+                f"Frames {start} to {stop} of {detector} not used for sweeps : only "
+                f"received data for {sorted(columns)}"
+            )
+        self._pending = {}
+        self.splitter.flush()
+        self._close_files()
+        return super().stop(doc)
+
+    def _read_rows(self, resource: dict[str, Any], start: int, stop: int) -> NDArray:
+        path = urlparse(resource["uri"]).path
+        if path not in self._readers:
+            self._readers[path] = PandaHdfReader(path)
+        dataset = self._readers[path].dataset(resource["parameters"]["dataset"])
+        return dataset[start:stop]
+
+    def _close_files(self):
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
@@ -0,0 +1,266 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+from .sweep_splitter import Sweep, SweepSplitter
+
+"""
+Live calculation of XAS absorption from blocks of fly scan frames :
+transmission ln(I0/It), fluorescence If/I0 and edge step normalisation.
+The pre-edge and post-edge polynomials are fitted using running sums,
+so the cost of each block depends only on the number of frames in the block,
+not on the total length of the run. The fits are updated with the frames of
+each sweep, and the edge step from the last completed sweep is used until the
+fits for the current sweep cover enough of the pre-edge and post-edge ranges.
+"""
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RunningPolyFit:
+    """Least squares polynomial fit y = sum(c[i] x**i) from running sums of the
+    normal equations. x is divided by scale before calculating the powers, to
+    keep the normal equations well conditioned."""
+
+    def __init__(self, order: int, scale: float = 1.0):
+        if scale <= 0:
+            raise ValueError(f"scale ({scale}) must be > 0")
+        self.order = order
+        self.scale = scale
+        self.reset()
+
+    def reset(self):
+        self._sum_x_powers = np.zeros(2 * self.order + 1)
+        self._sum_y_x_powers = np.zeros(self.order + 1)
+        self.x_min = np.inf
+        self.x_max = -np.inf
+
+    @property
+    def num_points(self) -> int:
+        return int(self._sum_x_powers[0])
+
+    def coverage(self, x_range: tuple[float, float]) -> float:
+        """Fraction of x_range spanned by the points added so far"""
+        if self.num_points == 0:
+            return 0.0
+        low = max(self.x_min, x_range[0])
+        high = min(self.x_max, x_range[1])
+        return max(high - low, 0.0) / (x_range[1] - x_range[0])
+
+    def add(self, x: ArrayLike, y: ArrayLike):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        if x.size == 0:
+            return
+        self.x_min = min(self.x_min, float(x.min()))
+        self.x_max = max(self.x_max, float(x.max()))
+        powers = np.vander(x / self.scale, 2 * self.order + 1, increasing=True)
+        self._sum_x_powers += powers.sum(axis=0)
+        self._sum_y_x_powers += y @ powers[:, : self.order + 1]
+
+    def coefficients(self) -> NDArray | None:
+        """Fitted coefficients of powers of x (lowest order first), None if there
+        are not enough points"""
+        if self.num_points <= self.order:
+            return None
+        indices = np.add.outer(np.arange(self.order + 1), np.arange(self.order + 1))
+        normal_matrix = self._sum_x_powers[indices]
+        scaled = np.linalg.lstsq(normal_matrix, self._sum_y_x_powers, rcond=None)[0]
+        return scaled / self.scale ** np.arange(self.order + 1)
+
+
+@dataclass
+class EdgeStep:
+    """Pre-edge and post-edge polynomials (coefficients of powers of E-E0, lowest
+    order first) and the edge step at E0"""
+
+    pre_edge: NDArray
+    post_edge: NDArray
+
+    @property
+    def step(self) -> float:
+        return float(self.post_edge[0] - self.pre_edge[0])
+
+    def normalise(self, relative_energy: NDArray, mu: NDArray) -> NDArray:
+        pre_edge = np.polynomial.polynomial.polyval(relative_energy, self.pre_edge)
+        return (mu - pre_edge) / self.step
+
+
+@dataclass
+class NormalisedFrames:
+    """Absorption calculated for a block of frames from a sweep"""
+
+    sweep_index: int
+    energy: NDArray
+    data: dict[str, NDArray] = field(default_factory=dict)
+
+
+class XasNormaliser:
+    def __init__(
+        self,
+        e0: float,
+        energy_key: str = "energy",
+        i0_key: str = "I0",
+        it_key: str | None = "It",
+        if_key: str | None = None,
+        energy_function: Callable[[NDArray], NDArray] | None = None,
+        pre_edge_range: tuple[float, float] = (-150.0, -30.0),
+        post_edge_range: tuple[float, float] = (50.0, 300.0),
+        pre_edge_order: int = 1,
+        post_edge_order: int = 2,
+        min_fit_coverage: float = 0.8,
+    ):
+        """
+        Args:
+            e0: edge energy (eV)
+            energy_key: data key of the energy (or of the position, if
+                energy_function is set)
+            i0_key: data key of incident intensity
+            it_key: data key of transmitted intensity (None if not measured)
+            if_key: data key of fluorescence intensity (None if not measured)
+            energy_function: function to convert the energy_key values to energy
+                (e.g. :meth:`EnergyRebinner.counts_to_energy`)
+            pre_edge_range: energy range of pre-edge fit, relative to e0
+            post_edge_range: energy range of post-edge fit, relative to e0
+            pre_edge_order: order of pre-edge polynomial
+            post_edge_order: order of post-edge polynomial
+            min_fit_coverage: fraction of the pre-edge and post-edge ranges that
+                the frames of the current sweep must cover before its fits are
+                used (the edge step from the last sweep is used until then)
+        """
+        self.e0 = e0
+        self.energy_key = energy_key
+        self.i0_key = i0_key
+        self.it_key = it_key
+        self.if_key = if_key
+        self.energy_function = energy_function
+        self.pre_edge_range = pre_edge_range
+        self.post_edge_range = post_edge_range
+        self.min_fit_coverage = min_fit_coverage
+
+        self.signals = [
+            name
+            for name, key in [("mu_trans", it_key), ("mu_fluo", if_key)]
+            if key is not None
+        ]
+        # scale energies by the size of each fit range
+        pre_edge_scale = max(abs(e) for e in pre_edge_range)
+        post_edge_scale = max(abs(e) for e in post_edge_range)
+        self._fits = {
+            name: (
+                RunningPolyFit(pre_edge_order, pre_edge_scale),
+                RunningPolyFit(post_edge_order, post_edge_scale),
+            )
+            for name in self.signals
+        }
+        # edge step from last completed sweep for each signal
+        self.edge_steps: dict[str, EdgeStep] = {}
+        self.callbacks: list[Callable[[NormalisedFrames], None]] = []
+        self.sweep_callbacks: list[Callable[[int, dict[str, EdgeStep]], None]] = []
+
+    def reset(self):
+        for pre_edge, post_edge in self._fits.values():
+            pre_edge.reset()
+            post_edge.reset()
+        self.edge_steps = {}
+
+    def absorption(self, data: dict[str, ArrayLike]) -> dict[str, NDArray]:
+        """Transmission and/or fluorescence absorption for a block of frames"""
+        i0 = np.asarray(data[self.i0_key], dtype=float)
+        mu = {}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.it_key is not None:
+                it = np.asarray(data[self.it_key], dtype=float)
+                mu["mu_trans"] = np.log(i0 / it)
+            if self.if_key is not None:
+                mu["mu_fluo"] = np.asarray(data[self.if_key], dtype=float) / i0
+        return mu
+
+    def fitted_edge_step(self, signal: str) -> EdgeStep | None:
+        """Edge step from the running fits of the current sweep (None if the fits
+        do not have enough points)"""
+        pre_edge, post_edge = self._fits[signal]
+        pre_coeffs, post_coeffs = pre_edge.coefficients(), post_edge.coefficients()
+        if pre_coeffs is not None and post_coeffs is not None:
+            return EdgeStep(pre_coeffs, post_coeffs)
+        return None
+
+    def current_edge_step(self, signal: str) -> EdgeStep | None:
+        """Edge step from the running fits of the current sweep, or from the last
+        completed sweep if the current fits do not cover enough of the pre-edge and
+        post-edge ranges yet"""
+        pre_edge, post_edge = self._fits[signal]
+        if (
+            pre_edge.coverage(self.pre_edge_range) >= self.min_fit_coverage
+            and post_edge.coverage(self.post_edge_range) >= self.min_fit_coverage
+        ):
+            edge_step = self.fitted_edge_step(signal)
+            if edge_step is not None:
+                return edge_step
+        return self.edge_steps.get(signal)
+
+    def add_frames(
+        self, data: dict[str, ArrayLike], sweep_index: int = 0
+    ) -> NormalisedFrames:
+        """Calculate absorption for a block of frames, update the pre-edge and
+        post-edge fits and normalise by the edge step"""
+        energy = np.asarray(data[self.energy_key], dtype=float)
+        if self.energy_function is not None:
+            energy = np.asarray(self.energy_function(energy))
+        relative_energy = energy - self.e0
+
+        in_pre_edge = (relative_energy >= self.pre_edge_range[0]) & (
+            relative_energy <= self.pre_edge_range[1]
+        )
+        in_post_edge = (relative_energy >= self.post_edge_range[0]) & (
+            relative_energy <= self.post_edge_range[1]
+        )
+
+        result = NormalisedFrames(sweep_index, energy)
+        for signal, mu in self.absorption(data).items():
+            pre_edge, post_edge = self._fits[signal]
+            pre_edge.add(relative_energy[in_pre_edge], mu[in_pre_edge])
+            post_edge.add(relative_energy[in_post_edge], mu[in_post_edge])
+
+            result.data[signal] = mu
+            edge_step = self.current_edge_step(signal)
+            if edge_step is not None and edge_step.step != 0:
+                result.data[f"{signal}_norm"] = edge_step.normalise(relative_energy, mu)
+
+        for callback in self.callbacks:
+            callback(result)
+        return result
+
+    def finish_sweep(self, sweep_index: int = 0) -> dict[str, EdgeStep]:
+        """Store the edge steps fitted to the current sweep and reset the fits
+        for the next sweep"""
+        for signal, (pre_edge, post_edge) in self._fits.items():
+            edge_step = self.current_edge_step(signal)
+            if edge_step is not None:
+                self.edge_steps[signal] = edge_step
+                LOGGER.debug(
+                    f"Sweep {sweep_index} {signal} edge step : {edge_step.step:.4g}"
+                )
+            pre_edge.reset()
+            post_edge.reset()
+
+        for callback in self.sweep_callbacks:
+            callback(sweep_index, self.edge_steps)
+        return self.edge_steps
+
+    def attach(self, splitter: SweepSplitter):
+        """Normalise the frames from a :class:`SweepSplitter` as they arrive,
+        updating the edge step fits after each sweep"""
+        splitter.frame_callbacks.append(self._add_sweep_frames)
+        splitter.callbacks.append(self._sweep_complete)
+
+    def _add_sweep_frames(self, sweep_index: int, data: dict[str, NDArray]):
+        self.add_frames(data, sweep_index)
+
+    def _sweep_complete(self, sweep: Sweep):
+        self.finish_sweep(sweep.index)
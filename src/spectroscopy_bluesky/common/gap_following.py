@@ -0,0 +1,123 @@
+from collections.abc import Callable, Sequence
+from typing import Any
+
+import bluesky.plan_stubs as bps
+import numpy as np
+from bluesky.utils import MsgGenerator, short_uid
+from numpy.typing import ArrayLike, NDArray
+
+from spectroscopy_bluesky.common.adaptive_flush import (
+    AdaptiveFlushPolicy,
+    collect_while_completing_adaptive,
+)
+
+"""
+Undulator gap following for fly scans : while the monochromator is moving, the
+Bragg angle is read periodically and the undulator gap is moved to the value
+for that angle (e.g. from a cached lookup table curve, see
+:meth:`spectroscopy_bluesky.common.lookup_tables.LookupTableCache.curve`).
+The insertion device is not part of the motion controller coordinate system used
+for the Bragg trajectory, so the gap follows the measured Bragg position rather
+than being a second trajectory axis.
+"""
+
+
+class GapFollower:
+    def __init__(
+        self,
+        gap_device: Any,
+        bragg_motor: Any,
+        gap_function: Callable[[ArrayLike], ArrayLike],
+        deadband: float = 0.01,
+        update_period: float = 0.2,
+        angle_limits: tuple[float, float] | None = None,
+    ):
+        """
+        Args:
+            gap_device: undulator gap (Movable)
+            bragg_motor: motor whose position is used to calculate the gap
+                (Bragg angle)
+            gap_function: gap for a Bragg angle (or array of Bragg angles)
+            deadband: only move the gap if the new value differs from the last
+                value set by more than this
+            update_period: time between each gap update (seconds)
+            angle_limits: range of Bragg angles covered by gap_function (e.g. the
+                range of the lookup table). Angles outside of the range are
+                clipped to it, so the gap is not moved to an extrapolated value.
+        """
+        self.gap_device = gap_device
+        self.bragg_motor = bragg_motor
+        self.gap_function = gap_function
+        self.angle_limits = angle_limits
+        self.deadband = deadband
+        self.update_period = update_period
+        self.group = short_uid(label="gap_following")
+        self.last_gap: float | None = None
+        self.num_moves = 0
+        self._status = None
+
+    def gap_profile(self, bragg_angles: ArrayLike) -> NDArray:
+        """Gap values for a Bragg angle or array of Bragg angles (e.g. the angles
+        of an energy scan, for recording with the scan parameters). Angles are
+        clipped to the angle limits."""
+        angles = np.asarray(bragg_angles, dtype=float)
+        if self.angle_limits is not None:
+            angles = np.clip(angles, *self.angle_limits)
+        return np.asarray(self.gap_function(angles), dtype=float)
+
+    def update(self) -> MsgGenerator:
+        """Move the gap to the value for the current Bragg angle, without waiting
+        for the move to finish. Nothing is done if the previous gap move has not
+        finished, or the gap value has changed by less than the deadband."""
+        if self._status is not None and not self._status.done:
+            return
+        angle = yield from bps.rd(self.bragg_motor)
+        gap = float(self.gap_profile(angle))
+        if not np.isfinite(gap):
+            return
+        if self.last_gap is not None and abs(gap - self.last_gap) <= self.deadband:
+            return
+        self._status = yield from bps.abs_set(self.gap_device, gap, group=self.group)
+        self.last_gap = gap
+        self.num_moves += 1
+
+    def wait(self) -> MsgGenerator:
+        """Wait for the last gap move to finish"""
+        yield from bps.wait(group=self.group)
+
+    def move_to_start(self) -> MsgGenerator:
+        """Move the gap to the value for the current Bragg angle and wait for it
+        to get there (e.g. before starting the Bragg trajectory)"""
+        self.last_gap = None
+        yield from self.update()
+        yield from self.wait()
+
+
+def collect_while_following(
+    flyers: Sequence[Any],
+    dets: Sequence[Any],
+    follower: GapFollower,
+    stream_name: str | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
+) -> MsgGenerator:
+    """Same as :func:`collect_while_completing_adaptive`, but the undulator gap is
+    updated to follow the Bragg angle every follower.update_period seconds
+    between the collects.
+
+    Args:
+        flyers: flyers to complete
+        dets: detectors to collect from
+        follower: gap follower to update
+        stream_name: name of stream to collect
+        flush_policy: policy to use to calculate time between collects.
+            Default policy is used if None.
+    """
+    yield from collect_while_completing_adaptive(
+        flyers,
+        dets,
+        stream_name,
+        flush_policy,
+        update=follower.update,
+        update_period=follower.update_period,
+    )
+    yield from follower.wait()
@@ -0,0 +1,175 @@
+import logging
+import os
+import zipfile
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike, NDArray
+from scipy.interpolate import CubicSpline
+
+"""
+Loading and caching of undulator gap lookup tables : Ascii files with two
+columns of Bragg angle and undulator gap values, e.g. Si111_harmonic7.txt.
+"""
+
+# Names of the columns in the ID gap lookup table files
+id_gap_lookup_table_column_names = ["Bragg [deg]", "ID gap [mm]"]
+
+LOGGER = logging.getLogger(__name__)
+
+
+def load_ascii_lookuptable(filename: str | Path, lines_to_skip: int = 2) -> list:
+    """Load 2-column x, y Ascii data from file and convert to numbers
+    (optionally skipping the first few lines)
+
+    Args:
+        filename: name of Ascii lookup table file
+        lines_to_skip: how many lines to skip before storing the data
+
+    Returns:
+        list containing the x, y value on each line [ (x1,y1), (x2,y2) ...]
+    """
+    LOGGER.info(f"Loading ascii lookup table from {filename}")
+    dataframe = pd.read_csv(
+        filename,
+        sep=" ",
+        skiprows=lines_to_skip,
+        names=id_gap_lookup_table_column_names,
+    )
+    return [(v[0], v[1]) for v in dataframe.values]
+
+
+def interpolated_curve(values: ArrayLike) -> CubicSpline:
+    """Cubic spline through lookup table values, giving the undulator gap for
+    Bragg angles. The spline extrapolates outside of the range of the table.
+
+    Args:
+        values: array of [Bragg angle, undulator gap] values
+    """
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(values[:, 0], kind="stable")
+    return CubicSpline(values[order, 0], values[order, 1])
+
+
+def sidecar_filename(filename: str | Path) -> Path:
+    """Name of binary (.npz) file used to store the values from an Ascii
+    lookup table file (i.e. filename with .npz appended)"""
+    path = Path(filename)
+    return path.with_name(path.name + ".npz")
+
+
+class LookupTableCache:
+    def __init__(self, use_sidecar: bool = False):
+        """Process-wide cache of lookup table values and undulator gap curves.
+        Entries are keyed by the file path and store the modification time of the
+        file, so tables are reloaded when the file changes.
+
+        If use_sidecar is True, the values are also saved to a binary .npz file
+        next to the Ascii file (see :func:`sidecar_filename`); this is loaded
+        instead of parsing the Ascii file, as long as the Ascii file has not been
+        modified since the .npz file was written.
+
+        The cached value arrays are shared by all callers, so they are read-only.
+
+        Args:
+            use_sidecar: read and write .npz sidecar files
+        """
+        self.use_sidecar = use_sidecar
+        self.hits = 0
+        self.misses = 0
+        # path -> (modification time, values)
+        self._values: dict[str, tuple[int, NDArray]] = {}
+        # (path, curve function, kwargs) -> (modification time, curve)
+        self._curves: dict[tuple, tuple[int, Any]] = {}
+
+    def clear(self):
+        self._values = {}
+        self._curves = {}
+        self.hits = 0
+        self.misses = 0
+
+    def values(self, filename: str | Path) -> NDArray:
+        """Read-only array of [Bragg angle, undulator gap] values from a lookup
+        table file"""
+        path = os.path.abspath(filename)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._values.get(path)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        values = self._load_sidecar(path, mtime) if self.use_sidecar else None
+        if values is None:
+            values = np.array(load_ascii_lookuptable(path), dtype=float)
+            if self.use_sidecar:
+                self._save_sidecar(path, mtime, values)
+        values.flags.writeable = False
+        self._values[path] = (mtime, values)
+        return values
+
+    def bragg_range(self, filename: str | Path) -> tuple[float, float]:
+        """Smallest and largest Bragg angle in a lookup table file"""
+        bragg_angles = self.values(filename)[:, 0]
+        return float(bragg_angles.min()), float(bragg_angles.max())
+
+    def curve(
+        self,
+        filename: str | Path,
+        curve_function: Callable[..., Any] = interpolated_curve,
+        **kwargs,
+    ):
+        """Undulator gap curve made from the values in a lookup table file.
+        (Curves are not cached if the kwargs can not be hashed, e.g. arrays)
+
+        Args:
+            filename: name of Ascii lookup table file
+            curve_function: function that makes the curve from the array of
+                values (and kwargs)
+            kwargs: passed to curve_function
+        """
+        path = os.path.abspath(filename)
+        values = self.values(path)
+        mtime = self._values[path][0]
+        key = (path, curve_function, tuple(sorted(kwargs.items())))
+        try:
+            cached = self._curves.get(key)
+        except TypeError:
+            return curve_function(values, **kwargs)
+
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        curve = curve_function(values, **kwargs)
+        self._curves[key] = (mtime, curve)
+        return curve
+
+    @staticmethod
+    def _load_sidecar(path: str, mtime: int) -> NDArray | None:
+        sidecar = sidecar_filename(path)
+        if not sidecar.exists():
+            return None
+        try:
+            with np.load(sidecar) as data:
+                if int(data["mtime"]) != mtime:
+                    return None
+                return data["values"]
+        except (ValueError, OSError, KeyError, zipfile.BadZipFile) as e:
+            LOGGER.warning(
+                "Could not load lookup table values from %s : %s", sidecar, e
+            )
+            return None
+
+    @staticmethod
+    def _save_sidecar(path: str, mtime: int, values: NDArray):
+        sidecar = sidecar_filename(path)
+        try:
+            with open(sidecar, "wb") as f:
+                np.savez(f, values=values, mtime=np.int64(mtime))
+        except OSError as e:
+            LOGGER.warning("Could not save lookup table values to %s : %s", sidecar, e)
+
+
+lookup_table_cache = LookupTableCache()
@@ -0,0 +1,272 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from collections.abc import Generator
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from bluesky.utils import Msg, MsgGenerator, make_decorator
+
+"""
+RunEngine preprocessor to record how long each message in a plan takes to be
+processed (e.g. how long 'prepare', 'kickoff', 'wait' and 'collect' take for each
+device). A timing report is written at the end of each run.
+
+Usage :
+    profiler = MessageProfiler(report_file="/tmp/timing.json")
+    RE.preprocessors.append(profiler)
+
+or for a single plan :
+    RE(profile_messages_wrapper(plan, profiler))
+
+Time spent in a 'wait' message is also attributed to each of the messages in the
+group being waited for (e.g. a 'prepare' with wait=True), under the command name
+'wait:<command>'.
+
+Each message is also given a sweep number, so the timings of each sweep of a
+multi-sweep fly scan can be separated. For plans that kickoff and complete the flyers
+once for all the sweeps (e.g. seq_table_scan, fly_sweep_continuous) set
+frames_per_sweep, and subscribe the profiler to the documents so it can count the
+frames collected :
+    profiler = MessageProfiler(frames_per_sweep=num_points)
+    RE.preprocessors.append(profiler)
+    RE.subscribe(profiler.document)
+
+The sweep number is then the number of frames collected so far divided by
+frames_per_sweep. Otherwise the sweep number is incremented each time waiting for a
+'complete' finishes (for plans that kickoff and complete each sweep, e.g. fly_sweep).
+"""
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class MessageTiming:
+    """Time taken by the RunEngine to process a message"""
+
+    command: str
+    device: str | None
+    sweep: int
+    start_time: float
+    duration: float
+
+
+@dataclass
+class TimingSummary:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+
+class MessageProfiler:
+    def __init__(
+        self,
+        report_file: str | None = None,
+        records_file: str | None = None,
+        log_report: bool = True,
+        frames_per_sweep: int | None = None,
+    ):
+        """
+        Args:
+            report_file: file to write summary of timings to (json) at end of run
+            records_file: file to write the timing of every message to
+                (json, one line per message) at end of run
+            log_report: log the summary at the end of each run
+            frames_per_sweep: number of frames collected in each sweep. If set, the
+                sweep number is found from the number of frames collected (counted
+                by :meth:`document`), otherwise from the 'complete' messages.
+        """
+        self.report_file = report_file
+        self.records_file = records_file
+        self.log_report = log_report
+        self.frames_per_sweep = frames_per_sweep
+        self.records: list[MessageTiming] = []
+        self._sweep = 0
+        self._groups: dict[str, list[Msg]] = defaultdict(list)
+        # number of frames collected for each event descriptor
+        self._frames: dict[str, int] = defaultdict(int)
+
+    def __call__(self, plan: MsgGenerator) -> MsgGenerator:
+        """Wrap a plan, so profiler can be used as a RunEngine preprocessor"""
+        return profile_messages_wrapper(plan, self)
+
+    def reset(self):
+        self.records = []
+        self._sweep = 0
+        self._groups = defaultdict(list)
+
+    def document(self, name: str, doc: dict[str, Any]):
+        """Document callback, to count the frames collected in each stream
+        (for finding the sweep number from frames_per_sweep)"""
+        if name == "start":
+            self._frames = defaultdict(int)
+        elif name == "event":
+            self._update_frames(doc["descriptor"], doc["seq_num"])
+        elif name == "event_page" and len(doc["seq_num"]) > 0:
+            self._update_frames(doc["descriptor"], max(doc["seq_num"]))
+        elif name == "stream_datum":
+            # seq_nums stop is exclusive
+            self._update_frames(doc["descriptor"], doc["seq_nums"]["stop"] - 1)
+
+    def _update_frames(self, descriptor: str, num_frames: int):
+        self._frames[descriptor] = max(self._frames[descriptor], num_frames)
+
+    @property
+    def frames_collected(self) -> int:
+        """Number of frames collected so far (in the stream with the most frames)"""
+        return max(self._frames.values(), default=0)
+
+    @property
+    def sweep(self) -> int:
+        """Sweep number for the next message"""
+        if self.frames_per_sweep:
+            return self.frames_collected // self.frames_per_sweep
+        return self._sweep
+
+    @staticmethod
+    def _device_name(msg: Msg) -> str | None:
+        if msg.obj is None:
+            return None
+        return getattr(msg.obj, "name", None) or repr(msg.obj)
+
+    def record(
+        self,
+        msg: Msg,
+        start_time: float,
+        duration: float,
+        response: Any,
+        sweep: int | None = None,
+    ):
+        """Record the time taken to process a message
+
+        Args:
+            msg: the message
+            start_time: time the message was sent to the RunEngine
+            duration: time taken to process the message
+            response: response from the RunEngine
+            sweep: sweep number when the message was sent (current sweep if None)
+        """
+        if msg.command == "open_run":
+            self.reset()
+            sweep = 0
+
+        if sweep is None:
+            sweep = self.sweep
+        self.records.append(
+            MessageTiming(
+                msg.command, self._device_name(msg), sweep, start_time, duration
+            )
+        )
+
+        group = msg.kwargs.get("group")
+        if msg.command == "wait":
+            # wait group can also be passed as a positional argument
+            if group is None and msg.args:
+                group = msg.args[0]
+            # attribute the wait time to each of the messages in the group
+            group_msgs = self._groups.get(group, [])
+            for group_msg in group_msgs:
+                self.records.append(
+                    MessageTiming(
+                        "wait:" + group_msg.command,
+                        self._device_name(group_msg),
+                        sweep,
+                        start_time,
+                        duration,
+                    )
+                )
+            # wait returns False if it timed out before the group was done
+            if response is not False:
+                self._groups.pop(group, None)
+                if any(m.command == "complete" for m in group_msgs):
+                    self._sweep += 1
+        elif group is not None:
+            self._groups[group].append(msg)
+
+        if msg.command == "close_run":
+            self.write_report()
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """Count, total and max time of the messages, for each command,
+        device and sweep"""
+        by_command: dict[str, TimingSummary] = defaultdict(TimingSummary)
+        by_device: dict[str, TimingSummary] = defaultdict(TimingSummary)
+        by_sweep: dict[str, TimingSummary] = defaultdict(TimingSummary)
+        for rec in self.records:
+            by_command[rec.command].add(rec.duration)
+            # don't double count the wait times in the device and sweep totals
+            if rec.command.startswith("wait:"):
+                continue
+            by_device[f"{rec.device}:{rec.command}"].add(rec.duration)
+            by_sweep[str(rec.sweep)].add(rec.duration)
+
+        def as_dicts(timings: dict[str, TimingSummary]):
+            return {k: asdict(v) for k, v in timings.items()}
+
+        return {
+            "command": as_dicts(by_command),
+            "device": as_dicts(by_device),
+            "sweep": as_dicts(by_sweep),
+        }
+
+    def report(self) -> str:
+        """Table of total time for each command, slowest first"""
+        by_command = self.summary()["command"]
+        lines = [f"{'command':<24}{'count':>8}{'total (s)':>12}{'max (s)':>12}"]
+        for command, t in sorted(by_command.items(), key=lambda v: -v[1]["total"]):
+            lines.append(
+                f"{command:<24}{t['count']:>8}{t['total']:>12.4f}{t['max']:>12.4f}"
+            )
+        return "\n".join(lines)
+
+    def write_report(self):
+        if self.log_report:
+            LOGGER.info(f"Message timings :\n{self.report()}")
+
+        if self.report_file is not None:
+            with open(self.report_file, "w") as f:
+                json.dump(self.summary(), f, indent=2)
+
+        if self.records_file is not None:
+            with open(self.records_file, "w") as f:
+                for rec in self.records:
+                    f.write(json.dumps(asdict(rec)) + "\n")
+
+
+def profile_messages_wrapper(
+    plan: MsgGenerator, profiler: MessageProfiler
+) -> Generator[Msg, Any, Any]:
+    """Pass through the messages of a plan, recording the time taken by the
+    RunEngine to process each one (i.e. time from yielding message to
+    receiving the response)"""
+    response = None
+    exception = None
+    while True:
+        try:
+            if exception is not None:
+                msg = plan.throw(exception)
+            else:
+                msg = plan.send(response)
+        except StopIteration as e:
+            return e.value
+
+        # sweep number before any frames are collected by the message
+        sweep = profiler.sweep
+        start_time = time.time()
+        start = time.perf_counter()
+        try:
+            response = yield msg
+            exception = None
+        except BaseException as e:
+            response = None
+            exception = e
+        profiler.record(msg, start_time, time.perf_counter() - start, response, sweep)
+
+
+profile_messages_decorator = make_decorator(profile_messages_wrapper)
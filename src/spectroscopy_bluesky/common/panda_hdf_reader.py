@@ -0,0 +1,179 @@
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import h5py
+import numpy as np
+from numpy.typing import NDArray
+
+"""
+Reader for the HDF5 files written by the PandA (one 1-d dataset per captured
+value). Files are opened in SWMR mode so they can be read while the PandA is
+still writing; :meth:`PandaHdfReader.read_new_rows` returns only the rows written
+since the last read. Datasets can be read in blocks of rows using
+:meth:`PandaHdfReader.iter_chunks`, or memory-mapped if they are stored
+contiguously, so large files can be processed without loading them into memory.
+"""
+
+# Number of rows to read at a time for datasets that are not chunked
+DEFAULT_CHUNK_ROWS = 65536
+
+
+class PandaHdfReader:
+    def __init__(
+        self,
+        filename: str | Path,
+        dataset_names: list[str] | None = None,
+        swmr: bool = True,
+    ):
+        """
+        Args:
+            filename: name of HDF5 file
+            dataset_names: names of datasets to read. If None, all the 1-d
+                datasets in the top level group are read.
+            swmr: open the file in SWMR read mode
+        """
+        self.filename = Path(filename)
+        self.swmr = swmr
+        self._dataset_names = dataset_names
+        self._file: h5py.File | None = None
+        # index of next row to be returned by read_new_rows
+        self.position = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        if self._file is None:
+            self._file = h5py.File(self.filename, "r", swmr=self.swmr)
+        if self._dataset_names is None:
+            self._dataset_names = [
+                name
+                for name, item in self._file.items()
+                if isinstance(item, h5py.Dataset) and item.ndim == 1
+            ]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def file(self) -> h5py.File:
+        if self._file is None:
+            self.open()
+        assert self._file is not None
+        return self._file
+
+    @property
+    def dataset_names(self) -> list[str]:
+        if self._dataset_names is None:
+            self.open()
+        assert self._dataset_names is not None
+        return self._dataset_names
+
+    def dataset(self, name: str) -> h5py.Dataset:
+        """Dataset, refreshed to pick up rows written since it was last read"""
+        dataset = self.file[name]
+        if self.swmr:
+            dataset.refresh()
+        return dataset
+
+    def num_rows(self) -> int:
+        """Number of complete rows (i.e. rows written to all the datasets)"""
+        if not self.dataset_names:
+            return 0
+        return min(len(self.dataset(name)) for name in self.dataset_names)
+
+    def read_rows(self, start: int, stop: int) -> dict[str, NDArray]:
+        """Read rows from each dataset"""
+        return {name: self.dataset(name)[start:stop] for name in self.dataset_names}
+
+    def read_new_rows(self, max_rows: int | None = None) -> dict[str, NDArray]:
+        """Read the rows written since the last call (up to max_rows rows)"""
+        stop = self.num_rows()
+        if max_rows is not None:
+            stop = min(stop, self.position + max_rows)
+        rows = self.read_rows(self.position, stop)
+        self.position = max(self.position, stop)
+        return rows
+
+    def tail(
+        self, poll_interval: float = 0.1, timeout: float = 5.0
+    ) -> Iterator[dict[str, NDArray]]:
+        """Yield new rows as they are written, until no new rows have been
+        written for the timeout period.
+
+        Args:
+            poll_interval: time between checking for new rows (seconds)
+            timeout: stop after this time without new rows (seconds)
+        """
+        last_data_time = time.monotonic()
+        while time.monotonic() - last_data_time < timeout:
+            rows = self.read_new_rows()
+            if len(next(iter(rows.values()), [])) > 0:
+                last_data_time = time.monotonic()
+                yield rows
+            else:
+                time.sleep(poll_interval)
+
+    def chunk_rows(self, name: str) -> int:
+        """Number of rows in each HDF5 chunk of a dataset
+        (DEFAULT_CHUNK_ROWS if the dataset is not chunked)"""
+        chunks = self.dataset(name).chunks
+        return chunks[0] if chunks else DEFAULT_CHUNK_ROWS
+
+    def iter_chunks(
+        self, chunk_size: int | None = None, start: int = 0, stop: int | None = None
+    ) -> Iterator[tuple[int, dict[str, NDArray]]]:
+        """Iterate over blocks of rows, without reading the whole file into memory.
+
+        Args:
+            chunk_size: number of rows in each block. Default is the HDF5 chunk
+                size of the first dataset, so each block reads whole chunks.
+            start: first row to read
+            stop: row after last row to read (default = number of rows in file)
+
+        Yields:
+            tuple: (index of first row of the block, rows of each dataset)
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_rows(self.dataset_names[0])
+        if stop is None:
+            stop = self.num_rows()
+        for block_start in range(start, stop, chunk_size):
+            block_stop = min(block_start + chunk_size, stop)
+            yield block_start, self.read_rows(block_start, block_stop)
+
+    def memmap(self, name: str) -> np.memmap:
+        """Memory map a contiguous, uncompressed dataset (read only)
+
+        Raises:
+            ValueError: if dataset is chunked or compressed
+        """
+        dataset = self.dataset(name)
+        offset = dataset.id.get_offset()
+        if dataset.chunks is not None or dataset.compression or offset is None:
+            raise ValueError(
+                f"Dataset {name} in {self.filename} is not stored contiguously "
+                "so cannot be memory mapped"
+            )
+        return np.memmap(
+            self.filename,
+            dtype=dataset.dtype,
+            mode="r",
+            shape=dataset.shape,
+            offset=offset,
+        )
+
+    def array(self, name: str) -> np.memmap | h5py.Dataset:
+        """Memory map of a dataset if possible, otherwise the h5py dataset
+        (which reads rows from the file when it is sliced)"""
+        try:
+            return self.memmap(name)
+        except ValueError:
+            return self.dataset(name)
@@ -0,0 +1,167 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from ophyd_async.core import Device, SignalR, SignalW, Table
+
+"""
+Write-through cache for PandA block signals (PCOMP, SEQ, SRGATE etc).
+A write is only sent to the PandA if the new value is different from the current
+one. This means that repeatedly preparing a block with the same settings
+(e.g. for each sweep of a multi-sweep scan, or for back-to-back scans) does not
+rewrite values such as large sequence tables.
+
+By default the cached value of each signal is refreshed by reading it back from
+the PandA before comparing (all the signals of a block are read concurrently),
+so changes made outside the cache (IOC or PandA restart, other clients, loading
+saved settings) are always picked up. With verify=False, only the values
+written through the cache are used for the comparison, and
+:meth:`PandaWriteCache.invalidate` needs to be called after anything else
+changes the PandA settings.
+"""
+
+
+@dataclass
+class CacheStats:
+    """Number of writes skipped (hits) and sent (misses) for one PandA block"""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.total if self.total > 0 else 0.0
+
+
+def values_equal(value1: Any, value2: Any) -> bool:
+    """Compare two signal values, handling numpy arrays and Tables (which are
+    compared column by column). Values that can not be compared are treated as
+    not equal, so they are written."""
+    if isinstance(value1, np.ndarray) or isinstance(value2, np.ndarray):
+        return np.array_equal(value1, value2)
+    if isinstance(value1, Table) or isinstance(value2, Table):
+        return type(value1) is type(value2) and all(
+            values_equal(getattr(value1, field), getattr(value2, field))
+            for field in type(value1).model_fields
+        )
+    try:
+        return bool(value1 == value2)
+    except (ValueError, TypeError):
+        return False
+
+
+class PandaWriteCache:
+    def __init__(self, enabled: bool = True, verify: bool = True):
+        """
+        Args:
+            enabled: if False, every value is written
+            verify: read the current value of each signal before comparing
+        """
+        self.enabled = enabled
+        self.verify = verify
+        self._last_written: dict[SignalW, Any] = {}
+        # hits and misses for each block, keyed by the block name
+        self.stats: dict[str, CacheStats] = {}
+
+    @staticmethod
+    def _block_name(signal: SignalW) -> str:
+        return signal.parent.name if signal.parent is not None else signal.name
+
+    async def set(self, signal: SignalW, value: Any) -> bool:
+        """Set signal to a value, unless the same value was the last one written.
+
+        Args:
+            signal: signal to be set
+            value: value to set
+
+        Returns:
+            True if the value was written, False if it was unchanged
+        """
+        stats = self.stats.setdefault(self._block_name(signal), CacheStats())
+        if self.enabled and self.verify:
+            await self.refresh(signal)
+        if (
+            self.enabled
+            and signal in self._last_written
+            and values_equal(self._last_written[signal], value)
+        ):
+            stats.hits += 1
+            return False
+
+        stats.misses += 1
+        # remove the old value first, in case the set fails
+        self._last_written.pop(signal, None)
+        await signal.set(value)
+        self._last_written[signal] = value
+        return True
+
+    async def refresh(self, signal: SignalW):
+        """Replace the cached value of a signal with its current value
+        (signals that cannot be read are removed from the cache, so they are
+        always written)"""
+        if isinstance(signal, SignalR):
+            self._last_written[signal] = await signal.get_value()
+        else:
+            self._last_written.pop(signal, None)
+
+    async def set_all(self, values: dict[SignalW, Any]) -> int:
+        """Set several signals concurrently (see :meth:`set`)
+
+        Returns:
+            number of signals that were written
+        """
+        written = await asyncio.gather(
+            *[self.set(signal, value) for signal, value in values.items()]
+        )
+        return sum(written)
+
+    def invalidate(self, device: Device | None = None):
+        """Forget the cached values for all signals of a device (and its children),
+        so the next write to each signal is always sent.
+
+        Args:
+            device: device to be invalidated. All values are removed if None.
+        """
+        if device is None:
+            self._last_written.clear()
+            return
+
+        def is_child(signal: Device) -> bool:
+            parent = signal
+            while parent is not None:
+                if parent is device:
+                    return True
+                parent = parent.parent
+            return False
+
+        for signal in [s for s in self._last_written if is_child(s)]:
+            del self._last_written[signal]
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of writes skipped across all blocks"""
+        hits = sum(s.hits for s in self.stats.values())
+        total = sum(s.total for s in self.stats.values())
+        return hits / total if total > 0 else 0.0
+
+    def reset_stats(self):
+        self.stats = {}
+
+    def report(self) -> str:
+        """Summary of the cache hits and misses for each block"""
+        lines = [f"PandA write cache : hit rate {self.hit_rate:.1%}"]
+        lines.extend(
+            f"  {name} : {s.hits} skipped, {s.misses} written "
+            f"(hit rate {s.hit_rate:.1%})"
+            for name, s in self.stats.items()
+        )
+        return "\n".join(lines)
+
+
+panda_write_cache = PandaWriteCache()
+""" Cache shared by the PandA trigger logic in the plans """
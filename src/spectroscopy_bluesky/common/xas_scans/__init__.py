@@ -1,6 +1,6 @@
 ## XasScanParameters should be imported first to avoid circular dependency
 # (XasScanPointGenerator depends on XasScanParameters)
 from .xas_scan_parameters import XasScanParameters
-from .xas_scan_point_generator import XasScanPointGenerator
+from .xas_scan_point_generator import XasScanPointGenerator, xas_energy_grid
 
-__all__ = ["XasScanParameters", "XasScanPointGenerator"]
+__all__ = ["XasScanParameters", "XasScanPointGenerator", "xas_energy_grid"]
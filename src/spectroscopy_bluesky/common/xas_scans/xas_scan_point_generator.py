@@ -226,6 +226,23 @@ class XasScanPointGenerator:
         return self.params.exafsTimeType.lower() == "constant time"
 
 
+def xas_energy_grid(element: str, edge: str) -> NDArray:
+    """Energy grid (eV) from :class:`XasScanPointGenerator` for an element and edge,
+    using default scan parameters
+
+    Args:
+        element: element name (Fe, Mn etc)
+        edge: edge name (K, L1 etc)
+
+    Returns:
+        NDArray: energy of each point (eV)
+    """
+    params = XasScanParameters(element, edge)
+    params.set_from_element_edge()
+    params.set_abc_from_gaf()
+    return XasScanPointGenerator(params).calculate_energy_time_grid()[:, 0]
+
+
 def example():
     # Setup the parameters
     params = XasScanParameters("Fe", "K")
@@ -1,11 +1,24 @@
+import inspect
+import multiprocessing
+import weakref
 from collections.abc import Callable
-from typing import cast
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 
 import matplotlib.pyplot as plt
 import numpy as np
 from bluesky.callbacks.core import CollectThenCompute
 from numpy.typing import NDArray
-from scipy.optimize import curve_fit
+from scipy.linalg import svd
+from scipy.optimize import curve_fit, least_squares, lsq_linear
+from scipy.sparse import block_diag
+
+# Backends for fitting the curves for each row of a grid scan :
+# "serial" - fit each row in turn
+# "thread", "process" - fit rows in parallel using thread or process pool
+# "vectorized" - fit all rows together, evaluating the fit function for all rows
+# at once (requires the fit function to broadcast over 2-d x values)
+FIT_BACKENDS = ("serial", "thread", "process", "vectorized")
 
 
 class FitCurves(CollectThenCompute):
@@ -20,6 +33,22 @@ class FitCurves(CollectThenCompute):
     fit_bounds -> range for each parameter to be used when fitting.
      A tuple of (min, max) value for each parameter.
      e.g. for parameters a, b,c : ( (min a, max a), (min b, max b), (min c, max c))
+    fit_backend -> how the curves for each row are fitted (one of FIT_BACKENDS)
+    max_workers -> number of threads or processes to use for fitting
+     (None = use default for the pool). The pool is created when first used and
+     kept until :meth:`close` is called (processes are started using 'spawn').
+    estimator -> function returning fast estimate of (params, covariance) from
+     x and y values (e.g. gaussian_estimate). Used as the fit result if
+     refine_estimate is False, otherwise as the starting point for curve_fit.
+    warm_start -> start curve_fit from the parameters of the previous fit in the
+     same run. The estimate is only used for the first fit of each run, or after
+     a fit has failed.
+     (rows fitted in parallel all start from the parameters of the fit before them)
+
+    The x and y values from the events are stored in numpy arrays, allocated at
+    the start of the run using the number of points in the scan (from the 'shape'
+    or 'num_points' in the start document). The data keys are found from the
+    descriptor, and the event documents are not kept.
     """
 
     def __init__(self):
@@ -27,6 +56,16 @@ class FitCurves(CollectThenCompute):
         self.fit_function: Callable[..., float | NDArray]
         self.fit_bounds = None
         self.results = []
+        self.fit_backend = "serial"
+        self.max_workers: int | None = None
+        self.estimator: Callable[[list[float], list[float]], tuple] | None = None
+        self.refine_estimate = True
+        self.warm_start = False
+        self.last_params = None  # parameters from last fit (cleared for each run)
+        self._executor: Executor | None = None
+        self._executor_settings: tuple[str, int | None] | None = None
+        self._data_names: tuple[str, str] | None = None
+        self._allocate_columns(0)
 
         # A function to be applied to the x and y values before curve fitting
         self.transform_function: (
@@ -43,46 +82,115 @@ class FitCurves(CollectThenCompute):
     def start(self, doc):
         self.results = []
         self.reset()
+        # a new scan (e.g. for another harmonic or element) is not warm started
+        # from the fits of an unrelated scan
+        self.last_params = None
         self.start_doc: dict = doc
+        self._data_names: tuple[str, str] | None = None
+        self._allocate_columns(self._expected_num_events())
         super().start(doc)
 
-    def do_fitting(self, xvals, yvals):
+    def _expected_num_events(self) -> int:
+        scan_shape = self.start_doc.get("shape")
+        if scan_shape is not None:
+            return int(np.prod(scan_shape))
+        return int(self.start_doc.get("num_points", 0))
+
+    def _allocate_columns(self, size: int):
+        self._num_events = 0
+        self._xvals = np.empty(max(size, 1))
+        self._yvals = np.empty(max(size, 1))
+
+    def descriptor(self, doc):
+        if doc.get("name", "primary") == "primary":
+            self._data_names = self._find_data_names(doc["data_keys"])
+        super().descriptor(doc)
+
+    def _find_data_names(self, data_keys) -> tuple[str, str]:
+        """Names of the inner loop motor and detector values in the event data"""
+        motor_names = self.start_doc["motors"]
+        inner_loop_motor = motor_names[len(motor_names) - 1]
+        det_name = self.start_doc["detectors"][0]
+        det_data_name = [n for n in data_keys if n.startswith(det_name)][0]
+        return inner_loop_motor, det_data_name
+
+    def event(self, doc):
+        # store the values in the columns, rather than keeping the event
+        if self._data_names is None:
+            self._data_names = self._find_data_names(doc["data"])
+        if self._num_events == len(self._xvals):
+            # more events than expected - double the size of the columns
+            self._xvals = np.resize(self._xvals, 2 * len(self._xvals))
+            self._yvals = np.resize(self._yvals, 2 * len(self._yvals))
+
+        x_name, y_name = self._data_names
+        self._xvals[self._num_events] = doc["data"][x_name]
+        self._yvals[self._num_events] = doc["data"][y_name]
+        self._num_events += 1
+
+    def get_bounds(self, xvals, yvals):
         bounds = None
         if self.bounds is not None:
             bounds = self.bounds
         if self.bounds_provider is not None:
             bounds = self.bounds_provider(xvals, yvals)
             print(f"Bounds from {self.bounds_provider.__name__} : {bounds}")
+        return bounds
 
-        if bounds is None:
-            return curve_fit(self.fit_function, xvals, yvals)
-        else:
-            return curve_fit(self.fit_function, xvals, yvals, bounds=bounds)
+    def estimate(self, xvals, yvals):
+        """Parameters from the estimator (None if there is no estimator, or no
+        estimate could be made)"""
+        return estimate_params(self.estimator, xvals, yvals)
+
+    def initial_params(self, xvals, yvals):
+        """Starting parameters for curve_fit : the parameters of the last fit if
+        warm_start is set, otherwise the estimate"""
+        if self.warm_start and self.last_params is not None:
+            return self.last_params
+        return self.estimate(xvals, yvals)
+
+    def do_fitting(self, xvals, yvals):
+        if self.estimator is not None and not self.refine_estimate:
+            try:
+                param, cov = self.estimator(xvals, yvals)
+            except ValueError as e:
+                print(f"Could not estimate fit parameters : {e}")
+            else:
+                self.last_params = param
+                return param, cov
+
+        bounds = self.get_bounds(xvals, yvals)
+        from_last_fit = self.warm_start and self.last_params is not None
+        p0 = self.initial_params(xvals, yvals)
+        try:
+            param, cov = fit_curve(
+                self.fit_function,
+                xvals,
+                yvals,
+                p0,
+                bounds,
+                retry_from_estimate=from_last_fit,
+                estimator=self.estimator,
+            )
+        except (RuntimeError, ValueError):
+            self.last_params = None
+            raise
+        self.last_params = param
+        return param, cov
 
     def determine_scan_shape(self):
         # Extract information about scan shape from start document :
+        # (single row of all the events if the number of points is not known
+        # in advance, e.g. for fly scans)
         scan_shape = self.start_doc.get("shape")
         if scan_shape is None:
-            scan_shape = [self.start_doc["num_points"]]
+            scan_shape = [self.start_doc.get("num_points", self._num_events)]
         return scan_shape
 
-    def extract_data(self):
-        """Extract the x and y values (i.e. position of motor being
-        moved and detector readout) from the event documents"""
-        motor_names = self.start_doc["motors"]
-        inner_loop_motor = motor_names[len(motor_names) - 1]
-        det_name = self.start_doc["detectors"][0]
-
-        events = cast(dict, self._events)
-        xvals = [e["data"][inner_loop_motor] for e in events]
-
-        def get_det_data_name(event: dict):
-            return [n for n in event["data"].keys() if n.startswith(det_name)]
-
-        det_data_name = get_det_data_name(events[0])[0]
-
-        yvals = [e["data"][det_data_name] for e in events]
-        return xvals, yvals
+    def extract_data(self) -> tuple[NDArray, NDArray]:
+        """The x and y values (i.e. position of motor being
+        moved and detector readout) from the events so far"""
+        return self._xvals[: self._num_events], self._yvals[: self._num_events]
 
     def set_transform_function(self, transform_function):
         """
@@ -108,7 +216,7 @@ class FitCurves(CollectThenCompute):
         scan_shape = self.determine_scan_shape()
         print(f"Scan shape : {str(scan_shape)}")
         readouts_per_row = scan_shape[len(scan_shape) - 1]
-        num_events = len(self._events)
+        num_events = self._num_events
 
         # list of x and detector value for each event
         xvals, yvals = self.extract_data()
@@ -116,18 +224,373 @@ class FitCurves(CollectThenCompute):
         if self.transform_function is not None:
             xvals, yvals = self.transform_function(xvals, yvals)
 
-        self.results = []
-        for i in range(0, num_events, readouts_per_row):
-            param, cov = self.do_fitting(
-                xvals[i : i + readouts_per_row], yvals[i : i + readouts_per_row]
+        row_starts = range(0, num_events, readouts_per_row)
+        row_xvals = [xvals[i : i + readouts_per_row] for i in row_starts]
+        row_yvals = [yvals[i : i + readouts_per_row] for i in row_starts]
+        self.results = self.fit_rows(row_xvals, row_yvals)
+
+    def fit_rows(self, row_xvals: list, row_yvals: list) -> list:
+        """Fit curve to each row of values using the fit backend.
+
+        Returns:
+            list: [params, covariance] for each row, in the same order as the rows
+        """
+        if self.fit_backend not in FIT_BACKENDS:
+            raise ValueError(
+                f"Unknown fit backend {self.fit_backend}, "
+                f"should be one of {FIT_BACKENDS}"
+            )
+
+        if self.fit_backend == "vectorized" and self._can_vectorize(row_yvals):
+            row_bounds = [
+                self.get_bounds(x, y) for x, y in zip(row_xvals, row_yvals, strict=True)
+            ]
+            results = fit_curves_vectorized(
+                self.fit_function, row_xvals, row_yvals, row_bounds
+            )
+            self.last_params = results[-1][0]
+            return results
+
+        if (
+            self.fit_backend in ("thread", "process")
+            and len(row_xvals) > 1
+            and self._can_parallelize()
+        ):
+            # starting parameters and bounds are found here, so the rows can be
+            # fitted using a function that does not need the callback
+            rows = list(zip(row_xvals, row_yvals, strict=True))
+            from_last_fit = self.warm_start and self.last_params is not None
+            row_p0 = [self.initial_params(x, y) for x, y in rows]
+            row_bounds = [self.get_bounds(x, y) for x, y in rows]
+            fits = self.executor().map(
+                fit_curve,
+                repeat(self.fit_function),
+                row_xvals,
+                row_yvals,
+                row_p0,
+                row_bounds,
+                repeat(from_last_fit),
+                repeat(self.estimator),
             )
-            self.results.append([param, cov])
+            results = [[param, cov] for param, cov in fits]
+            self.last_params = results[-1][0]
+            return results
+
+        results = []
+        for x, y in zip(row_xvals, row_yvals, strict=True):
+            param, cov = self.do_fitting(x, y)
+            results.append([param, cov])
+        return results
+
+    def executor(self) -> Executor:
+        """Thread or process pool for the fit backend (created when first used,
+        and reused until the backend or max_workers are changed)"""
+        settings = (self.fit_backend, self.max_workers)
+        if self._executor is None or self._executor_settings != settings:
+            self.close()
+            if self.fit_backend == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                # spawn, so worker processes do not inherit threads of the
+                # RunEngine (fork is not safe when there are threads)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            self._executor_settings = settings
+            self._shutdown_executor = weakref.finalize(self, self._executor.shutdown)
+        return self._executor
+
+    def close(self):
+        """Shut down the thread or process pool used for fitting"""
+        if self._executor is not None:
+            self._shutdown_executor()
+            self._executor = None
+            self._executor_settings = None
+
+    def _can_parallelize(self) -> bool:
+        # rows are fitted with fit_curve, so do_fitting must not be overridden
+        estimate_only = self.estimator is not None and not self.refine_estimate
+        return type(self).do_fitting is FitCurves.do_fitting and not estimate_only
+
+    def _can_vectorize(self, row_yvals: list) -> bool:
+        # fitting must use the fit function, and all rows need the same length
+        uses_fit_function = (
+            type(self).do_fitting is FitCurves.do_fitting and self.estimator is None
+        )
+        same_length = len({len(y) for y in row_yvals}) == 1
+        if not (uses_fit_function and same_length):
+            print("Cannot use vectorized fitting - fitting each row separately")
+        return uses_fit_function and same_length
+
+
+def estimate_params(
+    estimator: Callable[[list[float], list[float]], tuple] | None, xvals, yvals
+) -> NDArray | None:
+    """Parameters from an estimator (None if there is no estimator, or no estimate
+    could be made)"""
+    if estimator is None:
+        return None
+    try:
+        param, _ = estimator(xvals, yvals)
+    except ValueError as e:
+        print(f"Could not estimate fit parameters : {e}")
+        return None
+    return param
+
+
+def fit_curve(
+    fit_function: Callable[..., float | NDArray],
+    xvals,
+    yvals,
+    p0=None,
+    bounds=None,
+    retry_from_estimate: bool = False,
+    estimator: Callable[[list[float], list[float]], tuple] | None = None,
+) -> tuple[NDArray, NDArray]:
+    """Fit a curve to x, y values using curve_fit. Module level function with no
+    state, so it can be used by a thread or process pool.
+
+    Args:
+        fit_function: function to fit (x, param1, param2, ...)
+        xvals: x values
+        yvals: y values
+        p0: starting parameters (None to use the curve_fit default)
+        bounds: bounds ((lower bounds), (upper bounds)) of the parameters (or None)
+        retry_from_estimate: if the fit from p0 fails, fit again starting from
+            the parameters from the estimator (e.g. when p0 is from a previous fit)
+        estimator: function returning (params, covariance) estimate from the
+            x and y values (the curve_fit default is used if None)
+
+    Returns:
+        tuple: fitted parameters and covariance
+    """
+
+    def fit_from(p0):
+        if p0 is not None and bounds is not None:
+            # starting values need to be within the bounds
+            p0 = np.clip(p0, bounds[0], bounds[1])
+        if bounds is None:
+            return curve_fit(fit_function, xvals, yvals, p0=p0)
+        return curve_fit(fit_function, xvals, yvals, p0=p0, bounds=bounds)
+
+    try:
+        param, cov = fit_from(p0)
+    except (RuntimeError, ValueError) as e:
+        if not retry_from_estimate:
+            raise
+        print(f"Fit from last parameters failed ({e}) - fitting from estimate")
+        param, cov = fit_from(estimate_params(estimator, xvals, yvals))
+    return param, cov
+
+
+def _initial_params(lower: NDArray, upper: NDArray) -> NDArray:
+    """Initial parameter values within bounds (as used by curve_fit)"""
+    p0 = np.ones_like(lower)
+    both = np.isfinite(lower) & np.isfinite(upper)
+    p0[both] = 0.5 * (lower[both] + upper[both])
+    only_lower = np.isfinite(lower) & ~np.isfinite(upper)
+    p0[only_lower] = lower[only_lower] + 1
+    only_upper = ~np.isfinite(lower) & np.isfinite(upper)
+    p0[only_upper] = upper[only_upper] - 1
+    return p0
+
+
+def _covariance(jac: NDArray, residuals: NDArray) -> NDArray:
+    """Covariance of fitted parameters from jacobian (as calculated by
+    curve_fit, scaled by variance of the residuals)"""
+    num_points, num_params = jac.shape
+    _, s, vt = svd(jac, full_matrices=False)
+    threshold = np.finfo(float).eps * max(jac.shape) * s[0]
+    s = s[s > threshold]
+    vt = vt[: s.size]
+    cov = np.dot(vt.T / s**2, vt)
+    if num_points > num_params:
+        return cov * np.sum(residuals**2) / (num_points - num_params)
+    return np.full_like(cov, np.inf)
+
+
+def fit_curves_vectorized(
+    fit_function: Callable[..., float | NDArray],
+    row_xvals: list,
+    row_yvals: list,
+    row_bounds: list | None = None,
+) -> list:
+    """Fit a curve to each row of x, y values in a single least squares problem.
+    The fit function is evaluated for all the rows in one call (x values have shape
+    (rows, points per row), each parameter has shape (rows, 1)), and the jacobian
+    is block diagonal, so each row is fitted independently.
+
+    Args:
+        fit_function: function to fit (x, param1, param2, ...)
+        row_xvals: x values for each row (all rows must be the same length)
+        row_yvals: y values for each row
+        row_bounds: bounds ((lower bounds), (upper bounds)) for each row (or None)
+
+    Returns:
+        list: [params, covariance] for each row
+    """
+    x = np.asarray(row_xvals, dtype=float)
+    y = np.asarray(row_yvals, dtype=float)
+    num_rows, num_points = y.shape
+    num_params = len(inspect.signature(fit_function).parameters) - 1
+
+    lower = np.full((num_rows, num_params), -np.inf)
+    upper = np.full((num_rows, num_params), np.inf)
+    for row, bounds in enumerate(row_bounds or []):
+        if bounds is not None:
+            lower[row], upper[row] = bounds
+
+    def residuals(params: NDArray) -> NDArray:
+        params = params.reshape(num_rows, num_params)
+        columns = [params[:, [i]] for i in range(num_params)]
+        return (np.asarray(fit_function(x, *columns)) - y).ravel()
+
+    sparsity = block_diag([np.ones((num_points, num_params))] * num_rows)
+    result = least_squares(
+        residuals,
+        _initial_params(lower, upper).ravel(),
+        jac_sparsity=sparsity,
+        bounds=(lower.ravel(), upper.ravel()),
+        method="trf",
+    )
+
+    params = result.x.reshape(num_rows, num_params)
+    jac = result.jac.tocsr()
+    fit_results = []
+    for row in range(num_rows):
+        points = slice(row * num_points, (row + 1) * num_points)
+        row_params = slice(row * num_params, (row + 1) * num_params)
+        row_jac = jac[points, row_params].toarray()
+        cov = _covariance(row_jac, result.fun[points])
+        fit_results.append([params[row], cov])
+    return fit_results
+
+
+class StreamingFitCurves(FitCurves):
+    """
+    FitCurves callback that also refits the current row of the scan as each event
+    arrives, giving a provisional peak position and its uncertainty
+    (standard deviation from the fit covariance) before the scan has finished.
+    The final fit of all the rows is still done at run-stop time.
+
+    min_points -> number of points in the row before the first fit is made
+    refit_interval -> number of events between each refit
+    peak_param_index -> index of the peak position in the fit parameters
+    peak_tolerance -> peak is found when its uncertainty is less than this
+    min_points_past_peak -> number of points after the peak before it can be found
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.min_points = 5
+        self.refit_interval = 1
+        self.peak_param_index = -1
+        self.peak_tolerance: float | None = None
+        self.min_points_past_peak = 3
+        self.reset_provisional()
+
+    def reset_provisional(self):
+        self.provisional_fit: list | None = None
+        self.peak_position: float | None = None
+        self.peak_uncertainty: float | None = None
+        self._last_bounds = None
+
+    def start(self, doc):
+        self.reset_provisional()
+        super().start(doc)
+
+    def get_bounds(self, xvals, yvals):
+        self._last_bounds = super().get_bounds(xvals, yvals)
+        return self._last_bounds
+
+    def event(self, doc):
+        super().event(doc)
+
+        num_points = len(self.current_row()[0])
+        if num_points == 1:
+            # start of a new row
+            self.reset_provisional()
+
+        if (
+            num_points >= self.min_points
+            and (num_points - self.min_points) % self.refit_interval == 0
+        ):
+            self.update_provisional_fit()
+
+    def current_row(self) -> tuple[NDArray, NDArray]:
+        """x and y values of the row of the scan currently being measured"""
+        readouts_per_row = self.determine_scan_shape()[-1]
+        row_start = max(self._num_events - 1, 0) // readouts_per_row * readouts_per_row
+        xvals, yvals = self.extract_data()
+        return xvals[row_start:], yvals[row_start:]
+
+    def update_provisional_fit(self):
+        """Fit the points of the current row and update the provisional peak"""
+        xvals, yvals = self.current_row()
+        if self.transform_function is not None:
+            xvals, yvals = self.transform_function(xvals, yvals)
+        # fits of part of a row are not used to warm start the final fits
+        last_params = self.last_params
+        try:
+            param, cov = self.do_fitting(xvals, yvals)
+        except (RuntimeError, ValueError) as e:
+            print(f"Provisional fit with {len(xvals)} points failed : {e}")
+            return
+        finally:
+            self.last_params = last_params
+
+        self.provisional_fit = [param, cov]
+        self.peak_position = float(param[self.peak_param_index])
+        self.peak_uncertainty = None
+        if cov is not None:
+            variance = np.asarray(cov)[self.peak_param_index, self.peak_param_index]
+            self.peak_uncertainty = float(np.sqrt(variance))
+
+    def peak_found(self, tolerance: float | None = None) -> bool:
+        """Return True if the provisional peak is well defined :
+        uncertainty is less than the tolerance (default = peak_tolerance),
+        the peak is not at the limit of the fit bounds, and the scan has moved
+        at least min_points_past_peak points past the peak (and past the
+        highest measured value)"""
+        if tolerance is None:
+            tolerance = self.peak_tolerance
+        if tolerance is None or self.peak_position is None:
+            return False
+        # (zero uncertainty means the fit did not move from the initial values)
+        uncertainty = self.peak_uncertainty
+        if uncertainty is None or not np.isfinite(uncertainty) or uncertainty == 0:
+            return False
+        if uncertainty > tolerance or self._peak_at_bound():
+            return False
+
+        xvals, yvals = self.current_row()
+        if self.transform_function is not None:
+            xvals, yvals = self.transform_function(xvals, yvals)
+        x = np.asarray(xvals)
+        # number of points past the peak, in direction of the scan
+        direction = np.sign(x[-1] - x[0])
+        num_past_peak = np.count_nonzero(direction * (x - self.peak_position) > 0)
+        num_past_max = len(x) - 1 - int(np.argmax(yvals))
+        return min(num_past_peak, num_past_max) >= self.min_points_past_peak
+
+    def _peak_at_bound(self) -> bool:
+        if self._last_bounds is None or self.peak_position is None:
+            return False
+        lower = np.asarray(self._last_bounds[0])[self.peak_param_index]
+        upper = np.asarray(self._last_bounds[1])[self.peak_param_index]
+        # curve_fit may stop just inside the bound
+        tolerance = 1e-3 * abs(upper - lower)
+        return bool(
+            np.isclose(self.peak_position, lower, rtol=0, atol=tolerance)
+            or np.isclose(self.peak_position, upper, rtol=0, atol=tolerance)
+        )
 
 
 class FitCurvesMaxValue(FitCurves):
     def do_fitting(self, xvals, yvals):
         # Find the peak value
-        peak_index = yvals.index(max(yvals))
+        peak_index = int(np.argmax(yvals))
         return [[xvals[peak_index]], None]
 
 
@@ -136,16 +599,86 @@ def quadratic(x: float | NDArray, a: float, b: float, c: float) -> float | NDArr
     return a + b * x + c * (x**2)
 
 
+def _polynomial_covariance(
+    design: NDArray, residuals: NDArray, num_params: int
+) -> NDArray:
+    """Covariance of linear least squares parameters (as calculated by curve_fit,
+    scaled by variance of the residuals). Arrays can be stacked for many curves."""
+    num_points = design.shape[-2]
+    cov = np.linalg.pinv(np.swapaxes(design, -1, -2) @ design)
+    if num_points <= num_params:
+        return np.full_like(cov, np.inf)
+    variance = np.sum(residuals**2, axis=-1) / (num_points - num_params)
+    return cov * variance[..., None, None]
+
+
+def fit_polynomial(
+    x_vals,
+    y_vals,
+    order: int = 2,
+    weights=None,
+    bounds: tuple | None = None,
+) -> tuple[NDArray, NDArray]:
+    """
+        Fit polynomial y = p[0] + p[1]*x + p[2]*x**2 + ... by solving weighted
+        linear least squares directly (no iteration). Several curves can be fitted
+        at once by passing 2-d arrays of x and y values (one row per curve).
+
+    :param x_vals: x values (1-d, or 2-d with one row for each curve)
+    :param y_vals: y values (same shape as x_vals)
+    :param order: order of polynomial
+    :param weights: optional weight for each y value (i.e. 1/sigma)
+    :param bounds: optional (lower bounds, upper bounds) for the parameters
+        (one value for each parameter, or an array with one row for each curve).
+        Bounded curves are solved with scipy lsq_linear.
+
+    :return: fit params, covariance matrix (with extra leading dimension for
+        each curve if 2-d values were passed)
+    """
+    x = np.asarray(x_vals, dtype=float)
+    y = np.asarray(y_vals, dtype=float)
+    num_params = order + 1
+
+    design = np.vander(x.ravel(), num_params, increasing=True).reshape(
+        *x.shape, num_params
+    )
+    if weights is not None:
+        w = np.broadcast_to(np.asarray(weights, dtype=float), y.shape)
+        design = design * w[..., None]
+        y = y * w
+
+    # least squares solution for each curve using the pseudo-inverse
+    params = (np.linalg.pinv(design) @ y[..., None])[..., 0]
+
+    if bounds is not None:
+        shape = params.shape
+        lower = np.broadcast_to(np.asarray(bounds[0], dtype=float), shape)
+        upper = np.broadcast_to(np.asarray(bounds[1], dtype=float), shape)
+        # only need bounded least squares for curves with parameters out of bounds
+        out_of_bounds = np.any((params < lower) | (params > upper), axis=-1)
+        for index in np.ndindex(out_of_bounds.shape):
+            if not out_of_bounds[index]:
+                continue
+            params[index] = lsq_linear(
+                design[index], y[index], bounds=(lower[index], upper[index])
+            ).x
+
+    residuals = y - (design @ params[..., None])[..., 0]
+    cov = _polynomial_covariance(design, residuals, num_params)
+    return params, cov
+
+
 def fit_quadratic_curve(
     x_vals: list[float],
     y_vals: list[float],
     show_plot: bool = False,
     bounds: tuple[tuple, tuple] | None = None,
     default_bounds: float = 100.0,
+    weights: list[float] | None = None,
 ):
     """
         Fit quadratic curve to a set of x,y values; return the fit parameters
-        and covariance matrix
+        and covariance matrix (see :func:`fit_polynomial`)
 
     :param data_results: dictionary containing data to be fitted
         { xval1:yval1, xval2:yval2 ...}
@@ -153,14 +686,11 @@ def fit_quadratic_curve(
         on plot (default = False)
     :param bounds:  optional tuple containing bounds for each parameter of the
         trial_quadratic function e.g. ( (0,0,0), (10,10,10))
-    :param trial_quadratic : optional quadratic function to be used for fitting
-        (default = 'quadratic')
+    :param weights: optional weight for each y value (i.e. 1/sigma)
 
     :return: fit params, covariance matrix
     """
 
-    # print("Curve x : {}".format(x_vals))
-    # print("Curve y : {}".format(y_vals))
     upper_bound = [default_bounds] * 3
     lower_bound = [-1.0 * default_bounds] * 3
 
@@ -169,14 +699,18 @@ def fit_quadratic_curve(
         upper_bound = list(bounds[1])
 
     bounds = (tuple(lower_bound), tuple(upper_bound))
-    param, cov = curve_fit(quadratic, x_vals, y_vals, bounds=bounds)
+    param, cov = fit_polynomial(x_vals, y_vals, 2, weights=weights, bounds=bounds)
     print(f"Fit params (quadratic) : {param}")
 
-    # change quadratic component of bounds to force linear fit
-    lower_bound[-1] = -1e-12
-    upper_bound[-1] = 1e-12
-    bounds_linear_fit = (tuple(lower_bound), tuple(upper_bound))
-    params_linear, cov = curve_fit(quadratic, x_vals, y_vals, bounds=bounds_linear_fit)
+    # linear fit (quadratic coefficient = 0)
+    params_linear, _ = fit_polynomial(
+        x_vals,
+        y_vals,
+        1,
+        weights=weights,
+        bounds=(lower_bound[:2], upper_bound[:2]),
+    )
+    params_linear = np.append(params_linear, 0.0)
     print(f"Fit params (linear) : {params_linear}")
 
     if show_plot:
@@ -202,6 +736,70 @@ def trial_gaussian(x: float | NDArray, a: float, b: float, c: float) -> float |
     return a * np.exp(-(((x - c) * b) ** 2))
 
 
+def gaussian_estimate(
+    xvals: list[float], yvals: list[float], threshold_fraction: float = 0.1
+) -> tuple[NDArray, NDArray]:
+    """Closed form estimate of the parameters of :func:`trial_gaussian` (Caruana's
+    method) : fit a parabola to log(y), A + B*x + C*x**2 (weighted by y**2 to
+    reduce the effect of noise on the low values), then
+    b = sqrt(-C), c = -B/(2C), a = exp(A - B**2/(4C))
+
+    Args:
+        xvals: x values
+        yvals: y values
+        threshold_fraction: only use points with y above this fraction of
+            the maximum y value
+
+    Raises:
+        ValueError: if there are fewer than 3 points above the threshold, or
+            log(y) does not have a maximum within the range of x values
+
+    Returns:
+        tuple: parameters (a, b, c), covariance matrix
+    """
+    x = np.asarray(xvals, dtype=float)
+    y = np.asarray(yvals, dtype=float)
+    use = y > threshold_fraction * np.max(y)
+    use &= y > 0
+    if np.count_nonzero(use) < 3:
+        raise ValueError("Need at least 3 points above threshold")
+    x, y = x[use], y[use]
+
+    # centre x values to improve conditioning
+    x_mean = np.mean(x)
+    design = np.vander(x - x_mean, 3, increasing=True)
+    log_y = np.log(y)
+    coeffs, _, rank, _ = np.linalg.lstsq(design * y[:, None], log_y * y, rcond=None)
+    A, B, C = coeffs
+    if rank < 3 or C >= 0:
+        raise ValueError("Log of y values does not have a maximum")
+    c = -B / (2 * C)
+    if not np.min(x) <= c + x_mean <= np.max(x):
+        raise ValueError("Peak of log(y) parabola is outside range of x values")
+
+    b = np.sqrt(-C)
+    a = np.exp(A - B**2 / (4 * C))
+    params = np.array([a, b, c + x_mean])
+
+    # covariance of (A, B, C) from weighted residuals, propagated to (a, b, c)
+    num_points = len(x)
+    cov_abc = np.full((3, 3), np.inf)
+    if num_points > 3:
+        weighted_design = design * y[:, None]
+        residuals = log_y * y - weighted_design @ coeffs
+        variance = np.sum(residuals**2) / (num_points - 3)
+        cov_coeffs = variance * np.linalg.inv(weighted_design.T @ weighted_design)
+        jac = np.array(
+            [
+                [a, -a * B / (2 * C), a * B**2 / (4 * C**2)],
+                [0, 0, -1 / (2 * b)],
+                [0, -1 / (2 * C), B / (2 * C**2)],
+            ]
+        )
+        cov_abc = jac @ cov_coeffs @ jac.T
+    return params, cov_abc
+
+
 def gaussian_bounds_provider(
     xvals: list[float], yvals: list[float], peak_fit_fraction: float = 0.1
 ) -> tuple[list[float], list[float]]:
@@ -0,0 +1,166 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+from spectroscopy_bluesky.common.lookup_tables import (
+    LookupTableCache,
+    lookup_table_cache,
+)
+from spectroscopy_bluesky.common.quantity_conversion import (
+    energy_to_bragg_angle,
+    si_111_lattice_spacing,
+)
+from spectroscopy_bluesky.i18.plans.lookup_tables import lookuptable_curve
+
+"""
+Undulator gap lookup tables for several harmonics (one Ascii file per harmonic,
+e.g. Si111_harmonic7.txt). All the tables are loaded once, and the harmonic to use
+for each Bragg angle is found from a precomputed index of the Bragg angle
+ranges covered by each table, so harmonics and gaps for a whole energy scan are
+looked up using a few array operations.
+"""
+
+# harmonic number from lookup table filename, e.g. Si111_harmonic7.txt -> 7
+harmonic_filename_pattern = re.compile(r"harmonic_?(\d+)", re.IGNORECASE)
+
+
+@dataclass
+class HarmonicSegment:
+    """Consecutive points of a scan that use the same harmonic"""
+
+    harmonic: int
+    start: int
+    stop: int
+
+
+class HarmonicLookupTables:
+    def __init__(
+        self,
+        tables: dict[int, str | Path],
+        interpolate: bool = True,
+        lattice_spacing: float = si_111_lattice_spacing,
+        cache: LookupTableCache = lookup_table_cache,
+    ):
+        """
+        Args:
+            tables: lookup table filename for each harmonic number
+            interpolate: interpolate gap values from the tables (otherwise use a
+                quadratic fit, see :func:`load_lookuptable_curve`)
+            lattice_spacing: monochromator crystal lattice spacing (metres),
+                used to convert energy to Bragg angle
+            cache: cache used to load the lookup tables
+        """
+        if len(tables) == 0:
+            raise ValueError("No lookup tables given")
+        self.lattice_spacing = lattice_spacing
+        self.harmonics = np.array(sorted(tables), dtype=int)
+        self.curves = {}
+        ranges = []
+        for harmonic in self.harmonics:
+            self.curves[harmonic] = cache.curve(
+                tables[harmonic], lookuptable_curve, interpolate=interpolate
+            )
+            ranges.append(cache.bragg_range(tables[harmonic]))
+        # Bragg angle range of each table, in same order as self.harmonics
+        self.bragg_ranges = np.array(ranges)
+        self._build_index()
+
+    @classmethod
+    def from_directory(
+        cls, directory: str | Path, pattern: str = "*harmonic*.txt", **kwargs
+    ) -> "HarmonicLookupTables":
+        """Load the lookup table files in a directory, taking the harmonic number
+        from each filename (e.g. Si111_harmonic7.txt is for harmonic 7)"""
+        tables = {}
+        for filename in sorted(Path(directory).glob(pattern)):
+            match = harmonic_filename_pattern.search(filename.stem)
+            if match is not None:
+                tables[int(match.group(1))] = filename
+        return cls(tables, **kwargs)
+
+    def _lowest_covering_harmonic(self, angles: NDArray) -> NDArray:
+        """Index into self.harmonics of the lowest harmonic whose table covers
+        each angle (-1 if no table covers it)"""
+        covered = (angles[:, np.newaxis] >= self.bragg_ranges[:, 0]) & (
+            angles[:, np.newaxis] <= self.bragg_ranges[:, 1]
+        )
+        return np.where(covered.any(axis=1), np.argmax(covered, axis=1), -1)
+
+    def _build_index(self):
+        """Split the Bragg angle range into intervals between the ends of the table
+        ranges, and find the harmonic to use in each interval and at each end"""
+        self._edges = np.unique(self.bragg_ranges)
+        midpoints = 0.5 * (self._edges[1:] + self._edges[:-1])
+        self._interval_harmonic = self._lowest_covering_harmonic(midpoints)
+        self._edge_harmonic = self._lowest_covering_harmonic(self._edges)
+
+    def harmonic_index(self, bragg_angles: ArrayLike) -> NDArray:
+        """Index into :attr:`harmonics` of the harmonic to use for each Bragg angle
+        (-1 for angles not covered by any table)"""
+        angles = np.atleast_1d(np.asarray(bragg_angles, dtype=float))
+        edge = np.searchsorted(self._edges, angles, side="right") - 1
+        index = np.full(angles.shape, -1)
+        in_interval = (edge >= 0) & (edge < len(self._interval_harmonic))
+        index[in_interval] = self._interval_harmonic[edge[in_interval]]
+        on_edge = edge >= 0
+        on_edge[on_edge] = self._edges[edge[on_edge]] == angles[on_edge]
+        index[on_edge] = self._edge_harmonic[edge[on_edge]]
+        return index.reshape(np.shape(bragg_angles))
+
+    def harmonic(self, bragg_angles: ArrayLike) -> NDArray:
+        """Harmonic to use for each Bragg angle : the lowest harmonic whose lookup
+        table covers the angle (0 for angles not covered by any table)"""
+        index = self.harmonic_index(bragg_angles)
+        return np.where(index >= 0, self.harmonics[index], 0)
+
+    def lookup(self, bragg_angles: ArrayLike) -> tuple[NDArray, NDArray]:
+        """Harmonic and undulator gap for each Bragg angle
+
+        Args:
+            bragg_angles: Bragg angles (degrees)
+
+        Returns:
+            tuple: harmonic numbers (0 where no table covers the angle) and
+                undulator gaps (NaN where no table covers the angle)
+        """
+        angles = np.asarray(bragg_angles, dtype=float)
+        index = self.harmonic_index(angles)
+        gaps = np.full(angles.shape, np.nan)
+        # evaluate the curve of each harmonic for all its angles together
+        for i in np.unique(index[index >= 0]):
+            use = index == i
+            gaps[use] = self.curves[self.harmonics[i]](angles[use])
+        return np.where(index >= 0, self.harmonics[index], 0), gaps
+
+    def lookup_energy(self, energies: ArrayLike) -> tuple[NDArray, NDArray, NDArray]:
+        """Bragg angle, harmonic and undulator gap for each energy
+
+        Args:
+            energies: photon energies (eV)
+
+        Returns:
+            tuple: Bragg angles (degrees), harmonic numbers and undulator gaps
+        """
+        angles = np.asarray(
+            energy_to_bragg_angle(
+                self.lattice_spacing, np.asarray(energies, dtype=float)
+            )
+        )
+        harmonics, gaps = self.lookup(angles)
+        return angles, harmonics, gaps
+
+    def segments(self, harmonics: ArrayLike) -> list[HarmonicSegment]:
+        """Split a scan into segments of consecutive points using the same
+        harmonic (e.g. from the harmonics returned by :meth:`lookup_energy`)"""
+        harmonics = np.asarray(harmonics)
+        if harmonics.size == 0:
+            return []
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(harmonics)) + 1))
+        stops = np.append(starts[1:], harmonics.size)
+        return [
+            HarmonicSegment(int(harmonics[start]), int(start), int(stop))
+            for start, stop in zip(starts, stops, strict=True)
+        ]
@@ -1,82 +1,204 @@
 import json
-import math
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
 from scipy.interpolate import CubicSpline
 
+from spectroscopy_bluesky.common.lookup_tables import (
+    id_gap_lookup_table_column_names,
+    interpolated_curve,
+    load_ascii_lookuptable,
+    lookup_table_cache,
+)
 from spectroscopy_bluesky.i18.plans.curve_fitting import fit_quadratic_curve, quadratic
 
-"""
-Names of the columns in the ID gap lookup table files
-"""
-id_gap_lookup_table_column_names = ["Bragg [deg]", "ID gap [mm]"]
 lookup_table_kwargs = {"float_format": "%9.5f", "sep": "\t", "index": None}
 
 
-def load_ascii_lookuptable(filename, lines_to_skip=2):
+class InverseLookup:
     """
-     Load 2-colummn x,y Ascii data from file and convert to numbers
-    (optionally skipping the first few lines)
+    Inverse x(y) of a monotonic curve y(x) over a range of x values, evaluated
+    for whole arrays of y values at once.
+
+    The curve is evaluated on a dense grid of x values to make a lookup table;
+    each y value is bracketed by two grid points (binary search over the table),
+    and the x value is then refined using false position iterations, applied to
+    all the y values together, until y(x) is within tolerance of each y value.
+
+    :param func: curve y(x). Needs to accept arrays of x values (e.g. the
+        functions returned by :py:func:`load_lookuptable_curve`)
+    :param range_min, range_max: range of x values
+    :param num_points: number of points in the lookup table
+    :param tolerance: required accuracy of y(x)
+    :param max_iters: maximum number of refinement iterations
+    """
+
+    def __init__(
+        self,
+        func,
+        range_min=0,
+        range_max=100,
+        num_points=2001,
+        tolerance=1e-6,
+        max_iters=20,
+    ):
+        self.func = func
+        self.tolerance = tolerance
+        self.max_iters = max_iters
+
+        x_grid = np.linspace(range_min, range_max, num_points)
+        y_grid = np.asarray(func(x_grid), dtype=float)
+        y_diff = np.diff(y_grid)
+        if np.all(y_diff < 0):
+            x_grid, y_grid = x_grid[::-1], y_grid[::-1]
+        elif not np.all(y_diff > 0):
+            raise ValueError(
+                f"Curve is not monotonic between x = {range_min} and {range_max}"
+            )
+        # table sorted by increasing y value
+        self.x_grid = x_grid
+        self.y_grid = y_grid
+
+    def __call__(self, y_values):
+        """
+        :param y_values: y value, or array of y values
+        :return: x values such that y(x) = y_values
+            (NaN for y values outside the range of the curve)
+        """
+        y_search = np.asarray(y_values, dtype=float)
+        shape = y_search.shape
+        y_search = y_search.ravel()
+        in_range = (y_search >= self.y_grid[0]) & (y_search <= self.y_grid[-1])
+
+        # bracketing points from the lookup table
+        index = np.clip(np.searchsorted(self.y_grid, y_search), 1, len(self.y_grid) - 1)
+        lower_x, upper_x = self.x_grid[index - 1], self.x_grid[index]
+        lower_y, upper_y = self.y_grid[index - 1], self.y_grid[index]
+
+        x_vals = lower_x.copy()
+        active = in_range.copy()
+        for _ in range(self.max_iters + 1):
+            # false position : linear interpolation between the bracketing points
+            frac = (y_search[active] - lower_y[active]) / (
+                upper_y[active] - lower_y[active]
+            )
+            x_vals[active] = lower_x[active] + frac * (
+                upper_x[active] - lower_x[active]
+            )
+            y_vals = np.asarray(self.func(x_vals[active]), dtype=float)
+
+            converged = np.abs(y_vals - y_search[active]) <= self.tolerance
+            below = y_vals < y_search[active]
+            indices = np.flatnonzero(active)
+            lower_x[indices[below]] = x_vals[indices[below]]
+            lower_y[indices[below]] = y_vals[below]
+            upper_x[indices[~below]] = x_vals[indices[~below]]
+            upper_y[indices[~below]] = y_vals[~below]
 
-     :param filename:
-     :param lines_to_skip how many lines to skip before storing the data
-     :return: list containing the x, y value on each line [ (x1,y1), (x2,y2) ...]
+            active[indices[converged]] = False
+            if not np.any(active):
+                break
 
+        x_vals[~in_range] = np.nan
+        return x_vals.reshape(shape)
+
+
+def curve_range(func):
     """
-    print(f"Loading ascii lookup table from {filename}")
-    dataframe = pd.read_csv(
-        filename,
-        sep=" ",
-        skiprows=lines_to_skip,
-        names=id_gap_lookup_table_column_names,
+    Range of x values a curve y(x) was made from : the knots of a spline, or the
+    ``x_range`` attribute of the function (as set by :py:func:`lookuptable_curve`
+    for quadratic fits).
+
+    :return: (min, max) x values, or None if the range is not known
+    """
+    if isinstance(func, CubicSpline):
+        return float(func.x[0]), float(func.x[-1])
+    return getattr(func, "x_range", None)
+
+
+@lru_cache(maxsize=32)
+def inverse_lookup(func, range_min=None, range_max=None, tolerance=1e-6, max_iters=20):
+    """
+    :py:class:`InverseLookup` of a curve, built once for each curve, range and
+    tolerance and reused by later calls. The range defaults to the range of x
+    values the curve was made from (see :py:func:`curve_range`), or 0 to 100 if
+    that is not known.
+
+    """
+    default_min, default_max = curve_range(func) or (0, 100)
+    return InverseLookup(
+        func,
+        default_min if range_min is None else range_min,
+        default_max if range_max is None else range_max,
+        tolerance=tolerance,
+        max_iters=max_iters,
     )
-    dataframe.info()
-    return [(v[0], v[1]) for v in dataframe.values]
 
 
-def lookup_value(
-    y_search, func, range_min=0, range_max=100, tolerance=1e-6, max_iters=20
+def lookup_values(
+    y_search, func, range_min=None, range_max=None, tolerance=1e-6, max_iters=20
 ):
     """
-    Lookup x value for a curve y(x), such that y_search = y(x)
-    Uses interval bisection to reach desired accuracy tolerance,
-    up to maxiumum number of iterations
+    Lookup x values for a monotonic curve y(x), such that y_search = y(x) for
+    an array of y values (see :py:func:`inverse_lookup`)
+
+    :return: array of x values (NaN for y values outside the range of the curve)
+    """
+    inverse = inverse_lookup(func, range_min, range_max, tolerance, max_iters)
+    return inverse(y_search)
+
 
+def lookup_value(
+    y_search, func, range_min=None, range_max=None, tolerance=1e-6, max_iters=20
+):
     """
+    Lookup x value for a monotonic curve y(x), such that y_search = y(x)
+    (single value version of :py:func:`lookup_values`)
 
-    def eval_func(x_pos):
-        return x_pos, func(x_pos)
+    :return: x value
+    :raises ValueError: if y_search is not a single value, or is outside the
+        range of the curve
+    """
+    if np.ndim(y_search) != 0:
+        raise ValueError(f"Expected a single y value, got {y_search}")
+    inverse = inverse_lookup(func, range_min, range_max, tolerance, max_iters)
+    x_value = float(inverse(y_search))
+    if np.isnan(x_value):
+        raise ValueError(
+            f"y = {y_search} is outside the range of the curve "
+            f"({inverse.y_grid[0]} to {inverse.y_grid[-1]})"
+        )
+    return x_value
 
-    def in_range(v, v1, v2):
-        return min(v1, v2) < v < max(v1, v2)
 
-    # evaluate func at lower and upper x bounds :
-    lower = eval_func(range_min)
-    upper = eval_func(range_max)
+def lookuptable_curve(values, interpolate=True, **kwargs):
+    """Function that returns undulator gap for a given Bragg angle, from
+    lookup table values
 
-    iter_num = 0
+    :param values: array of [Bragg angle, undulator gap] values
+    :param interpolate: (default=True) If true, function uses interpolation to
+    evaluate undulator gap, else function is quadratic fit to the values.
+    :param kwargs: passed to :py:func:`fit_quadratic_curve` (if not interpolating)
 
-    best_y = y_search + 100
+    :return: function that returns undulator gap value for a given Bragg angle
+    """
+    values = np.asarray(values, dtype=float)
+    if interpolate:
+        return interpolated_curve(values)
 
-    while iter_num < max_iters and math.fabs(best_y - y_search) > tolerance:
-        # evaluate function at midpoint
-        mid = eval_func((lower[0] + upper[0]) / 2.0)
+    params, cov = fit_quadratic_curve(
+        values[:, 0].tolist(), values[:, 1].tolist(), **kwargs
+    )
 
-        # update upper, lower bound depending on midpoint y value relative to y_search
-        if in_range(y_search, lower[1], mid[1]):
-            upper = mid
-        else:
-            lower = mid
-        best_y = (lower[1] + upper[1]) / 2.0
-        iter_num += 1
-        # print(lower, upper)
+    def best_undulator_gap(angle):
+        return quadratic(angle, *params)
 
-    # return best x value
-    return (lower[0] + upper[0]) / 2.0
+    best_undulator_gap.x_range = (float(values[:, 0].min()), float(values[:, 0].max()))
+    return best_undulator_gap
 
 
-def load_lookuptable_curve(filename, interpolate=True, **kwargs):
+def load_lookuptable_curve(filename, interpolate=True, use_cache=True, **kwargs):
     """Load undulator gap lookup table from Ascii file
     and return a function that returns undulator gap for a given Bragg angle
 
@@ -84,24 +206,20 @@ def load_lookuptable_curve(filename, interpolate=True, **kwargs):
     :param kwargs:
     :param interpolate (default=True) If true, function uses interpolation to evaluate
     undulator gap, else function is quadratic fit to the values.
+    :param use_cache (default=True) If true, use the values and curve from
+    :py:data:`spectroscopy_bluesky.common.lookup_tables.lookup_table_cache` if the
+    file has not changed since it was last loaded.
 
     :return: function that returns undulator gap value for a given Bragg angle
 
     """
-    vals = load_ascii_lookuptable(filename, lines_to_skip=2)
-
-    if interpolate:
-        values = sorted(load_ascii_lookuptable(filename))
-        return CubicSpline([v[0] for v in values], [v[1] for v in values])
-
-    params, cov = fit_quadratic_curve(
-        [v[0] for v in vals], [v[1] for v in vals], **kwargs
-    )
-
-    def best_undulator_gap(angle):
-        return quadratic(angle, *params)
+    if use_cache:
+        return lookup_table_cache.curve(
+            filename, lookuptable_curve, interpolate=interpolate, **kwargs
+        )
 
-    return best_undulator_gap
+    values = load_ascii_lookuptable(filename, lines_to_skip=2)
+    return lookuptable_curve(values, interpolate, **kwargs)
 
 
 def save_fit_results(filename, bragg_angles, gap_values, fit_params=None):
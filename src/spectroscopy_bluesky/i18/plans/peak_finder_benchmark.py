@@ -0,0 +1,128 @@
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import NDArray
+
+from spectroscopy_bluesky.common.devices import FunctionPatternGenerator
+from spectroscopy_bluesky.i18.plans.curve_fitting import trial_gaussian
+from spectroscopy_bluesky.i18.plans.peak_finders import get_peak_finder, peak_finders
+
+"""
+Compare the speed and accuracy of the registered peak finders.
+Test curves are generated with :class:`FunctionPatternGenerator`
+(default is a Gaussian), with random peak positions and added noise.
+"""
+
+
+@dataclass
+class BenchmarkResult:
+    """Time per fit (seconds) and error in the peak position for a peak finder"""
+
+    name: str
+    num_curves: int
+    time_per_fit: float
+    mean_error: float
+    max_error: float
+    failures: int = 0
+
+
+def generate_curve(generator: FunctionPatternGenerator, xvals: NDArray) -> NDArray:
+    """Evaluate the pattern generator (including its noise) at each x value"""
+    return np.array([generator.generate_point(x) for x in xvals], dtype=float)
+
+
+def benchmark_peak_finders(
+    finder_names: list[str] | None = None,
+    num_curves: int = 50,
+    num_points: int = 41,
+    x_range: tuple[float, float] = (0.0, 10.0),
+    noise: float = 0.0,
+    function: Callable[..., float | NDArray] = trial_gaussian,
+    function_params: tuple[float, float] = (10.0, 0.8),
+    seed: int = 0,
+) -> list[BenchmarkResult]:
+    """Find the peaks of a set of test curves with each peak finder.
+
+    Args:
+        finder_names: names of peak finders to compare (default = all registered)
+        num_curves: number of test curves
+        num_points: number of points in each curve
+        x_range: range of x values. Peak centres are chosen randomly from the
+            middle half of the range.
+        noise: amplitude of noise added by the pattern generator
+        function: function(x, *function_params, centre) used to generate curves
+        function_params: parameters of function, apart from the centre
+        seed: random number seed (for peak positions and noise)
+
+    Returns:
+        list[BenchmarkResult]: one result for each peak finder
+    """
+    rng = np.random.default_rng(seed)
+    generator = FunctionPatternGenerator()
+    generator.user_function = function
+    generator.noise = noise
+    generator.rnd_generator = rng.random
+
+    xvals = np.linspace(*x_range, num_points)
+    width = x_range[1] - x_range[0]
+    centres = rng.uniform(x_range[0] + width / 4, x_range[1] - width / 4, num_curves)
+    curves = []
+    for centre in centres:
+        generator.function_params = [*function_params, centre]
+        curves.append(generate_curve(generator, xvals))
+
+    results = []
+    for name in finder_names or list(peak_finders):
+        finder = get_peak_finder(name)
+        errors = []
+        failures = 0
+        start = time.perf_counter()
+        for centre, yvals in zip(centres, curves, strict=True):
+            try:
+                errors.append(abs(finder(xvals, yvals) - centre))
+            except (RuntimeError, ValueError):
+                failures += 1
+        elapsed = time.perf_counter() - start
+
+        results.append(
+            BenchmarkResult(
+                name,
+                num_curves,
+                elapsed / num_curves,
+                float(np.mean(errors)) if errors else np.inf,
+                float(np.max(errors)) if errors else np.inf,
+                failures,
+            )
+        )
+    return results
+
+
+def choose_peak_finder(
+    results: list[BenchmarkResult], tolerance: float
+) -> BenchmarkResult | None:
+    """Fastest peak finder with maximum error within tolerance and no failures
+    (None if no peak finder is accurate enough)"""
+    accurate = [r for r in results if r.max_error <= tolerance and r.failures == 0]
+    return min(accurate, key=lambda r: r.time_per_fit, default=None)
+
+
+def format_benchmark(results: list[BenchmarkResult]) -> str:
+    """Table of results, fastest first"""
+    lines = [
+        f"{'peak finder':<20}{'time (us)':>12}{'mean error':>12}"
+        f"{'max error':>12}{'failures':>10}"
+    ]
+    for r in sorted(results, key=lambda r: r.time_per_fit):
+        lines.append(
+            f"{r.name:<20}{1e6 * r.time_per_fit:>12.1f}{r.mean_error:>12.4g}"
+            f"{r.max_error:>12.4g}{r.failures:>10}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    for noise in [0.0, 0.1, 0.5]:
+        print(f"Noise = {noise}")
+        print(format_benchmark(benchmark_peak_finders(noise=noise)))
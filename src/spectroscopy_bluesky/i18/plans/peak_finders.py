@@ -0,0 +1,128 @@
+from collections.abc import Callable
+
+import numpy as np
+from numpy.typing import NDArray
+from scipy.interpolate import CubicSpline
+from scipy.optimize import curve_fit
+
+from spectroscopy_bluesky.i18.plans.curve_fitting import (
+    FitCurves,
+    gaussian_bounds_provider,
+    gaussian_estimate,
+    trial_gaussian,
+)
+
+"""
+Registry of functions to find the position of a peak from x and y values.
+Each peak finder takes arrays of x and y values and returns the x position of
+the peak. Peak finders can be used in a FitCurves callback with
+:class:`FitCurvesPeakFinder`, and compared using
+:func:`spectroscopy_bluesky.i18.plans.peak_finder_benchmark.benchmark_peak_finders`
+"""
+
+PeakFinder = Callable[[NDArray, NDArray], float]
+
+peak_finders: dict[str, PeakFinder] = {}
+
+
+def register_peak_finder(name: str):
+    """Decorator to add a peak finder function to the registry"""
+
+    def register(func: PeakFinder) -> PeakFinder:
+        peak_finders[name] = func
+        return func
+
+    return register
+
+
+def get_peak_finder(name: str) -> PeakFinder:
+    if name not in peak_finders:
+        raise ValueError(
+            f"Unknown peak finder {name}, should be one of {list(peak_finders)}"
+        )
+    return peak_finders[name]
+
+
+@register_peak_finder("argmax")
+def argmax_peak(xvals: NDArray, yvals: NDArray) -> float:
+    """Position of the largest y value"""
+    return float(np.asarray(xvals)[np.argmax(yvals)])
+
+
+@register_peak_finder("centroid")
+def centroid_peak(
+    xvals: NDArray, yvals: NDArray, threshold_fraction: float = 0.5
+) -> float:
+    """Centre of mass of the points above a fraction of the peak height
+    (after subtracting the minimum y value)"""
+    x = np.asarray(xvals, dtype=float)
+    y = np.asarray(yvals, dtype=float) - np.min(yvals)
+    use = y >= threshold_fraction * np.max(y)
+    return float(np.sum(x[use] * y[use]) / np.sum(y[use]))
+
+
+@register_peak_finder("parabola")
+def parabola_peak(xvals: NDArray, yvals: NDArray) -> float:
+    """Vertex of the parabola through the largest y value and its two neighbours
+    (argmax position if the largest value is at the end of the range)"""
+    x = np.asarray(xvals, dtype=float)
+    y = np.asarray(yvals, dtype=float)
+    i = int(np.argmax(y))
+    if i == 0 or i == len(y) - 1:
+        return float(x[i])
+    x0, x1, x2 = x[i - 1 : i + 2]
+    y0, y1, y2 = y[i - 1 : i + 2]
+    denom = (x0 - x1) * (x0 - x2) * (x1 - x2)
+    a = (x2 * (y1 - y0) + x1 * (y0 - y2) + x0 * (y2 - y1)) / denom
+    b = (x2**2 * (y0 - y1) + x1**2 * (y2 - y0) + x0**2 * (y1 - y2)) / denom
+    if a >= 0:
+        return float(x1)
+    return float(-b / (2 * a))
+
+
+@register_peak_finder("spline")
+def spline_peak(xvals: NDArray, yvals: NDArray) -> float:
+    """Maximum of cubic spline through the points (stationary point of the spline
+    closest to the largest y value)"""
+    x = np.asarray(xvals, dtype=float)
+    y = np.asarray(yvals, dtype=float)
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    spline = CubicSpline(x, y)
+    candidates = np.append(spline.derivative().roots(extrapolate=False), x)
+    return float(candidates[np.argmax(spline(candidates))])
+
+
+@register_peak_finder("gaussian")
+def gaussian_peak(xvals: NDArray, yvals: NDArray) -> float:
+    """Centre of Gaussian (:func:`trial_gaussian`) fitted with curve_fit, starting
+    from the closed form estimate"""
+    x = np.asarray(xvals, dtype=float)
+    y = np.asarray(yvals, dtype=float)
+    bounds = gaussian_bounds_provider(list(x), list(y))
+    try:
+        p0 = np.clip(gaussian_estimate(x, y)[0], bounds[0], bounds[1])
+    except ValueError:
+        p0 = None
+    param, _ = curve_fit(trial_gaussian, x, y, p0=p0, bounds=bounds)
+    return float(param[-1])
+
+
+@register_peak_finder("gaussian_estimate")
+def gaussian_estimate_peak(xvals: NDArray, yvals: NDArray) -> float:
+    """Centre of Gaussian from the closed form estimate (no iterative fit)"""
+    return float(gaussian_estimate(xvals, yvals)[0][-1])
+
+
+class FitCurvesPeakFinder(FitCurves):
+    """FitCurves callback that finds the peak of each curve using a registered
+    peak finder (results are [[peak position], None] for each curve, as for
+    FitCurvesMaxValue)"""
+
+    def __init__(self, peak_finder: str = "argmax"):
+        super().__init__()
+        self.peak_finder = peak_finder
+
+    def do_fitting(self, xvals, yvals):
+        peak = get_peak_finder(self.peak_finder)(np.asarray(xvals), np.asarray(yvals))
+        return [[peak], None]
@@ -2,6 +2,7 @@ import math
 
 import bluesky.plan_stubs as bps
 import bluesky.plans as bsp
+import bluesky.preprocessors as bpp
 import numpy as np
 from bluesky.preprocessors import subs_decorator
 from bluesky.protocols import Movable, Readable
@@ -9,13 +10,16 @@ from bluesky.protocols import Movable, Readable
 from spectroscopy_bluesky.i18.plans.curve_fitting import (
     FitCurves,
     FitCurvesMaxValue,
+    StreamingFitCurves,
     gaussian_bounds_provider,
+    gaussian_estimate,
     trial_gaussian,
 )
 from spectroscopy_bluesky.i18.plans.lookup_tables import (
     id_gap_lookup_table_column_names,
     load_lookuptable_curve,
 )
+from spectroscopy_bluesky.i18.plans.peak_finders import get_peak_finder
 
 fit_curve_callback_gaussian = FitCurves()
 fit_curve_callback_gaussian.fit_function = trial_gaussian
@@ -24,6 +28,13 @@ fit_curve_callback_gaussian.fit_function = trial_gaussian
 # set transform function to make x values relative before fitting
 fit_curve_callback_gaussian.bounds_provider = gaussian_bounds_provider
 
+# Gaussian fit refined with curve_fit, starting from the closed form estimate
+# (and from the previous row of the same scan for grid scans)
+fit_curve_callback_gaussian_estimate = FitCurves()
+fit_curve_callback_gaussian_estimate.fit_function = trial_gaussian
+fit_curve_callback_gaussian_estimate.estimator = gaussian_estimate
+fit_curve_callback_gaussian_estimate.warm_start = True
+
 fit_curve_callback_maxval = FitCurvesMaxValue()
 # fit_curve_callback_maxval.set_transform_function(normalise_xvals)
 
@@ -89,6 +100,256 @@ def estimate_next_gap_peak(fit_results: list[list[float]], bragg_angle: float) -
     return expected_peak
 
 
+def gap_scan_until_peak_found(
+    detector: Readable,
+    undulator_gap_device,
+    points,
+    curve_fit_callback: StreamingFitCurves,
+    md: dict | None = None,
+):
+    """Step scan of undulator gap over a list of points, stopping early once
+    the provisional peak from the curve fitting callback is well defined
+    (see :meth:`StreamingFitCurves.peak_found`). The callback needs to be
+    subscribed to the documents from this plan.
+
+    Args:
+        detector: detector to read at each point
+        undulator_gap_device: undulator gap (Movable and Readable)
+        points: undulator gap values
+        curve_fit_callback: callback used to fit the peak
+        md: metadata for the run
+
+    Returns:
+        int: number of points measured
+    """
+    _md = {
+        "detectors": [detector.name],
+        "motors": [undulator_gap_device.name],
+        "num_points": len(points),
+        "plan_name": "gap_scan_until_peak_found",
+        **(md or {}),
+    }
+
+    num_points = 0
+
+    @bpp.run_decorator(md=_md)
+    def inner_plan():
+        nonlocal num_points
+        for point in points:
+            yield from bps.mv(undulator_gap_device, point)
+            yield from bps.trigger_and_read([detector, undulator_gap_device])
+            num_points += 1
+            if curve_fit_callback.peak_found():
+                print(
+                    f"Peak found after {num_points} points : "
+                    f"{curve_fit_callback.peak_position:.4f} "
+                    f"+/- {curve_fit_callback.peak_uncertainty:.4f}"
+                )
+                break
+
+    yield from inner_plan()
+    return num_points
+
+
+def adaptive_gap_search(
+    detector: Readable,
+    undulator_gap_device,
+    gap_start: float,
+    gap_range: float,
+    tolerance: float,
+    coarse_points: int = 11,
+    refine_points: int = 7,
+    max_passes: int = 6,
+    peak_finder: str = "parabola",
+    md: dict | None = None,
+):
+    """Find the undulator gap giving the peak detector signal using a coarse to
+    fine search : a coarse scan over the full gap range, followed by scans over
+    smaller windows around the latest peak position, until the step size is less
+    than the tolerance. All points are measured in a single run.
+
+    Args:
+        detector: detector to read at each point
+        undulator_gap_device: undulator gap (Movable and Readable)
+        gap_start: first gap value of the coarse scan
+        gap_range: range of gap values of the coarse scan
+        tolerance: stop when the step between points is less than this
+        coarse_points: number of points in the coarse scan
+        refine_points: number of points in each refined scan. Each refined scan
+            covers +/- one step of the previous scan around the peak.
+        max_passes: maximum number of refined scans
+        peak_finder: name of peak finder used to find the peak from the
+            points measured so far (see :mod:`peak_finders`)
+        md: metadata for the run
+
+    Returns:
+        float: gap value of the peak
+    """
+    find_peak = get_peak_finder(peak_finder)
+    _md = {
+        "detectors": [detector.name],
+        "motors": [undulator_gap_device.name],
+        "plan_name": "adaptive_gap_search",
+        **(md or {}),
+    }
+    gaps: list[float] = []
+    values: list[float] = []
+    peak = gap_start + 0.5 * gap_range
+
+    def measure(points):
+        for point in points:
+            if any(np.isclose(point, gaps, rtol=0, atol=1e-3 * tolerance)):
+                continue
+            yield from bps.mv(undulator_gap_device, point)
+            reading = yield from bps.trigger_and_read([detector, undulator_gap_device])
+            det_name = [n for n in reading if n.startswith(detector.name)][0]
+            gaps.append(float(point))
+            values.append(float(reading[det_name]["value"]))
+
+    def current_peak() -> float:
+        order = np.argsort(gaps)
+        return find_peak(np.asarray(gaps)[order], np.asarray(values)[order])
+
+    @bpp.run_decorator(md=_md)
+    def inner_plan():
+        nonlocal peak
+        points = np.linspace(gap_start, gap_start + gap_range, coarse_points)
+        step = gap_range / (coarse_points - 1)
+        yield from measure(points)
+        peak = current_peak()
+        for _ in range(max_passes):
+            if step <= tolerance:
+                break
+            points = np.linspace(peak - step, peak + step, refine_points)
+            step = 2 * step / (refine_points - 1)
+            yield from measure(points)
+            peak = current_peak()
+        print(
+            f"Adaptive gap search : peak = {peak:.4f} (step = {step:.4g}) "
+            f"after {len(gaps)} points"
+        )
+
+    yield from inner_plan()
+    return peak
+
+
+def fly_gap_scan(
+    detector: Readable,
+    undulator_gap_device,
+    gap_start: float,
+    gap_end: float,
+    sweep_time: float | None = None,
+    read_period: float = 0.05,
+    md: dict | None = None,
+):
+    """Continuous scan of undulator gap : the gap is moved from the start to the
+    end position in a single move, and the detector and gap readback are read
+    repeatedly while the gap is moving. The peak can then be fitted from the
+    detector signal as a function of gap readback, by subscribing a curve
+    fitting callback to the documents from this plan.
+
+    The readings are polled by the plan (trigger_and_read, then wait for
+    read_period), not triggered by hardware, so the spacing of the points depends
+    on how quickly the RunEngine and detector respond rather than on the gap
+    position. Each point records the gap readback at the time it was read.
+
+    Args:
+        detector: detector to read during the move
+        undulator_gap_device: undulator gap (Movable and Readable)
+        gap_start: gap position at start of sweep
+        gap_end: gap position at end of sweep
+        sweep_time: time to sweep from start to end position (seconds). Sets the
+            velocity of the gap device for the duration of the sweep (original
+            velocity is restored afterwards). If None, the gap moves at its
+            current velocity.
+        read_period: time to wait between each reading (seconds)
+        md: metadata for the run
+
+    Raises:
+        ValueError: if sweep_time is set and the gap device has no velocity
+
+    Returns:
+        int: number of points measured
+    """
+    _md = {
+        "detectors": [detector.name],
+        "motors": [undulator_gap_device.name],
+        "plan_name": "fly_gap_scan",
+        **(md or {}),
+    }
+    velocity = getattr(undulator_gap_device, "velocity", None)
+    if sweep_time is None:
+        velocity = None
+    elif velocity is None:
+        raise ValueError(
+            f"Can not set sweep time : {undulator_gap_device.name} has no velocity"
+        )
+    original_velocity = None
+    num_points = 0
+
+    @bpp.run_decorator(md=_md)
+    def sweep():
+        nonlocal num_points
+        status = yield from bps.abs_set(
+            undulator_gap_device, gap_end, group="gap_sweep"
+        )
+        while not status.done:
+            yield from bps.trigger_and_read([detector, undulator_gap_device])
+            num_points += 1
+            yield from bps.sleep(read_period)
+        # final point at end of the sweep
+        yield from bps.wait(group="gap_sweep")
+        yield from bps.trigger_and_read([detector, undulator_gap_device])
+        num_points += 1
+
+    def inner_plan():
+        nonlocal original_velocity
+        yield from bps.mv(undulator_gap_device, gap_start)
+        if velocity is not None:
+            original_velocity = yield from bps.rd(velocity)
+            yield from bps.mv(velocity, abs(gap_end - gap_start) / sweep_time)
+        yield from sweep()
+
+    def restore_velocity():
+        if velocity is not None and original_velocity is not None:
+            yield from bps.mv(velocity, original_velocity)
+
+    yield from bpp.finalize_wrapper(inner_plan(), restore_velocity())
+    print(f"Gap sweep {gap_start:.4f} -> {gap_end:.4f} : {num_points} points")
+    return num_points
+
+
+# group for moves to the start position of the next gap scan
+NEXT_POSITION_GROUP = "next_gap_scan_position"
+
+
+def read_gap_position(undulator_gap_device):
+    """Read the current undulator gap position"""
+    msg = yield from bps.read(undulator_gap_device)
+    gap = msg[undulator_gap_device.name]["value"]
+    print(f"Current undulator gap position : {gap}")
+    return gap
+
+
+def move_before_close_run(plan, device: Movable, position: float, group: str):
+    """Start moving a device (without waiting for the move to finish) just
+    before the run in a plan is closed, i.e. after the last point has been
+    measured but before callbacks process the stop document.
+    The move can be waited for using bps.wait(group)"""
+    move_started = False
+
+    def insert_move(msg):
+        nonlocal move_started
+        if msg.command == "close_run" and not move_started:
+            move_started = True
+            return bpp.pchain(
+                bps.abs_set(device, position, group=group), bpp.single_gen(msg)
+            ), None
+        return None, None
+
+    return (yield from bpp.plan_mutator(plan, insert_move))
+
+
 def undulator_lookuptable_scan_autogap(
     bragg_start: float,
     bragg_step: float,
@@ -137,8 +398,38 @@ def undulator_lookuptable_scan(
     output_file: str | None = None,
     curve_fit_callback: FitCurves = fit_curve_callback_gaussian,
     *args,
+    stop_at_peak: bool = False,
+    adaptive_tolerance: float | None = None,
+    fly_sweep_time: float | None = None,
     **kwargs,
 ):
+    """
+    Keyword only parameters :
+
+    stop_at_peak -> stop each gap scan once the peak is found. The curve fit
+    callback needs to be a StreamingFitCurves with peak_tolerance set
+    (see :func:`gap_scan_until_peak_found`)
+    adaptive_tolerance -> if set, find each peak using a coarse to fine search
+    to this tolerance instead of a fixed gap scan (see :func:`adaptive_gap_search`).
+    The peak is found by the peak finder of the search; the points are not passed
+    to curve_fit_callback, so it does not produce any fit results.
+    fly_sweep_time -> if set, sweep the gap continuously over each gap range in this
+    time, reading the detector during the move (see :func:`fly_gap_scan`)
+    """
+    if stop_at_peak:
+        if adaptive_tolerance is not None or fly_sweep_time is not None:
+            raise ValueError(
+                "stop_at_peak can not be used with adaptive_tolerance or fly_sweep_time"
+            )
+        if (
+            not isinstance(curve_fit_callback, StreamingFitCurves)
+            or curve_fit_callback.peak_tolerance is None
+        ):
+            raise ValueError(
+                "stop_at_peak needs a StreamingFitCurves curve_fit_callback "
+                "with peak_tolerance set"
+            )
+
     # Generate undulator gap values to be used for each inner scan
     # (values are relative to the start position)
     gap_relative_points = np.linspace(0, gap_range, math.floor(gap_range / gap_step))
@@ -155,55 +446,81 @@ def undulator_lookuptable_scan(
 
     adjust_start_gap = True
 
-    # Move undulator to initial position
-    yield from bps.mov(undulator_gap_device, initial_gap_start)
+    # Move Bragg and undulator to initial positions (concurrently)
+    yield from bps.mv(
+        bragg_device, bragg_points[0], undulator_gap_device, initial_gap_start
+    )
+
+    # gap start is current position of undulator gap
+    gap_start = yield from read_gap_position(undulator_gap_device)
 
     # [bragg angle, gap value] for each angle in bragg_points
     fit_results: list[list[float]] = []
 
-    for bragg_angle in bragg_points:
-        print(f"Bragg angle : {bragg_angle}")
-        yield from bps.mv(bragg_device, bragg_angle)
-
-        # Determine start position for next gap scan
-        if use_last_peak and len(fit_results) > 0:
-            # start at last peak position
-            gap_start = fit_results[-1][1]
-
-            # Estimate the next start position from last two fitted peaks
-            if adjust_start_gap and len(fit_results) > 1:
-                expected_peak = estimate_next_gap_peak(fit_results, bragg_angle)
-
-                # start gap value to place expected peak position
-                # in middle of the gap scan range
-
-                start_gap = expected_peak - gap_range * 0.5
-                print(f"start gap value = {start_gap}")
-        else:
-            # gap start is current position of undulator gap
-            msg = yield from bps.read(undulator_gap_device)
-            gap_start = msg[undulator_gap_device.name]["value"]
-            print(f"Current undulator gap position : {gap_start}")
-
-        # set of undulator gap values to be scanned
-        gap_abs_points = gap_relative_points + gap_start + gap_offset
+    def gap_scan(gap_abs_points):
+        """Scan the undulator gap and return the fitted peak position"""
+        if adaptive_tolerance is not None:
+            return (
+                yield from adaptive_gap_search(
+                    detector,
+                    undulator_gap_device,
+                    gap_abs_points[0],
+                    gap_range,
+                    adaptive_tolerance,
+                )
+            )
 
         print(f"Undulator values : {gap_abs_points}")
 
         @subs_decorator(curve_fit_callback)
         def processing_decorated_plan(points):
-            msg = yield from bsp.list_scan([detector], (undulator_gap_device), points)
+            if fly_sweep_time is not None:
+                msg = yield from fly_gap_scan(
+                    detector,
+                    undulator_gap_device,
+                    points[0],
+                    points[-1],
+                    fly_sweep_time,
+                )
+            elif stop_at_peak:
+                msg = yield from gap_scan_until_peak_found(
+                    detector, undulator_gap_device, points, curve_fit_callback
+                )
+            else:
+                msg = yield from bsp.list_scan(
+                    [detector], (undulator_gap_device), points
+                )
             return msg
 
-        msg = yield from processing_decorated_plan(gap_abs_points)
+        yield from processing_decorated_plan(gap_abs_points)
 
         print(f"Fit results : {curve_fit_callback.results}")
 
-        # (fitted x values are relative to first point, so add the start gap position)
+        # (fitted x values are relative to first point,
+        # so add the start gap position)
         fit_result = curve_fit_callback.results[0][0][-1]
         # fit is relative to start position
         if fit_result < gap_abs_points[0] or fit_result > gap_abs_points[-1]:
             fit_result += gap_abs_points[0]
+        return fit_result
+
+    for index, bragg_angle in enumerate(bragg_points):
+        print(f"Bragg angle : {bragg_angle}")
+
+        # set of undulator gap values to be scanned
+        gap_abs_points = gap_relative_points + gap_start + gap_offset
+
+        next_bragg_angle = (
+            bragg_points[index + 1] if index + 1 < len(bragg_points) else None
+        )
+        scan_plan = gap_scan(gap_abs_points)
+        if next_bragg_angle is not None:
+            # start moving to the next Bragg angle once the last gap point has been
+            # measured, so the move overlaps with fitting the peak
+            scan_plan = move_before_close_run(
+                scan_plan, bragg_device, next_bragg_angle, NEXT_POSITION_GROUP
+            )
+        fit_result = yield from scan_plan
 
         fit_results.append([bragg_angle, fit_result])
 
@@ -217,4 +534,31 @@ def undulator_lookuptable_scan(
             with open(output_file, "a") as myfile:
                 myfile.write(f"{bragg_angle:.6f}\t{fit_result:.6f}\n")
 
+        if next_bragg_angle is None:
+            break
+
+        # Determine start position for next gap scan
+        if use_last_peak:
+            # start at last peak position
+            gap_start = fit_results[-1][1]
+
+            # Estimate the next start position from last two fitted peaks
+            if adjust_start_gap and len(fit_results) > 1:
+                expected_peak = estimate_next_gap_peak(fit_results, next_bragg_angle)
+
+                # start gap value to place expected peak position
+                # in middle of the gap scan range
+                gap_start = expected_peak - gap_range * 0.5
+                print(f"start gap value = {gap_start}")
+
+            # move gap to start of next scan while Bragg is still moving
+            yield from bps.abs_set(
+                undulator_gap_device, gap_start + gap_offset, group=NEXT_POSITION_GROUP
+            )
+
+        yield from bps.wait(group=NEXT_POSITION_GROUP)
+
+        if not use_last_peak:
+            gap_start = yield from read_gap_position(undulator_gap_device)
+
     return fit_results
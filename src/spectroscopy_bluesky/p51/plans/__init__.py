@@ -13,6 +13,7 @@ from .turbo_slit_fly_scans import (
     fly_scan_ts,
     fly_sweep,
     fly_sweep_both_ways,
+    fly_sweep_continuous,
     trajectory_fly_scan,
 )
 
@@ -20,6 +21,7 @@ __all__ = [
     "fly_scan_ts",
     "fly_sweep",
     "fly_sweep_both_ways",
+    "fly_sweep_continuous",
     "seq_table_non_linear",
     "seq_table_uniform_scan",
     "seq_table_two_panda_scan",
@@ -1,6 +1,17 @@
+import asyncio
+import logging
+from functools import partial
+
 import bluesky.plan_stubs as bps
+import numpy as np
 from bluesky.utils import MsgGenerator
-from ophyd_async.core import Settings, YamlSettingsProvider
+from numpy.typing import ArrayLike
+from ophyd_async.core import (
+    Settings,
+    SignalRW,
+    YamlSettingsProvider,
+    set_and_wait_for_value,
+)
 from ophyd_async.epics.core import epics_signal_rw
 from ophyd_async.fastcs.panda import (
     HDFPanda,
@@ -13,6 +24,10 @@ from ophyd_async.plan_stubs import (
     store_settings,
 )
 
+from spectroscopy_bluesky.common.panda_write_cache import panda_write_cache
+
+LOGGER = logging.getLogger(__name__)
+
 # Motor resolution used to conert between user position and motor encoder counts
 MRES = -1 / 10000
 
@@ -35,20 +50,90 @@ def get_encoder_counts(user_position: float, offset=ENCODER_OFFSET_COUNTS) -> fl
     return user_position / MRES + offset
 
 
-def setup_trajectory_scan_pvs(prefix: str = "BL51P-MO-STEP-06"):
+def get_user_position(encoder_counts: ArrayLike, offset=ENCODER_OFFSET_COUNTS):
+    """Convert from motor encoder counts to user position
+    (inverse of :func:`get_encoder_counts`).
+
+    Args:
+        encoder_counts : motor encoder counts (single value or array)
+        offset (optional): Count offset that was added to the encoder counts.
+            Defaults to ENCODER_OFFSET_COUNTS (=0).
+
+    Returns:
+        user position
+    """
+    return (np.asarray(encoder_counts) - offset) * MRES
+
+
+# Trajectory scan controller signals (CS axis label, profile CS name) for each
+# RunEngine event loop and PV prefix. Kept between scans so the signals only need
+# to be created once.
+_trajectory_scan_signals: dict[
+    asyncio.AbstractEventLoop, dict[str, tuple[SignalRW[str], SignalRW[str]]]
+] = {}
+
+
+async def _running_loop() -> asyncio.AbstractEventLoop:
+    return asyncio.get_running_loop()
+
+
+def event_loop_cache(
+    caches: dict[asyncio.AbstractEventLoop, dict],
+) -> MsgGenerator[dict]:
+    """Return the cache from caches for the event loop of the RunEngine running the
+    plan (signals can only be used on the event loop they were connected on).
+    Caches for closed event loops are removed."""
+    tasks = yield from bps.wait_for([_running_loop])
+    loop = next(iter(tasks)).result()
+    for old_loop in [lp for lp in caches if lp.is_closed()]:
+        del caches[old_loop]
+    return caches.setdefault(loop, {})
+
+
+def setup_trajectory_scan_pvs(
+    prefix: str = "BL51P-MO-STEP-06",
+    cs_axis: str = "X",
+    cs_profile_name: str = "PMAC6CS3",
+    timeout: float = 5.0,
+) -> MsgGenerator:
     """
     Set PV values on trajectory scan controller needed for scan to work
     (axis label to X, and profile name to PMAC6CS3)
+
+    The current values are read first and only the PVs that differ are written;
+    each write then waits for the readback to show the new value (rather than
+    sleeping for a fixed time). Nothing is written if both PVs are already set.
+
+    Args:
+        prefix: PV prefix of the trajectory scan controller
+        cs_axis: CS axis label to set
+        cs_profile_name: name of the coordinate system profile to set
+        timeout: how long to wait for each readback to match (seconds)
     """
-    cs_axis_label = epics_signal_rw(str, prefix + ":M4:CsAxis", name="cs_axis_label")
-    cs_profile_name = epics_signal_rw(
-        str, prefix + ":ProfileCsName", name="cs_profile_name"
-    )
-    yield from ensure_connected(cs_axis_label, cs_profile_name)
+    signals_cache = yield from event_loop_cache(_trajectory_scan_signals)
+    if prefix not in signals_cache:
+        signals_cache[prefix] = (
+            epics_signal_rw(str, prefix + ":M4:CsAxis", name="cs_axis_label"),
+            epics_signal_rw(str, prefix + ":ProfileCsName", name="cs_profile_name"),
+        )
+    cs_axis_label, cs_profile_name_signal = signals_cache[prefix]
+    yield from ensure_connected(cs_axis_label, cs_profile_name_signal)
+
+    # set the CS axis label and profile names, if they are not already correct
+    setters = []
+    for signal, value in (
+        (cs_axis_label, cs_axis),
+        (cs_profile_name_signal, cs_profile_name),
+    ):
+        current_value = yield from bps.rd(signal)
+        if current_value != value:
+            LOGGER.info(f"Setting {signal.source} from '{current_value}' to '{value}'")
+            setters.append(
+                partial(set_and_wait_for_value, signal, value, timeout=timeout)
+            )
 
-    # set the CS axis label and profile names
-    yield from bps.mv(cs_axis_label, "X", cs_profile_name, "PMAC6CS3")
-    yield from bps.sleep(0.5)  # wait for the records to update
+    if setters:
+        yield from bps.wait_for(setters)
 
 
 def restore_panda_settings(
@@ -96,6 +181,8 @@ def plan_restore_dataset_settings(panda: HDFPanda, name: str):
     }
     new_dataset = Settings(panda, settings_dict)
     yield from apply_settings(new_dataset)
+    # settings have changed outside of the write cache
+    panda_write_cache.invalidate(panda)
 
 
 def plan_restore_settings(panda: HDFPanda, name: str):
@@ -105,3 +192,5 @@ def plan_restore_settings(panda: HDFPanda, name: str):
     )
     settings = yield from retrieve_settings(provider, name, panda)
     yield from apply_panda_settings(settings)
+    # settings have changed outside of the write cache
+    panda_write_cache.invalidate(panda)
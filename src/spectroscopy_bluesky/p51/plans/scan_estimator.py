@@ -0,0 +1,302 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .seq_table_scans import (
+    calculate_energy_scan_angles,
+    create_position_seq_table,
+    create_sweep_spec,
+    sweep_capture_positions,
+)
+
+"""
+Dry-run estimates for the p51 fly and sequence table scans.
+The scan spec and sequence table are generated in the same way as in the
+plans, but no devices are used, so the estimates can be made before a scan is
+queued.
+"""
+
+# Maximum number of rows in a PandA sequence table
+SEQ_TABLE_MAX_ROWS = 4096
+
+# Minimum time between triggers the panda can capture (livetime + deadtime)
+MIN_TRIGGER_INTERVAL = 2e-5
+
+
+@dataclass
+class ScanEstimate:
+    """Estimated timing, triggering and data volume for a fly scan.
+    Times are in seconds."""
+
+    scan_name: str
+    number_of_sweeps: int
+    triggers_per_sweep: int
+    total_triggers: int
+    panda_capture_events: int
+    sweep_time: float
+    ramp_time: float
+    turnaround_time: float
+    data_volume_bytes: int
+    seq_table_rows: int = 0
+    seq_table_repeats: int = 0
+    warnings: list[str] = field(default_factory=list)
+
+    @property
+    def total_turnaround_time(self) -> float:
+        return (self.number_of_sweeps - 1) * self.turnaround_time
+
+    @property
+    def total_duration(self) -> float:
+        """Ramp up, all the sweeps and turnarounds, ramp down"""
+        return (
+            2 * self.ramp_time
+            + self.number_of_sweeps * self.sweep_time
+            + self.total_turnaround_time
+        )
+
+    @property
+    def overhead_fraction(self) -> float:
+        """Fraction of total duration not spent sweeping over the scan range"""
+        if self.total_duration == 0:
+            return 0.0
+        return 1 - self.number_of_sweeps * self.sweep_time / self.total_duration
+
+
+def estimate_ramp_time(
+    velocity: float, acceleration_time: float, max_velocity: float | None = None
+) -> float:
+    """Time for motor to accelerate from rest to velocity
+    (the motor acceleration time is the time to reach max velocity).
+
+    Args:
+        velocity: velocity during the sweep
+        acceleration_time: motor acceleration time
+        max_velocity: motor maximum velocity. If None, assume the sweep is
+            at maximum velocity
+
+    Returns:
+        float: ramp time
+    """
+    if max_velocity is None or max_velocity == 0:
+        return acceleration_time
+    return acceleration_time * abs(velocity) / max_velocity
+
+
+def data_volume(num_events: int, num_datasets: int, bytes_per_value: int = 8) -> int:
+    """Size of captured data (bytes), excluding HDF5 file overhead"""
+    return num_events * num_datasets * bytes_per_value
+
+
+def _motion_times(
+    distance: float,
+    sweep_time: float,
+    ramp_time: float | None,
+    turnaround_time: float | None,
+    acceleration_time: float,
+    max_velocity: float | None,
+) -> tuple[float, float]:
+    """Ramp and turnaround times : use the values if set, otherwise estimate them
+    from the acceleration (turnaround = decelerate to rest and accelerate back)"""
+    velocity = distance / sweep_time if sweep_time > 0 else 0.0
+    estimated_ramp = estimate_ramp_time(velocity, acceleration_time, max_velocity)
+    if ramp_time is None:
+        ramp_time = estimated_ramp
+    if turnaround_time is None:
+        turnaround_time = 2 * estimated_ramp
+    return ramp_time, turnaround_time
+
+
+def _check_estimate(estimate: ScanEstimate) -> ScanEstimate:
+    if estimate.seq_table_rows > SEQ_TABLE_MAX_ROWS:
+        estimate.warnings.append(
+            f"Sequence table needs {estimate.seq_table_rows} rows, "
+            f"maximum is {SEQ_TABLE_MAX_ROWS}"
+        )
+    if estimate.total_triggers > estimate.panda_capture_events:
+        estimate.warnings.append(
+            f"{estimate.total_triggers} triggers, but panda is only prepared to "
+            f"capture {estimate.panda_capture_events} events"
+        )
+    if estimate.triggers_per_sweep > 0:
+        trigger_interval = estimate.sweep_time / estimate.triggers_per_sweep
+        if trigger_interval < MIN_TRIGGER_INTERVAL:
+            estimate.warnings.append(
+                f"Average time between triggers ({trigger_interval:.2e} sec) "
+                f"is less than {MIN_TRIGGER_INTERVAL} sec"
+            )
+    return estimate
+
+
+def estimate_seq_table_position_scan(
+    start: float,
+    stop: float,
+    time_per_sweep: float,
+    capture_positions: NDArray,
+    num_trajectory_points: int = 10,
+    add_sweep_triggers: bool = False,
+    number_of_sweeps: int = 4,
+    ramp_time: float | None = None,
+    turnaround_time: float | None = None,
+    acceleration_time: float = 0.0,
+    max_velocity: float | None = None,
+    num_capture_datasets: int = 4,
+    scan_name: str = "seq_table_position_scan",
+) -> ScanEstimate:
+    """Estimate for :func:`seq_table_position_scan` (parameters are the same as
+    for the plan).
+
+    Args:
+        ramp_time: ramp up time of the trajectory. Estimated from
+            acceleration_time and max_velocity if not set.
+        turnaround_time: time to reverse direction between sweeps. Estimated from
+            acceleration_time and max_velocity if not set.
+        acceleration_time: motor acceleration time
+        max_velocity: motor maximum velocity
+        num_capture_datasets: number of datasets captured by the panda for each
+            trigger
+        scan_name: name of scan
+    """
+    spec = create_sweep_spec(
+        "motor",
+        start,
+        stop,
+        time_per_sweep / num_trajectory_points,
+        num_trajectory_points,
+        number_of_sweeps,
+    )
+    sweep_time = float(np.sum(spec.frames().duration)) / number_of_sweeps
+
+    try:
+        seq_table, num_seqtable_repeats = create_position_seq_table(
+            capture_positions, number_of_sweeps, add_sweep_triggers
+        )
+        seq_table_rows = len(seq_table)
+    except ValueError:
+        # Too many rows for a sequence table - use the same rows as
+        # create_position_seq_table (sweep start and end triggers are set on
+        # these rows, no rows are added for them)
+        positions, num_seqtable_repeats = sweep_capture_positions(
+            capture_positions, number_of_sweeps
+        )
+        seq_table_rows = positions.size
+
+    ramp_time, turnaround_time = _motion_times(
+        abs(stop - start),
+        sweep_time,
+        ramp_time,
+        turnaround_time,
+        acceleration_time,
+        max_velocity,
+    )
+
+    triggers_per_sweep = capture_positions.size
+    total_triggers = triggers_per_sweep * number_of_sweeps
+    # the sequence table is repeated until all the sweeps are done, and the panda
+    # captures one event for each position trigger of each sweep (for an odd
+    # number of sweeps, the reverse sweep of the last repeat is not made)
+    panda_capture_events = capture_positions.size * number_of_sweeps
+
+    return _check_estimate(
+        ScanEstimate(
+            scan_name=scan_name,
+            number_of_sweeps=number_of_sweeps,
+            triggers_per_sweep=triggers_per_sweep,
+            total_triggers=total_triggers,
+            panda_capture_events=panda_capture_events,
+            sweep_time=sweep_time,
+            ramp_time=ramp_time,
+            turnaround_time=turnaround_time,
+            data_volume_bytes=data_volume(
+                min(total_triggers, panda_capture_events), num_capture_datasets
+            ),
+            seq_table_rows=seq_table_rows,
+            seq_table_repeats=num_seqtable_repeats,
+        )
+    )
+
+
+def estimate_seq_table_uniform_scan(
+    start: float,
+    stop: float,
+    stepsize: float,
+    time_per_sweep: float,
+    num_trajectory_points: int = 10,
+    number_of_sweeps: int = 4,
+    **kwargs,
+) -> ScanEstimate:
+    """Estimate for :func:`seq_table_uniform_scan`
+    (kwargs are passed to :func:`estimate_seq_table_position_scan`)"""
+    capture_positions = np.arange(start, stop + 0.5 * stepsize, stepsize)
+    return estimate_seq_table_position_scan(
+        start,
+        stop,
+        time_per_sweep,
+        capture_positions,
+        num_trajectory_points=num_trajectory_points,
+        number_of_sweeps=number_of_sweeps,
+        scan_name="seq_table_uniform_scan",
+        **kwargs,
+    )
+
+
+def estimate_seq_table_energy_scan(
+    element: str,
+    edge: str,
+    time_per_sweep: float,
+    number_of_sweeps: int = 1,
+    **kwargs,
+) -> ScanEstimate:
+    """Estimate for :func:`seq_table_energy_scan`
+    (kwargs are passed to :func:`estimate_seq_table_position_scan`)"""
+    angle = calculate_energy_scan_angles(element, edge)
+    return estimate_seq_table_position_scan(
+        angle[0],
+        angle[-1],
+        time_per_sweep,
+        angle,
+        num_trajectory_points=len(angle),
+        number_of_sweeps=number_of_sweeps,
+        scan_name="seq_table_energy_scan",
+        **kwargs,
+    )
+
+
+def estimate_trajectory_fly_scan(
+    start: float,
+    stop: float,
+    num: int,
+    duration: float,
+    ramp_time: float | None = None,
+    acceleration_time: float = 0.0,
+    max_velocity: float | None = None,
+    num_capture_datasets: int = 4,
+) -> ScanEstimate:
+    """Estimate for :func:`trajectory_fly_scan` (single sweep, PCOMP triggering).
+
+    Args:
+        ramp_time: ramp up time of the trajectory. Estimated from
+            acceleration_time and max_velocity if not set.
+        acceleration_time: motor acceleration time
+        max_velocity: motor maximum velocity
+        num_capture_datasets: number of datasets captured by the panda for each
+            trigger
+    """
+    spec = create_sweep_spec("motor", start, stop, float(duration), num, 1)
+    sweep_time = float(np.sum(spec.frames().duration))
+    ramp_time, _ = _motion_times(
+        abs(stop - start), sweep_time, ramp_time, 0, acceleration_time, max_velocity
+    )
+    return _check_estimate(
+        ScanEstimate(
+            scan_name="trajectory_fly_scan",
+            number_of_sweeps=1,
+            triggers_per_sweep=num,
+            total_triggers=num,
+            panda_capture_events=num,
+            sweep_time=sweep_time,
+            ramp_time=ramp_time,
+            turnaround_time=0.0,
+            data_volume_bytes=data_volume(num, num_capture_datasets),
+        )
+    )
@@ -1,4 +1,5 @@
 import math as mt  # noqa: I001
+import asyncio
 from typing import Any
 import logging
 from collections.abc import Sequence
@@ -19,6 +20,7 @@ from ophyd_async.core import (
     StrictEnum,
     SubsetEnum,
     SupersetEnum,
+    SignalR,
 )
 from ophyd_async.epics.motor import Motor
 from ophyd_async.epics.pmac import (
@@ -27,6 +29,9 @@ from ophyd_async.epics.pmac import (
 )
 from ophyd_async.fastcs.panda import (
     HDFPanda,
+    PandaBitMux,
+    PandaTimeUnits,
+    SeqBlock,
     SeqTable,
     SeqTableInfo,
     StaticSeqTableTriggerLogic,
@@ -36,6 +41,23 @@ from ophyd_async.epics.core import epics_signal_r
 from scanspec.specs import Fly, Line
 from collections.abc import Callable
 
+from spectroscopy_bluesky.common.array_metadata import (
+    externalise_arrays,
+    record_arrays,
+)
+from spectroscopy_bluesky.common.adaptive_flush import (
+    AdaptiveFlushPolicy,
+    collect_while_completing,
+)
+from spectroscopy_bluesky.common.gap_following import (
+    GapFollower,
+    collect_while_following,
+)
+from spectroscopy_bluesky.common.lookup_tables import lookup_table_cache
+from spectroscopy_bluesky.common.panda_write_cache import (
+    PandaWriteCache,
+    panda_write_cache,
+)
 from spectroscopy_bluesky.common.quantity_conversion import (
     si_111_lattice_spacing,
     energy_to_bragg_angle,
@@ -46,12 +68,10 @@ from spectroscopy_bluesky.p51.plans.sequence_table import (
     SpectrumBasedTrigger,
 )
 
-from spectroscopy_bluesky.common.xas_scans import (
-    XasScanParameters,
-    XasScanPointGenerator,
-)
+from spectroscopy_bluesky.common.xas_scans import xas_energy_grid
 
 from .common import (
+    event_loop_cache,
     get_encoder_counts,
     setup_trajectory_scan_pvs,
 )
@@ -59,13 +79,80 @@ from .common import (
 LOGGER = logging.getLogger(__name__)
 
 
+class _StaticSeqTableTriggerLogic(StaticSeqTableTriggerLogic):
+    """For controlling the PandA `SeqBlock` when flyscanning.
+
+    Same as StaticSeqTableTriggerLogic, but the prescale, repeats and table are
+    written through a :class:`PandaWriteCache` so unchanged values are not
+    written again. The enable signal is always set, since kickoff changes it.
+    """
+
+    def __init__(
+        self, seq: SeqBlock, write_cache: PandaWriteCache = panda_write_cache
+    ) -> None:
+        super().__init__(seq)
+        self.write_cache = write_cache
+
+    async def prepare(self, value: SeqTableInfo):
+        await asyncio.gather(
+            self.write_cache.set(self.seq.prescale_units, PandaTimeUnits.US),
+            self.seq.enable.set(PandaBitMux.ZERO),
+        )
+        await self.write_cache.set_all(
+            {
+                self.seq.prescale: value.prescale_as_us,
+                self.seq.repeats: value.repeats,
+                self.seq.table: value.sequence_table,
+            }
+        )
+
+
+# Map from datatype name used in readable_pvs to the datatype of the signal
+pv_datatype_map = {
+    "bool": bool,
+    "int": int,
+    "float": float,
+    "str": str,
+    "EnumTypes": EnumTypes,
+    "Array1D[np.bool_]": Array1D[np.bool_],
+    "Array1D[np.int8]": Array1D[np.int8],
+    "Array1D[np.uint8]": Array1D[np.uint8],
+    "Array1D[np.int16]": Array1D[np.int16],
+    "Array1D[np.uint16]": Array1D[np.uint16],
+    "Array1D[np.int32]": Array1D[np.int32],
+    "Array1D[np.uint32]": Array1D[np.uint32],
+    "Array1D[np.int64]": Array1D[np.int64],
+    "Array1D[np.uint64]": Array1D[np.uint64],
+    "Array1D[np.float32]": Array1D[np.float32],
+    "Array1D[np.float64]": Array1D[np.float64],
+    "np.ndarray": np.ndarray,
+    "Sequence[str]": Sequence[str],
+    "Sequence[StrictEnum]": Sequence[StrictEnum],
+    "Sequence[SubsetEnum]": Sequence[SubsetEnum],
+    "Sequence[SupersetEnum]": Sequence[SupersetEnum],
+    "Table": Table,
+}
+
+# Signals used by prepare_pv_monitoring, for each RunEngine event loop, keyed by
+# PV name, datatype name and signal name.
+_monitored_signals: dict[
+    asyncio.AbstractEventLoop, dict[tuple[str, str, str], SignalR]
+] = {}
+
+
+def monitored_signals_cache() -> MsgGenerator[dict[tuple[str, str, str], SignalR]]:
+    """Return the monitored signals cache for the event loop of the RunEngine
+    running the plan (caches for closed event loops are removed)"""
+    return (yield from event_loop_cache(_monitored_signals))
+
+
 def prepare_pv_monitoring(readable_pvs: dict[str, Any]) -> MsgGenerator:
     """
     Prepare and monitor EPICS process variables (PVs) from a configuration dictionary.
 
     This generator function iterates over a dictionary describing readable PVs,
-    creates EPICS signal objects with the appropriate data types, ensures they are
-    connected, and starts monitoring them.
+    creates EPICS signal objects with the appropriate data types, connects them
+    all concurrently, and starts monitoring them.
 
     Args:
         readable_pvs : dict[str, Any]
@@ -79,50 +166,46 @@ def prepare_pv_monitoring(readable_pvs: dict[str, Any]) -> MsgGenerator:
 
 
     Notes:
-    - Currently supports a limited set of data types via `datatype_map`.
+    - Currently supports a limited set of data types via `pv_datatype_map`.
+    - Signals are cached (by PV name, datatype and name in readable_pvs) and reused
+      in later scans run in the same event loop, so they only need to be created
+      and connected once. Entries with the same PV each have their own signal.
     """
-    datatype_map = {
-        "bool": bool,
-        "int": int,
-        "float": float,
-        "str": str,
-        "EnumTypes": EnumTypes,
-        "Array1D[np.bool_]": Array1D[np.bool_],
-        "Array1D[np.int8]": Array1D[np.int8],
-        "Array1D[np.uint8]": Array1D[np.uint8],
-        "Array1D[np.int16]": Array1D[np.int16],
-        "Array1D[np.uint16]": Array1D[np.uint16],
-        "Array1D[np.int32]": Array1D[np.int32],
-        "Array1D[np.uint32]": Array1D[np.uint32],
-        "Array1D[np.int64]": Array1D[np.int64],
-        "Array1D[np.uint64]": Array1D[np.uint64],
-        "Array1D[np.float32]": Array1D[np.float32],
-        "Array1D[np.float64]": Array1D[np.float64],
-        "np.ndarray": np.ndarray,
-        "Sequence[str]": Sequence[str],
-        "Sequence[StrictEnum]": Sequence[StrictEnum],
-        "Sequence[SubsetEnum]": Sequence[SubsetEnum],
-        "Sequence[SupersetEnum]": Sequence[SupersetEnum],
-        "Table": Table,
-    }
+    signals_cache = yield from monitored_signals_cache()
+    pv_signals: dict[str, SignalR] = {}
     for pv_name, pv_config in readable_pvs.items():
         datatype_str = pv_config["pv_datatype"].strip()
-        if datatype_str not in datatype_map:
+        if datatype_str not in pv_datatype_map:
             raise ValueError(f"Unsupported datatype: {datatype_str}")
-        datatype = datatype_map[datatype_str]
-
-        pv_signal = epics_signal_r(
-            datatype,
-            pv_config["read_pv"].strip(),
-            name=pv_name,
-        )
+        read_pv = pv_config["read_pv"].strip()
+
+        key = (read_pv, datatype_str, pv_name)
+        if key not in signals_cache:
+            signals_cache[key] = epics_signal_r(
+                pv_datatype_map[datatype_str], read_pv, name=pv_name
+            )
+        pv_signals[pv_name] = signals_cache[key]
+
+    # connect all the signals concurrently (already connected signals return
+    # immediately)
+    try:
+        yield from ensure_connected(*pv_signals.values())
+    except Exception as e:
+        raise RuntimeError(f"Failed to connect PVs {list(pv_signals)}") from e
+
+    for pv_name, pv_signal in pv_signals.items():
+        yield from bps.monitor(pv_signal, name=pv_name)
 
-        try:
-            yield from ensure_connected(pv_signal)
-        except Exception as e:
-            raise RuntimeError(f"Failed to connect PV '{pv_name}'") from e
 
-        yield from bps.monitor(pv_signal, name=pv_name)
+def seq_table_trigger_info(seq_table: SeqTable) -> TriggerInfo:
+    """TriggerInfo used to prepare a panda for capturing data from a sequence table
+    (one event for each row of the table)"""
+    return TriggerInfo(
+        number_of_events=len(seq_table),
+        trigger=DetectorTrigger.EXTERNAL_LEVEL,
+        livetime=1e-5,
+        deadtime=1e-5,
+    )
 
 
 def prepare_seq_table(
@@ -158,15 +241,10 @@ def prepare_seq_table(
     )
 
     seqtable_flyer = StandardFlyer(
-        StaticSeqTableTriggerLogic(panda.seq[seq_table_number])
+        _StaticSeqTableTriggerLogic(panda.seq[seq_table_number])
     )
 
-    trigger_info = TriggerInfo(
-        number_of_events=len(seq_table),
-        trigger=DetectorTrigger.EXTERNAL_LEVEL,
-        livetime=1e-5,
-        deadtime=1e-5,
-    )
+    trigger_info = seq_table_trigger_info(seq_table)
 
     def inner_plan():
         if prepare_panda:
@@ -189,6 +267,7 @@ def seq_table_non_linear(
     number_of_sweeps: int = 1,
     readable_pvs: dict[str, Any] | None = None,
     metadata: dict[str, Any] | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
     # Start the plan by loading the saved design for this scan
 
@@ -216,9 +295,24 @@ def seq_table_non_linear(
         num_trajectory_points=len(angle),
         number_of_sweeps=number_of_sweeps,
         scan_params_dict=scan_params_dict,
+        flush_policy=flush_policy,
     )
 
 
+def calculate_energy_scan_angles(element: str, edge: str) -> NDArray:
+    """Calculate Bragg angles (Si111) for the XAS energy grid of an element and edge
+    (grid from :func:`xas_energy_grid`, using default scan parameters)
+
+    Args:
+        element: element name (Fe, Mn etc)
+        edge: edge name (K, L1 etc)
+
+    Returns:
+        NDArray: Bragg angle (degrees) for each energy point
+    """
+    return energy_to_bragg_angle(si_111_lattice_spacing, xas_energy_grid(element, edge))
+
+
 def seq_table_energy_scan(
     element: str,
     edge: str,
@@ -228,15 +322,20 @@ def seq_table_energy_scan(
     number_of_sweeps: int = 1,
     readable_pvs: dict[str, Any] | None = None,
     metadata: dict[str, Any] | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
+    undulator_gap: Motor | None = None,
+    gap_lookup_table: str | None = None,
+    gap_deadband: float = 0.01,
 ) -> MsgGenerator:
+    """Fly scan of Bragg angle over the XAS energy grid for an element and edge.
+
+    If undulator_gap and gap_lookup_table are set, the undulator gap follows the
+    Bragg angle during the sweeps, using gap values interpolated from the lookup
+    table (see :class:`GapFollower`). Bragg angles outside of the range of the
+    table use the gap for the nearest end of the table.
+    """
     # Generate triggers
-    params = XasScanParameters(element, edge)
-    params.set_from_element_edge()
-    params.set_abc_from_gaf()
-    # params.exafsTimeType = "constant time"
-    gen = XasScanPointGenerator(params)
-    grid = gen.calculate_energy_time_grid()
-    angle = energy_to_bragg_angle(si_111_lattice_spacing, grid[:, 0])
+    angle = calculate_energy_scan_angles(element, edge)
 
     scan_params_dict = {
         "scan_name": "seq_table_energy_scan",
@@ -246,6 +345,22 @@ def seq_table_energy_scan(
         "metadata": metadata,
     }
 
+    gap_follower = None
+    if undulator_gap is not None and gap_lookup_table is not None:
+        gap_follower = GapFollower(
+            undulator_gap,
+            motor,
+            lookup_table_cache.curve(gap_lookup_table),
+            deadband=gap_deadband,
+            angle_limits=lookup_table_cache.bragg_range(gap_lookup_table),
+        )
+        scan_params_dict.update(
+            {
+                "gap_lookup_table": gap_lookup_table,
+                "gap_positions": gap_follower.gap_profile(angle),
+            }
+        )
+
     yield from seq_table_position_scan(
         angle[0],
         angle[-1],
@@ -256,6 +371,8 @@ def seq_table_energy_scan(
         num_trajectory_points=len(angle),
         number_of_sweeps=number_of_sweeps,
         scan_params_dict=scan_params_dict,
+        flush_policy=flush_policy,
+        gap_follower=gap_follower,
     )
 
 
@@ -273,6 +390,7 @@ def seq_table_two_panda_scan(
     number_of_sweeps: int = 4,
     readable_pvs: dict[str, Any] | None = None,
     metadata: dict[str, Any] | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
     # setup a second seq table for 'spectrum based' triggering
     panda_dict = {}
@@ -311,6 +429,7 @@ def seq_table_two_panda_scan(
         number_of_sweeps=number_of_sweeps,
         panda_dict=panda_dict,
         scan_params_dict=scan_params_dict,
+        flush_policy=flush_policy,
     )
 
 
@@ -330,6 +449,7 @@ def seq_table_uniform_scan(
     panda_dict: dict[HDFPanda, list[Callable[[], MsgGenerator]]] | None = None,
     readable_pvs: dict[str, Any] | None = None,
     metadata: dict[str, Any] | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
 
     capture_positions = np.arange(start, stop + 0.5 * stepsize, stepsize)
@@ -371,36 +491,49 @@ def seq_table_uniform_scan(
         turnaround_time=turnaround_time,
         panda_dict=panda_dict,
         scan_params_dict=scan_params_dict,
+        flush_policy=flush_policy,
     )
 
 
-def seq_table_position_scan(
+def create_sweep_spec(
+    motor: Any,
     start: float,
     stop: float,
-    time_per_sweep: float,
-    capture_positions: NDArray,
-    motor: Motor,
-    panda: HDFPanda,
-    num_trajectory_points: int = 10,
-    add_sweep_triggers: bool = False,
-    number_of_sweeps: int = 4,
-    panda_dict: dict[HDFPanda, list[Callable[[], MsgGenerator]]] | None = None,
-    **kwargs: Any,
-) -> MsgGenerator:
-
-    time_per_traj_point = time_per_sweep / num_trajectory_points
-
-    print(
-        f"Num trajectorypoints : {num_trajectory_points}, "
-        f"time per traj point : {time_per_traj_point}"
-    )
+    time_per_traj_point: float,
+    num_trajectory_points: int,
+    number_of_sweeps: int,
+) -> Fly:
+    """Create scan spec for back-and-forth sweeps of a motor between
+    start and stop positions.
 
-    # Prepare motor info using trajectory scanning
-    spec = Fly(
+    Args:
+        motor: motor (or axis name) to be moved
+        start: start position of first sweep
+        stop: end position of first sweep
+        time_per_traj_point: time per trajectory point (seconds)
+        num_trajectory_points: number of trajectory points per sweep
+        number_of_sweeps: number of sweeps (alternating direction)
+    """
+    return Fly(
         time_per_traj_point
         @ (number_of_sweeps * ~Line(motor, start, stop, num_trajectory_points))
     )
 
+
+def sweep_capture_positions(
+    capture_positions: NDArray, number_of_sweeps: int
+) -> tuple[NDArray, int]:
+    """Capture positions for one back-and-forth sweep (one row of the sequence table
+    for each position; sweep start and end triggers are set on these rows), and the
+    number of repeats of the table needed for all the sweeps.
+
+    Args:
+        capture_positions: positions to capture at (user coordinates)
+        number_of_sweeps: number of sweeps in the scan
+
+    Returns:
+        tuple[NDArray, int]: positions, and number of repeats of the table
+    """
     # add points to capture positions on the reverse sweep
     if number_of_sweeps > 1:
         num_captures = capture_positions.size
@@ -413,21 +546,77 @@ def seq_table_position_scan(
     num_seqtable_repeats = 1
     if number_of_sweeps > 1:
         num_seqtable_repeats = mt.ceil(number_of_sweeps / 2)
+    return positions, num_seqtable_repeats
+
+
+def create_position_seq_table(
+    capture_positions: NDArray,
+    number_of_sweeps: int,
+    add_sweep_triggers: bool = False,
+) -> tuple[SeqTable, int]:
+    """Create sequence table with position based triggers for
+    :func:`seq_table_position_scan`.
+
+    Sequence table has position triggers for one back-and-forth sweep.
+    Use multiple repetitions of seq table to capture subsequent sweeps.
+
+    Args:
+        capture_positions: positions to capture at (user coordinates)
+        number_of_sweeps: number of sweeps in the scan
+        add_sweep_triggers: add start and end of sweep triggers (outb1, outc1)
+
+    Returns:
+        tuple[SeqTable, int]: sequence table, and number of repeats of the table
+    """
+    positions, num_seqtable_repeats = sweep_capture_positions(
+        capture_positions, number_of_sweeps
+    )
 
-    # Sequence table has position triggers for one back-and-forth sweep.
-    # Use multiple repetitions of seq table to capture subsequent sweeps.
     seqTable_builder = SeqTableBuilder()
     seqTable_builder.convert_to_encoder = get_encoder_counts
     seqTable_builder.add_positions(positions, time1=1, outa1=True, time2=1, outa2=False)
     if add_sweep_triggers:
         seqTable_builder.add_start_end_triggers("outb1", "outc1")
 
+    return seqTable_builder.get_seq_table(), num_seqtable_repeats
+
+
+def seq_table_position_scan(
+    start: float,
+    stop: float,
+    time_per_sweep: float,
+    capture_positions: NDArray,
+    motor: Motor,
+    panda: HDFPanda,
+    num_trajectory_points: int = 10,
+    add_sweep_triggers: bool = False,
+    number_of_sweeps: int = 4,
+    panda_dict: dict[HDFPanda, list[Callable[[], MsgGenerator]]] | None = None,
+    **kwargs: Any,
+) -> MsgGenerator:
+
+    time_per_traj_point = time_per_sweep / num_trajectory_points
+
+    print(
+        f"Num trajectorypoints : {num_trajectory_points}, "
+        f"time per traj point : {time_per_traj_point}"
+    )
+
+    # Prepare motor info using trajectory scanning
+    spec = create_sweep_spec(
+        motor, start, stop, time_per_traj_point, num_trajectory_points, number_of_sweeps
+    )
+
+    seq_table, num_seqtable_repeats = create_position_seq_table(
+        capture_positions, number_of_sweeps, add_sweep_triggers
+    )
+
     # initialise if nothing has been passed in
     if panda_dict is None:
         panda_dict = {}
 
     prepare_position_seqtable = prepare_seq_table(
-        panda, seqTable_builder.get_seq_table(), 1, num_seqtable_repeats
+        panda, seq_table, 1, num_seqtable_repeats
     )
     # append position sequence table setup to panda entry (make empty list first
     # if not already present).
@@ -483,6 +672,10 @@ def seq_table_scan(
     scan_parameters = kwargs.get("scan_params_dict") or {}
     scan_name = scan_parameters.get("scan_name")
 
+    # Large arrays (e.g. capture positions) are recorded in a separate stream,
+    # with just a summary of each one in the start document
+    array_summaries, large_arrays = externalise_arrays(scan_parameters)
+
     _md = {
         "plan_args": {
             "detectors": {det.name for det in detectors},
@@ -491,7 +684,9 @@ def seq_table_scan(
             **{
                 k: repr(v) if not isinstance(v, np.ndarray) else v
                 for k, v in scan_parameters.items()
+                if k not in large_arrays
             },
+            **array_summaries,
         },
     }
 
@@ -501,6 +696,8 @@ def seq_table_scan(
     @bpp.stage_decorator([*detectors])
     @bpp.run_decorator(md=_md)
     def inner_plan():
+        yield from record_arrays(large_arrays)
+
         yield from bps.prepare(pmac_trajectory_flyer, pamc_trigger_logic, wait=True)
 
         # prepare and kickoff panda seq tables
@@ -513,17 +710,33 @@ def seq_table_scan(
         for panda in detectors:
             yield from bps.kickoff(panda)
 
+        gap_follower: GapFollower | None = kwargs.get("gap_follower")
+        if gap_follower is not None:
+            # move undulator gap to the value for the start of the trajectory
+            yield from gap_follower.move_to_start()
+
         # Prepare pmac with the trajectory
         yield from bps.kickoff(pmac_trajectory_flyer, wait=True)
 
         if scan_parameters.get("readable_pvs") is not None:
             yield from prepare_pv_monitoring(scan_parameters["readable_pvs"])
 
-        yield from bps.collect_while_completing(
-            flyers=[pmac_trajectory_flyer],
-            dets=[*detectors],
-            stream_name="primary",
-            flush_period=0.5,
-        )
+        if gap_follower is not None:
+            yield from collect_while_following(
+                flyers=[pmac_trajectory_flyer],
+                dets=[*detectors],
+                follower=gap_follower,
+                stream_name="primary",
+                flush_policy=kwargs.get("flush_policy"),
+            )
+            LOGGER.info(f"Undulator gap moved {gap_follower.num_moves} times")
+        else:
+            yield from collect_while_completing(
+                flyers=[pmac_trajectory_flyer],
+                dets=[*detectors],
+                stream_name="primary",
+                flush_policy=kwargs.get("flush_policy"),
+            )
 
     yield from inner_plan()
+    LOGGER.info(panda_write_cache.report())
@@ -1,9 +1,8 @@
-import asyncio
 import math as mt
 
 import bluesky.plan_stubs as bps
 import bluesky.preprocessors as bpp
-from aioca import caput
+from aioca import caget, caput
 from bluesky.utils import MsgGenerator
 from dodal.beamlines.p51 import turbo_slit_pmac
 from dodal.common.coordination import inject
@@ -16,6 +15,7 @@ from ophyd_async.core import (
 )
 from ophyd_async.epics.motor import Motor
 from ophyd_async.epics.pmac import (
+    PmacScanInfo,
     PmacTrajectoryTriggerLogic,
 )
 from ophyd_async.fastcs.panda import (
@@ -28,6 +28,15 @@ from ophyd_async.fastcs.panda._block import PcompBlock
 from ophyd_async.plan_stubs import ensure_connected
 from scanspec.specs import Fly, Line
 
+from spectroscopy_bluesky.common.adaptive_flush import (
+    AdaptiveFlushPolicy,
+    collect_while_completing,
+)
+from spectroscopy_bluesky.common.panda_write_cache import (
+    PandaWriteCache,
+    panda_write_cache,
+)
+
 from .common import (
     get_encoder_counts,
     setup_trajectory_scan_pvs,
@@ -35,22 +44,39 @@ from .common import (
 
 
 class _StaticPcompTriggerLogic(StaticPcompTriggerLogic):
-    """For controlling the PandA `PcompBlock` when flyscanning."""
-
-    def __init__(self, pcomp: PcompBlock) -> None:
+    """For controlling the PandA `PcompBlock` when flyscanning.
+
+    The PCOMP settings are written through a :class:`PandaWriteCache`, so
+    preparing again with the same settings only writes the values that changed.
+    The SRGATE is reset before the PCOMP is prepared, if its output is set.
+    """
+
+    def __init__(
+        self,
+        pcomp: PcompBlock,
+        srgate_reset_pv: str = "BL51P-EA-PANDA-02:SRGATE1:FORCE_RST",
+        write_cache: PandaWriteCache = panda_write_cache,
+        srgate_out_pv: str = "BL51P-EA-PANDA-02:SRGATE1:OUT",
+    ) -> None:
         self.pcomp = pcomp
+        self.srgate_reset_pv = srgate_reset_pv
+        self.srgate_out_pv = srgate_out_pv
+        self.write_cache = write_cache
 
     async def kickoff(self) -> None:
         await wait_for_value(self.pcomp.active, True, timeout=1)
 
     async def prepare(self, value: PcompInfo) -> None:
-        await caput("BL51P-EA-PANDA-02:SRGATE1:FORCE_RST", "1", wait=True)
-        await asyncio.gather(
-            self.pcomp.start.set(value.start_postion),
-            self.pcomp.width.set(value.pulse_width),
-            self.pcomp.step.set(value.rising_edge_step),
-            self.pcomp.pulses.set(value.number_of_pulses),
-            self.pcomp.dir.set(value.direction),
+        if await caget(self.srgate_out_pv):
+            await caput(self.srgate_reset_pv, "1", wait=True)
+        await self.write_cache.set_all(
+            {
+                self.pcomp.start: value.start_postion,
+                self.pcomp.width: value.pulse_width,
+                self.pcomp.step: value.rising_edge_step,
+                self.pcomp.pulses: value.number_of_pulses,
+                self.pcomp.dir: value.direction,
+            }
         )
 
     async def stop(self):
@@ -90,6 +116,7 @@ def fly_scan_ts(
     duration: float,
     motor: Motor = inject("turbo_slit_x"),  # noqa: B008
     panda: HDFPanda = inject("panda1"),  # noqa: B008
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
     panda_pcomp = StandardFlyer(StaticPcompTriggerLogic(panda.pcomp[1]))
 
@@ -128,11 +155,11 @@ def fly_scan_ts(
         yield from bps.kickoff(panda, wait=True)
         yield from bps.kickoff(panda_pcomp, wait=True)
         yield from bps.kickoff(motor, wait=True)
-        yield from bps.collect_while_completing(
+        yield from collect_while_completing(
             flyers=[motor],
             dets=[panda],
             stream_name="primary",
-            flush_period=0.5,
+            flush_policy=flush_policy,
         )
 
     yield from inner_plan()
@@ -147,7 +174,11 @@ def fly_sweep(
     panda: HDFPanda = inject("panda1"),  # noqa: B008
     number_of_sweeps: int = 5,
     runup: float = 0.0,
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
+    """Back-and-forth fly scan, with the motor moved using FlyMotorInfo and the
+    PCOMP prepared again for each sweep. See :func:`fly_sweep_continuous` for a
+    version that runs all the sweeps as one PMAC trajectory."""
     panda_pcomp = StandardFlyer(StaticPcompTriggerLogic(panda.pcomp[1]))
 
     def inner_squared_plan(start: float | int, stop: float | int):
@@ -179,11 +210,11 @@ def fly_sweep(
         # kickoff motor move once pcomp has started
         yield from bps.kickoff(motor, wait=True)
 
-        yield from bps.collect_while_completing(
+        yield from collect_while_completing(
             flyers=[motor],
             dets=[panda],
             stream_name="primary",
-            flush_period=0.5,
+            flush_policy=flush_policy,
         )
 
     @bpp.run_decorator()
@@ -219,6 +250,7 @@ def fly_sweep_both_ways(
     motor: Motor = inject("turbo_slit_x"),  # noqa: B008
     panda: HDFPanda = inject("panda1"),  # noqa: B008
     number_of_sweeps: int = 5,
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
     panda_pcomp1 = StandardFlyer(_StaticPcompTriggerLogic(panda.pcomp[1]))
     panda_pcomp2 = StandardFlyer(_StaticPcompTriggerLogic(panda.pcomp[2]))
@@ -237,11 +269,11 @@ def fly_sweep_both_ways(
         # kickoff motor move once pcomp has started
         yield from bps.kickoff(motor, wait=True)
 
-        yield from bps.collect_while_completing(
+        yield from collect_while_completing(
             flyers=[motor],
             dets=[panda],
             stream_name="primary",
-            flush_period=0.5,
+            flush_policy=flush_policy,
         )
 
     @bpp.run_decorator()
@@ -299,6 +331,143 @@ def fly_sweep_both_ways(
     yield from inner_plan()
 
 
+def both_ways_pcomp_infos(
+    start: float, stop: float, num: int
+) -> tuple[PcompInfo, PcompInfo]:
+    """PCOMP settings for the forward (start -> stop) and reverse (stop -> start)
+    sweeps, each with num pulses evenly spaced between start and stop"""
+    width, _, _, direction_of_sweep = calculate_stuff(start, stop, num)
+    reverse_direction = (
+        PandaPcompDirection.POSITIVE
+        if direction_of_sweep == PandaPcompDirection.NEGATIVE
+        else PandaPcompDirection.NEGATIVE
+    )
+    return (
+        get_pcomp_info(width, start, direction_of_sweep, num),
+        get_pcomp_info(width, stop, reverse_direction, num),
+    )
+
+
+def continuous_sweep_scan_info(
+    motor: Motor,
+    start: float,
+    stop: float,
+    num: int,
+    duration: float,
+    number_of_sweeps: int,
+    runup: float = 0.0,
+    ramp_time: float | None = None,
+    turnaround_time: float | None = None,
+) -> PmacScanInfo:
+    """PMAC trajectory for :func:`fly_sweep_continuous` : number_of_sweeps
+    back-and-forth sweeps with num points between start and stop, so the
+    trajectory points match the PCOMP pulses.
+
+    The runup distance is not added to the trajectory points; if ramp_time is not
+    set, it is converted to the time needed to reach the sweep velocity over the
+    runup distance with constant acceleration (i.e. 2 * runup / velocity).
+    """
+    spec = Fly(float(duration) @ (number_of_sweeps * ~Line(motor, start, stop, num)))
+    if ramp_time is None and runup > 0:
+        velocity = abs(stop - start) / ((num - 1) * duration)
+        ramp_time = 2 * runup / velocity
+    return PmacScanInfo(spec=spec, ramp_time=ramp_time, turnaround_time=turnaround_time)
+
+
+def fly_sweep_continuous(
+    start: float,
+    stop: float,
+    num: int,
+    duration: float,
+    motor: Motor = inject("turbo_slit_x"),  # noqa: B008
+    panda: HDFPanda = inject("panda1"),  # noqa: B008
+    number_of_sweeps: int = 5,
+    runup: float = 0.0,
+    ramp_time: float | None = None,
+    turnaround_time: float | None = None,
+    flush_policy: AdaptiveFlushPolicy | None = None,
+) -> MsgGenerator:
+    """Back-and-forth fly scan using a single PMAC trajectory for all the sweeps.
+    (Note that the motor is controlled by the PMAC trajectory scan rather than by
+    FlyMotorInfo as in :func:`fly_sweep`.)
+
+    Both PCOMP blocks are prepared once at the start (one for each sweep
+    direction, as in :func:`fly_sweep_both_ways`), and the motor is moved through
+    all of the sweeps in one trajectory. Unlike :func:`fly_sweep` there is no
+    prepare/kickoff of the motor and PCOMP between sweeps, so the dead time between
+    sweeps is just the turnaround of the motor.
+
+    Args:
+        start: start position of the first sweep
+        stop: end position of the first sweep
+        num: number of triggers per sweep
+        duration: time per trigger (seconds)
+        motor: motor to be moved
+        panda: panda used to generate the triggers and capture the data
+        number_of_sweeps: number of sweeps (alternating direction)
+        runup: distance needed to get up to speed before the first sweep
+            (used to calculate ramp_time, if that is not set)
+        ramp_time: ramp up time of the trajectory (optional)
+        turnaround_time: time for the turnaround between sweeps (optional)
+        flush_policy: policy for adjusting time between flushes of the data
+            (fixed 0.5 second flush period if None)
+    """
+    panda_pcomp1 = StandardFlyer(_StaticPcompTriggerLogic(panda.pcomp[1]))
+    panda_pcomp2 = StandardFlyer(_StaticPcompTriggerLogic(panda.pcomp[2]))
+    pmac = turbo_slit_pmac(motor)
+
+    yield from ensure_connected(pmac, motor)
+
+    yield from setup_trajectory_scan_pvs()
+
+    pmac_scan_info = continuous_sweep_scan_info(
+        motor,
+        start,
+        stop,
+        num,
+        duration,
+        number_of_sweeps,
+        runup=runup,
+        ramp_time=ramp_time,
+        turnaround_time=turnaround_time,
+    )
+    pmac_trajectory_flyer = StandardFlyer(PmacTrajectoryTriggerLogic(pmac))  # pyright: ignore[reportArgumentType]
+
+    @bpp.run_decorator()
+    @bpp.stage_decorator([panda, panda_pcomp1, panda_pcomp2])
+    def inner_plan():
+        pcomp_info1, pcomp_info2 = both_ways_pcomp_infos(start, stop, num)
+
+        panda_hdf_info = TriggerInfo(
+            number_of_events=num * number_of_sweeps,
+            trigger=DetectorTrigger.EXTERNAL_LEVEL,
+            livetime=duration,
+            deadtime=1e-5,
+        )
+
+        yield from bps.prepare(pmac_trajectory_flyer, pmac_scan_info, wait=True)
+
+        # prepare both pcomps once, for the forward and reverse sweeps
+        yield from bps.prepare(panda_pcomp1, pcomp_info1, wait=True)
+        yield from bps.prepare(panda_pcomp2, pcomp_info2, wait=True)
+
+        # prepare panda and hdf writer once, at start of scan
+        yield from bps.prepare(panda, panda_hdf_info, wait=True)
+        yield from bps.declare_stream(panda, name="primary", collect=True)
+
+        yield from bps.kickoff(panda, wait=True)
+        yield from bps.kickoff(pmac_trajectory_flyer, wait=True)
+
+        yield from collect_while_completing(
+            flyers=[pmac_trajectory_flyer],
+            dets=[panda],
+            stream_name="primary",
+            flush_policy=flush_policy,
+        )
+
+    yield from inner_plan()
+
+
 def trajectory_fly_scan(
     start: float,
     stop: float,
@@ -306,6 +475,7 @@ def trajectory_fly_scan(
     duration: float,
     motor: Motor = inject("turbo_slit_x"),  # noqa: B008
     panda: HDFPanda = inject("panda1"),  # noqa: B008
+    flush_policy: AdaptiveFlushPolicy | None = None,
 ) -> MsgGenerator:
     panda_pcomp1 = StandardFlyer(_StaticPcompTriggerLogic(panda.pcomp[1]))
     panda_pcomp2 = StandardFlyer(_StaticPcompTriggerLogic(panda.pcomp[2]))
@@ -354,11 +524,11 @@ def trajectory_fly_scan(
         yield from bps.kickoff(panda, wait=True)
         yield from bps.kickoff(pmac_trajectory_flyer, wait=True)
 
-        yield from bps.collect_while_completing(
+        yield from collect_while_completing(
             flyers=[pmac_trajectory_flyer],
             dets=[panda],
             stream_name="primary",
-            flush_period=0.5,
+            flush_policy=flush_policy,
         )
 
     yield from inner_plan()
@@ -0,0 +1,157 @@
+from types import SimpleNamespace
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import pytest
+from bluesky.run_engine import RunEngine
+from ophyd.status import Status
+from ophyd_async.core import init_devices, soft_signal_rw
+
+from spectroscopy_bluesky.common import adaptive_flush
+from spectroscopy_bluesky.common.adaptive_flush import (
+    AdaptiveFlushPolicy,
+    collect_while_completing,
+)
+
+
+def test_fixed_latency_period():
+    policy = AdaptiveFlushPolicy(target_latency=0.2)
+    assert policy.next_period(None) == pytest.approx(0.2)
+    assert policy.next_period(1000.0) == pytest.approx(0.2)
+
+
+def test_initial_period_before_rate_known():
+    policy = AdaptiveFlushPolicy(
+        target_latency=None, target_frames=100, initial_period=0.5
+    )
+    assert policy.next_period(None) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize(
+    "frame_rate, expected_period",
+    [
+        (None, 2.0),  # rate not known yet - use target latency
+        (1000.0, 0.1),
+        (100.0, 1.0),
+        (10.0, 2.0),  # limited by target_latency
+        (0.0, 2.0),
+        (1e6, 0.05),  # limited by min_period
+    ],
+)
+def test_target_frames_period(frame_rate, expected_period):
+    policy = AdaptiveFlushPolicy(
+        target_latency=2.0, target_frames=100, initial_period=0.5, min_period=0.05
+    )
+    assert policy.next_period(frame_rate) == pytest.approx(expected_period)
+
+
+def test_update_rate():
+    policy = AdaptiveFlushPolicy(smoothing=0.5)
+    rate = policy.update_rate(None, 100, 1.0)
+    assert rate == pytest.approx(100.0)
+    rate = policy.update_rate(rate, 300, 1.0)
+    assert rate == pytest.approx(200.0)
+    # no time elapsed - rate unchanged
+    assert policy.update_rate(rate, 10, 0.0) == pytest.approx(200.0)
+
+
+class StatusFlyer:
+    def __init__(self, status: Status):
+        self.name = "flyer"
+        self.parent = None
+        self.status = status
+
+    def kickoff(self) -> Status:
+        return self.status
+
+    def complete(self) -> Status:
+        return self.status
+
+
+class ScriptedDetector:
+    """Collectable detector whose frame index is taken from a list of values
+    (one for each call of get_index). The flyer status is finished when the
+    last value is reached."""
+
+    def __init__(self, indices: list[int], flyer_status: Status):
+        self.name = "det"
+        self.parent = None
+        self.indices = indices
+        self.flyer_status = flyer_status
+        self.num_calls = 0
+        self.index = 0
+        self.num_collected = 0
+
+    async def get_index(self) -> int:
+        self.index = self.indices[min(self.num_calls, len(self.indices) - 1)]
+        self.num_calls += 1
+        if self.num_calls >= len(self.indices) and not self.flyer_status.done:
+            self.flyer_status.set_finished()
+        return self.index
+
+    def describe_collect(self):
+        return {
+            "det_frame": {"source": "det", "dtype": "integer", "shape": []},
+        }
+
+    def collect(self):
+        for frame in range(self.num_collected, self.index):
+            yield {
+                "data": {"det_frame": frame},
+                "timestamps": {"det_frame": 0.0},
+                "time": 0.0,
+            }
+        self.num_collected = self.index
+
+
+def test_collect_while_completing_adaptive(monkeypatch):
+    # every call of time.monotonic in the plan is 0.1 sec after the last one
+    clock = iter(0.1 * n for n in range(100))
+    monkeypatch.setattr(
+        adaptive_flush, "time", SimpleNamespace(monotonic=clock.__next__)
+    )
+
+    status = Status()
+    flyer = StatusFlyer(status)
+    det = ScriptedDetector([0, 10, 10, 30], status)
+    RE = RunEngine()
+    with init_devices():
+        signal = soft_signal_rw(float, name="signal")
+
+    messages = []
+    RE.msg_hook = messages.append
+    frames = []
+    RE.subscribe(
+        lambda name, doc: (
+            frames.extend(doc["data"]["det_frame"]) if name == "event_page" else None
+        )
+    )
+
+    policy = AdaptiveFlushPolicy(
+        target_latency=None,
+        target_frames=10,
+        initial_period=0.5,
+        min_period=0.01,
+        smoothing=0.5,
+    )
+
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.declare_stream(det, name="det_stream", collect=True)
+        yield from bps.abs_set(signal, 1.0, group="watched")
+        yield from collect_while_completing(
+            [flyer], [det], "det_stream", flush_policy=policy, watch=["watched"]
+        )
+
+    RE(plan())
+
+    waits = [msg for msg in messages if msg.command == "wait"]
+    # frame rates 100 (10 frames), 50 (no new frames), 125 (20 frames)
+    assert [msg.kwargs["timeout"] for msg in waits] == pytest.approx(
+        [0.5, 0.1, 0.2, 0.08]
+    )
+    assert all(msg.kwargs["watch"] == ["watched"] for msg in waits)
+    # no collect after the flush with no new frames, final collect when complete
+    collects = [msg for msg in messages if msg.command == "collect"]
+    assert len(collects) == 3
+    assert frames == list(range(30))
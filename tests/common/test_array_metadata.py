@@ -0,0 +1,55 @@
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky.run_engine import RunEngine
+
+from spectroscopy_bluesky.common.array_metadata import (
+    externalise_arrays,
+    record_arrays,
+    summarise_array,
+)
+
+
+def test_summarise_array():
+    summary = summarise_array("positions", np.linspace(1, 5, 5), "arrays")
+    assert summary["stream"] == "arrays"
+    assert summary["data_key"] == "positions"
+    assert summary["shape"] == [5]
+    assert summary["dtype"] == "float64"
+    assert summary["min"] == pytest.approx(1.0)
+    assert summary["max"] == pytest.approx(5.0)
+    assert summary["mean"] == pytest.approx(3.0)
+    assert summary["last"] == pytest.approx(5.0)
+
+
+def test_only_large_numeric_arrays_externalised():
+    params = {
+        "positions": np.arange(100.0),
+        "small": np.arange(3.0),
+        "names": np.array(["a"] * 100),
+        "start": 1.0,
+    }
+    summaries, arrays = externalise_arrays(params, max_array_size=10)
+    assert list(summaries) == ["positions"]
+    assert list(arrays) == ["positions"]
+
+
+def test_arrays_recorded_in_stream():
+    RE = RunEngine()
+    docs = []
+    positions = np.linspace(0, 1, 50)
+    counts = np.arange(20).reshape(4, 5)
+
+    @bpp.run_decorator()
+    def plan():
+        yield from record_arrays({"positions": positions, "counts": counts})
+        yield from bps.null()
+
+    RE(plan(), lambda name, doc: docs.append((name, doc)))
+
+    descriptor = next(doc for name, doc in docs if name == "descriptor")
+    assert descriptor["name"] == "scan_arrays"
+    event = next(doc for name, doc in docs if name == "event")
+    np.testing.assert_allclose(event["data"]["positions"], positions)
+    np.testing.assert_array_equal(event["data"]["counts"], counts.ravel())
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from spectroscopy_bluesky.common.callbacks import (
+    EnergyRebinner,
+    RebinnedSpectrum,
+    SweepSplitter,
+)
+from spectroscopy_bluesky.common.callbacks.energy_rebinning import energy_bin_edges
+from spectroscopy_bluesky.common.quantity_conversion import (
+    energy_to_bragg_angle,
+    si_111_lattice_spacing,
+)
+from spectroscopy_bluesky.common.xas_scans import xas_energy_grid
+from spectroscopy_bluesky.p51.plans.common import (
+    get_encoder_counts,
+    get_user_position,
+)
+
+COUNTS_PER_DEGREE = 1000.0
+ANGLE_OFFSET = 5.0
+
+
+def energy_to_counts(energy):
+    angle = energy_to_bragg_angle(si_111_lattice_spacing, energy)
+    return (angle - ANGLE_OFFSET) * COUNTS_PER_DEGREE
+
+
+def make_rebinner(grid) -> EnergyRebinner:
+    return EnergyRebinner(
+        grid,
+        position_key="enc",
+        counts_per_degree=COUNTS_PER_DEGREE,
+        angle_offset=ANGLE_OFFSET,
+    )
+
+
+def test_bin_edges():
+    edges = energy_bin_edges([1.0, 2.0, 4.0])
+    np.testing.assert_allclose(edges, [0.5, 1.5, 3.0, 5.0])
+
+    with pytest.raises(ValueError):
+        energy_bin_edges([2.0, 1.0])
+
+
+def test_counts_to_energy():
+    rebinner = make_rebinner([7000.0, 7100.0])
+    energy = np.array([7000.0, 7050.0, 7100.0])
+    np.testing.assert_allclose(
+        rebinner.counts_to_energy(energy_to_counts(energy)), energy
+    )
+
+
+def test_frames_averaged_in_each_bin():
+    grid = np.array([7000.0, 7010.0, 7020.0])
+    rebinner = make_rebinner(grid)
+    # two frames near first grid point, one near last, one outside the grid
+    energy = np.array([6998.0, 7003.0, 7021.0, 7100.0])
+    rebinner.add_frames({"enc": energy_to_counts(energy), "I0": [1.0, 3.0, 5.0, 7.0]})
+
+    spectrum = rebinner.spectrum()
+    np.testing.assert_array_equal(spectrum.frames_per_bin, [2, 0, 1])
+    np.testing.assert_allclose(spectrum.data["I0"], [2.0, np.nan, 5.0])
+
+
+def test_one_spectrum_per_sweep():
+    grid = xas_energy_grid("Fe", "K")
+    counts = energy_to_counts(grid)
+    num_sweeps = 3
+    sweeps = [counts if i % 2 == 0 else counts[::-1] for i in range(num_sweeps)]
+    all_counts = np.concatenate(sweeps)
+
+    splitter = SweepSplitter(frames_per_sweep=len(grid), position_key="enc")
+    rebinner = make_rebinner(grid)
+    rebinner.attach(splitter)
+    spectra: list[RebinnedSpectrum] = []
+    rebinner.callbacks.append(spectra.append)
+
+    # add frames in blocks, as from each flush
+    for block in np.array_split(np.arange(len(all_counts)), 10):
+        splitter.add_frames({"enc": all_counts[block], "It": block.astype(float)})
+
+    assert [s.sweep_index for s in spectra] == list(range(num_sweeps))
+    for spectrum in spectra:
+        np.testing.assert_array_equal(spectrum.frames_per_bin, np.ones(len(grid)))
+        np.testing.assert_allclose(spectrum.energy, grid)
+
+
+def test_counts_to_angle_function():
+    grid = np.array([7000.0, 7050.0, 7100.0])
+    angle = np.asarray(energy_to_bragg_angle(si_111_lattice_spacing, grid))
+    counts = np.array([get_encoder_counts(a) for a in angle])
+
+    rebinner = EnergyRebinner(grid, "enc", counts_to_angle=get_user_position)
+    np.testing.assert_allclose(rebinner.counts_to_energy(counts), grid)
+
+
+def test_encoder_conversion_needed():
+    with pytest.raises(ValueError):
+        EnergyRebinner([7000.0, 7100.0], "enc")
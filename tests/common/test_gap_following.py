@@ -0,0 +1,105 @@
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky.run_engine import RunEngine
+from ophyd.sim import SynAxis
+from ophyd_async.core import (
+    StaticPathProvider,
+    TriggerInfo,
+    UUIDFilenameProvider,
+    init_devices,
+)
+from ophyd_async.sim import SimBlobDetector, SimMotor
+
+from spectroscopy_bluesky.common.adaptive_flush import AdaptiveFlushPolicy
+from spectroscopy_bluesky.common.gap_following import (
+    GapFollower,
+    collect_while_following,
+)
+
+
+def gap_function(angle):
+    return 20.0 - np.asarray(angle)
+
+
+def make_follower(**kwargs):
+    bragg = SynAxis(name="bragg", value=12.0)
+    gap = SynAxis(name="gap")
+    return bragg, gap, GapFollower(gap, bragg, gap_function, **kwargs)
+
+
+def test_gap_profile():
+    _, _, follower = make_follower()
+    np.testing.assert_allclose(follower.gap_profile([10.0, 12.5]), [10.0, 7.5])
+
+
+def test_update_with_deadband():
+    RE = RunEngine()
+    bragg, gap, follower = make_follower(deadband=0.1)
+
+    RE(follower.move_to_start())
+    assert gap.position == pytest.approx(8.0)
+
+    def update_at(angle):
+        bragg.set(angle).wait()
+        RE(follower.update())
+        RE(follower.wait())
+
+    # change within deadband - gap not moved
+    update_at(12.05)
+    assert gap.position == pytest.approx(8.0)
+    update_at(12.5)
+    assert gap.position == pytest.approx(7.5)
+    assert follower.num_moves == 2
+
+
+def test_gap_clipped_to_angle_limits():
+    _, _, follower = make_follower(angle_limits=(11.0, 12.5))
+    np.testing.assert_allclose(
+        follower.gap_profile([10.0, 12.0, 13.0]), [9.0, 8.0, 7.5]
+    )
+
+
+def test_collect_while_following(tmp_path):
+    RE = RunEngine(call_returns_result=True)
+    with init_devices():
+        det = SimBlobDetector(
+            StaticPathProvider(UUIDFilenameProvider(), tmp_path), name="det"
+        )
+        bragg = SimMotor("bragg", instant=False, initial_value=12.0)
+        gap = SimMotor("gap")
+    follower = GapFollower(gap, bragg, gap_function, update_period=0.02)
+    messages = []
+    RE.msg_hook = messages.append
+    frames = []
+    RE.subscribe(
+        lambda name, doc: frames.append(doc["indices"]["stop"]), "stream_datum"
+    )
+
+    @bpp.stage_decorator([det])
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.mv(bragg.velocity, 2.0, bragg.acceleration_time, 0.01)
+        yield from bps.prepare(
+            det, TriggerInfo(number_of_events=20, livetime=0.05), wait=True
+        )
+        yield from bps.declare_stream(det, name="primary", collect=True)
+        yield from follower.move_to_start()
+        yield from bps.kickoff(det, wait=True)
+        yield from bps.abs_set(bragg, 13.0, group="bragg")
+        yield from collect_while_following(
+            [det], [det], follower, "primary", AdaptiveFlushPolicy(target_latency=0.1)
+        )
+        yield from bps.wait(group="bragg")
+
+    RE(plan())
+    # gap follows the Bragg angle to the end of the move (to within the deadband)
+    assert RE(bps.rd(gap)).plan_result == pytest.approx(7.0, abs=follower.deadband)
+    assert follower.num_moves > 2
+    # all the frames are collected, and the gap is updated more often than the
+    # collects made by the flush policy
+    assert max(frames) == 20
+    bragg_reads = [m for m in messages if m.command == "locate" and m.obj is bragg]
+    collects = [m for m in messages if m.command == "collect"]
+    assert len(bragg_reads) > len(collects) > 1
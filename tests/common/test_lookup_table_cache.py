@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from spectroscopy_bluesky.common import lookup_tables
+from spectroscopy_bluesky.common.lookup_tables import LookupTableCache
+
+
+def write_lookup_table(filename, bragg, gap):
+    with open(filename, "w") as f:
+        f.write("# bragg\tidgap\nUnits\tDeg\tmm\n")
+        for b, g in zip(bragg, gap, strict=True):
+            f.write(f"{b:.3f} {g:.5f}\n")
+
+
+def test_lookup_table_curve_cached(tmp_path):
+    filename = tmp_path / "lookuptable.txt"
+    bragg = np.linspace(18, 11, 36)
+    write_lookup_table(filename, bragg, 20 - bragg)
+
+    cache = LookupTableCache()
+    curve = cache.curve(filename)
+    assert curve(15.0) == pytest.approx(5.0)
+    assert cache.curve(filename) is curve
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.bragg_range(filename) == pytest.approx((11.0, 18.0))
+
+
+def test_lookup_table_sidecar(tmp_path, monkeypatch):
+    filename = tmp_path / "lookuptable.txt"
+    bragg = np.linspace(11, 18, 8)
+    write_lookup_table(filename, bragg, 20 - bragg)
+
+    values = LookupTableCache(use_sidecar=True).values(filename)
+    assert (tmp_path / "lookuptable.txt.npz").exists()
+
+    # new cache loads the values from the sidecar, without parsing the Ascii file
+    def fail(*args, **kwargs):
+        raise AssertionError("Ascii file should not be parsed")
+
+    monkeypatch.setattr(lookup_tables, "load_ascii_lookuptable", fail)
+    sidecar_values = LookupTableCache(use_sidecar=True).values(filename)
+    np.testing.assert_array_equal(sidecar_values, values)
+    np.testing.assert_allclose(values[:, 0], bragg)
+
+
+def test_lookup_table_values_read_only(tmp_path, monkeypatch, caplog):
+    filename = tmp_path / "lookuptable.txt"
+    bragg = np.linspace(11, 18, 8)
+    write_lookup_table(filename, bragg, 20 - bragg)
+    cache = LookupTableCache()
+    values = cache.values(filename)
+    with pytest.raises(ValueError):
+        values[0, 1] = 0
+    assert cache.values(filename) is values
+
+    # values loaded from a sidecar file are also read-only
+    sidecar_cache = LookupTableCache(use_sidecar=True)
+    sidecar_cache.values(filename)
+    sidecar_values = LookupTableCache(use_sidecar=True).values(filename)
+    assert not sidecar_values.flags.writeable
+
+    # failing to write a sidecar file is logged
+    monkeypatch.setattr(
+        lookup_tables, "sidecar_filename", lambda _: tmp_path / "missing" / "x.npz"
+    )
+    with caplog.at_level("WARNING"):
+        LookupTableCache(use_sidecar=True).values(filename)
+    assert "Could not save lookup table values" in caplog.text
+
+
+def write_garbage(sidecar):
+    sidecar.write_bytes(b"not a numpy file")
+
+
+def write_wrong_arrays(sidecar):
+    np.savez(sidecar, other=np.zeros(3))
+
+
+@pytest.mark.parametrize("write_sidecar", [write_garbage, write_wrong_arrays])
+def test_lookup_table_bad_sidecar(tmp_path, caplog, write_sidecar):
+    filename = tmp_path / "lookuptable.txt"
+    bragg = np.linspace(11, 18, 8)
+    write_lookup_table(filename, bragg, 20 - bragg)
+    sidecar = tmp_path / "lookuptable.txt.npz"
+    write_sidecar(sidecar)
+
+    # unreadable sidecar is logged and the Ascii file is parsed instead
+    with caplog.at_level("WARNING"):
+        values = LookupTableCache(use_sidecar=True).values(filename)
+    assert "Could not load lookup table values" in caplog.text
+    np.testing.assert_allclose(values[:, 0], bragg)
+
+    # sidecar is replaced with the values from the Ascii file
+    with np.load(sidecar) as data:
+        np.testing.assert_array_equal(data["values"], values)
@@ -0,0 +1,108 @@
+import json
+
+import bluesky.plan_stubs as bps
+import bluesky.preprocessors as bpp
+from bluesky.run_engine import RunEngine
+from bluesky.utils import Msg
+from ophyd_async.core import init_devices, soft_signal_rw
+
+from spectroscopy_bluesky.common.message_profiler import (
+    MessageProfiler,
+    profile_messages_wrapper,
+)
+
+
+def test_message_timings(tmp_path):
+    RE = RunEngine()
+    with init_devices():
+        signal = soft_signal_rw(float, name="signal")
+
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.mv(signal, 1.0)
+        yield from bps.sleep(0.05)
+
+    report_file = tmp_path / "report.json"
+    records_file = tmp_path / "records.json"
+    profiler = MessageProfiler(str(report_file), str(records_file))
+    RE(profile_messages_wrapper(plan(), profiler))
+
+    commands = [r.command for r in profiler.records]
+    assert commands[0] == "open_run"
+    assert commands[-1] == "close_run"
+    assert "wait:set" in commands
+
+    summary = json.loads(report_file.read_text())
+    assert summary["command"]["sleep"]["total"] >= 0.05
+    assert summary["command"]["set"]["count"] == 1
+    assert "signal:set" in summary["device"]
+
+    lines = records_file.read_text().splitlines()
+    assert len(lines) == len(profiler.records)
+    assert json.loads(lines[0])["command"] == "open_run"
+
+
+def test_profiler_as_preprocessor():
+    RE = RunEngine()
+    profiler = MessageProfiler()
+    RE.preprocessors.append(profiler)
+
+    @bpp.run_decorator()
+    def plan():
+        yield from bps.null()
+
+    RE(plan())
+    assert [r.command for r in profiler.records] == ["open_run", "null", "close_run"]
+    assert "null" in profiler.report()
+
+
+def test_sweep_number_increments_when_complete_finishes():
+    profiler = MessageProfiler(log_report=False)
+    for _ in range(2):
+        profiler.record(Msg("complete", None, group="g"), 0, 0.1, None)
+        # first wait times out, second one finishes
+        profiler.record(Msg("wait", None, group="g", timeout=0.5), 0, 0.5, False)
+        profiler.record(Msg("wait", None, group="g", timeout=0.5), 0, 0.2, True)
+
+    summary = profiler.summary()
+    assert summary["sweep"]["0"]["total"] == summary["sweep"]["1"]["total"]
+    assert summary["sweep"]["0"]["count"] == 3
+    assert summary["command"]["wait:complete"]["count"] == 4
+
+
+def test_sweep_number_from_frames_collected():
+    RE = RunEngine()
+    with init_devices():
+        signal = soft_signal_rw(float, name="signal")
+
+    profiler = MessageProfiler(log_report=False, frames_per_sweep=2)
+    RE.preprocessors.append(profiler)
+    RE.subscribe(profiler.document)
+
+    # no complete messages, so sweeps are found from the frames collected
+    @bpp.run_decorator()
+    def plan():
+        for _ in range(4):
+            yield from bps.trigger_and_read([signal])
+
+    RE(plan())
+    assert profiler.frames_collected == 4
+    reads = [r for r in profiler.records if r.command == "read"]
+    assert [r.sweep for r in reads] == [0, 0, 1, 1]
+    assert set(profiler.summary()["sweep"]) == {"0", "1", "2"}
+
+
+def test_stream_datum_frames_and_positional_wait_group():
+    profiler = MessageProfiler(log_report=False, frames_per_sweep=10)
+    profiler.document("start", {})
+    for stop in (6, 16, 21):
+        profiler.document(
+            "stream_datum", {"descriptor": "d", "seq_nums": {"start": 1, "stop": stop}}
+        )
+    assert profiler.frames_collected == 20
+    assert profiler.sweep == 2
+
+    profiler.record(Msg("set", "motor", 1, group="g"), 0, 0.1, None)
+    profiler.record(Msg("wait", None, "g"), 0, 0.3, True)
+    assert profiler.summary()["command"]["wait:set"]["count"] == 1
+    assert "g" not in profiler._groups
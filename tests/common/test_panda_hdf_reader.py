@@ -0,0 +1,76 @@
+import h5py
+import numpy as np
+import pytest
+
+from spectroscopy_bluesky.common.panda_hdf_reader import PandaHdfReader
+
+DATASETS = ["INENC1.VAL.Mean", "COUNTER1.OUT.Mean"]
+
+
+def create_file(filename, num_rows: int = 0, chunk_rows: int = 4) -> h5py.File:
+    f = h5py.File(filename, "w", libver="latest")
+    for name in DATASETS:
+        f.create_dataset(
+            name,
+            data=np.arange(num_rows, dtype=float),
+            maxshape=(None,),
+            chunks=(chunk_rows,),
+        )
+    f.swmr_mode = True
+    return f
+
+
+def append_rows(f: h5py.File, values):
+    for name in DATASETS:
+        dataset = f[name]
+        size = len(dataset)
+        dataset.resize((size + len(values),))
+        dataset[size:] = values
+        dataset.flush()
+
+
+def test_read_new_rows_while_writing(tmp_path):
+    filename = tmp_path / "panda.h5"
+    writer = create_file(filename)
+    with PandaHdfReader(filename) as reader:
+        assert sorted(reader.dataset_names) == sorted(DATASETS)
+        assert reader.read_new_rows()[DATASETS[0]].size == 0
+
+        append_rows(writer, [1.0, 2.0, 3.0])
+        rows = reader.read_new_rows()
+        np.testing.assert_array_equal(rows[DATASETS[1]], [1.0, 2.0, 3.0])
+
+        append_rows(writer, [4.0, 5.0])
+        rows = reader.read_new_rows(max_rows=1)
+        np.testing.assert_array_equal(rows[DATASETS[0]], [4.0])
+        rows = reader.read_new_rows()
+        np.testing.assert_array_equal(rows[DATASETS[0]], [5.0])
+    writer.close()
+
+
+def test_iter_chunks(tmp_path):
+    filename = tmp_path / "panda.h5"
+    create_file(filename, num_rows=10, chunk_rows=4).close()
+
+    with PandaHdfReader(filename, swmr=False) as reader:
+        blocks = list(reader.iter_chunks())
+
+    assert [start for start, _ in blocks] == [0, 4, 8]
+    values = np.concatenate([rows[DATASETS[0]] for _, rows in blocks])
+    np.testing.assert_array_equal(values, np.arange(10))
+
+
+def test_memmap_contiguous_dataset(tmp_path):
+    filename = tmp_path / "contiguous.h5"
+    with h5py.File(filename, "w") as f:
+        f.create_dataset("x", data=np.linspace(0, 1, 100))
+        f.create_dataset("y", data=np.arange(100), chunks=(10,))
+
+    with PandaHdfReader(filename, swmr=False) as reader:
+        values = reader.array("x")
+        assert isinstance(values, np.memmap)
+        np.testing.assert_array_equal(values, np.linspace(0, 1, 100))
+
+        with pytest.raises(ValueError):
+            reader.memmap("y")
+        assert isinstance(reader.array("y"), h5py.Dataset)
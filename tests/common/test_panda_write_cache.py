@@ -0,0 +1,139 @@
+import asyncio
+
+import numpy as np
+from ophyd_async.core import Device, get_mock_put, set_mock_value, soft_signal_rw
+from ophyd_async.fastcs.panda import SeqTable, SeqTrigger
+
+from spectroscopy_bluesky.common.panda_write_cache import (
+    PandaWriteCache,
+    values_equal,
+)
+
+
+class Block(Device):
+    def __init__(self, name: str = ""):
+        self.start = soft_signal_rw(int)
+        self.step = soft_signal_rw(int)
+        super().__init__(name=name)
+
+
+async def make_block(name="pcomp") -> Block:
+    block = Block(name=name)
+    await block.connect(mock=True)
+    return block
+
+
+def test_unchanged_values_not_written():
+    cache = PandaWriteCache()
+
+    async def prepare_three_times():
+        block = await make_block()
+        values = [(10, 2), (10, 2), (11, 2)]
+        num_written = [
+            await cache.set_all({block.start: start, block.step: step})
+            for start, step in values
+        ]
+        return block, num_written
+
+    block, num_written = asyncio.run(prepare_three_times())
+    assert num_written == [2, 0, 1]
+
+    assert get_mock_put(block.start).call_count == 2
+    assert get_mock_put(block.step).call_count == 1
+    assert cache.stats["pcomp"].hits == 3
+    assert cache.stats["pcomp"].misses == 3
+    assert cache.hit_rate == 0.5
+
+
+def test_invalidate_device():
+    cache = PandaWriteCache(verify=False)
+
+    async def prepare_twice():
+        block1 = await make_block("pcomp1")
+        block2 = await make_block("pcomp2")
+        for _ in range(2):
+            await cache.set(block1.start, 1)
+            await cache.set(block2.start, 1)
+            cache.invalidate(block1)
+        return block1, block2
+
+    block1, block2 = asyncio.run(prepare_twice())
+
+    assert get_mock_put(block1.start).call_count == 2
+    assert get_mock_put(block2.start).call_count == 1
+
+
+def test_disabled_cache_always_writes():
+    cache = PandaWriteCache(enabled=False)
+
+    async def prepare_three_times():
+        block = await make_block()
+        for _ in range(3):
+            await cache.set(block.start, 5)
+        return block
+
+    block = asyncio.run(prepare_three_times())
+    assert get_mock_put(block.start).call_count == 3
+
+
+def test_values_equal():
+    assert values_equal(np.array([1, 2]), np.array([1, 2]))
+    assert not values_equal(np.array([1, 2]), np.array([1, 3]))
+
+    row1 = SeqTable.row(repeats=1, trigger=SeqTrigger.POSA_GT, position=3)
+    row2 = SeqTable.row(repeats=1, trigger=SeqTrigger.POSA_GT, position=4)
+    assert values_equal(row1, row1 + SeqTable())
+    assert not values_equal(row1, row2)
+    # tables with different numbers of rows
+    assert not values_equal(row1 + row2, SeqTable())
+    assert not values_equal(row1 + row2, row1)
+    assert values_equal(row1 + row2, row1 + row2)
+
+
+def test_multi_row_table_written_once():
+    cache = PandaWriteCache()
+    table = SeqTable.row(repeats=1, trigger=SeqTrigger.POSA_GT, position=3)
+    table += SeqTable.row(repeats=1, trigger=SeqTrigger.POSA_LT, position=4)
+
+    async def prepare_twice():
+        signal = soft_signal_rw(SeqTable, name="table")
+        await signal.connect(mock=True)
+        # current value is an empty table
+        written = [await cache.set(signal, table) for _ in range(2)]
+        return signal, written
+
+    signal, written = asyncio.run(prepare_twice())
+    assert written == [True, False]
+    assert get_mock_put(signal).call_count == 1
+
+
+def test_external_change_is_written():
+    cache = PandaWriteCache()
+
+    async def prepare_after_external_change():
+        block = await make_block()
+        await cache.set(block.start, 10)
+        # e.g. PandA restarted, or value changed by another client
+        set_mock_value(block.start, 0)
+        written = await cache.set(block.start, 10)
+        return block, written
+
+    block, written = asyncio.run(prepare_after_external_change())
+    assert written
+    assert get_mock_put(block.start).call_count == 2
+
+
+def test_unverified_cache_uses_written_values():
+    cache = PandaWriteCache(verify=False)
+
+    async def prepare_after_external_change():
+        block = await make_block()
+        await cache.set(block.start, 10)
+        set_mock_value(block.start, 0)
+        # change is not seen until the cache is invalidated
+        skipped = not await cache.set(block.start, 10)
+        cache.invalidate(block)
+        written = await cache.set(block.start, 10)
+        return skipped, written
+
+    assert asyncio.run(prepare_after_external_change()) == (True, True)
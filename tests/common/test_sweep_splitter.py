@@ -0,0 +1,228 @@
+import h5py
+import numpy as np
+import pytest
+from event_model import compose_run
+
+from spectroscopy_bluesky.common.callbacks import (
+    Sweep,
+    SweepSplitter,
+    SweepSplitterCallback,
+)
+
+FRAMES_PER_SWEEP = 5
+NUM_SWEEPS = 4
+
+
+def snaked_positions() -> np.ndarray:
+    forward = np.arange(FRAMES_PER_SWEEP, dtype=float)
+    sweeps = [forward if i % 2 == 0 else forward[::-1] for i in range(NUM_SWEEPS)]
+    return np.concatenate(sweeps)
+
+
+def collect_sweeps(splitter: SweepSplitter) -> list[Sweep]:
+    sweeps = []
+    splitter.callbacks.append(sweeps.append)
+    return sweeps
+
+
+def test_split_by_frame_count():
+    splitter = SweepSplitter(frames_per_sweep=FRAMES_PER_SWEEP)
+    sweeps = collect_sweeps(splitter)
+    positions = snaked_positions()
+
+    # add frames in chunks that don't line up with the sweeps
+    for chunk in np.array_split(positions, 7):
+        splitter.add_frames({"x": chunk})
+
+    assert len(sweeps) == NUM_SWEEPS
+    assert [s.reversed for s in sweeps] == [False, True, False, True]
+    for sweep in sweeps:
+        np.testing.assert_array_equal(sweep.data["x"], np.arange(FRAMES_PER_SWEEP))
+    assert splitter.flush() is None
+
+
+def test_split_by_markers_discards_frames_between_sweeps():
+    splitter = SweepSplitter(
+        end_marker_key="outc1", start_marker_key="outb1", position_key="x"
+    )
+    sweeps = collect_sweeps(splitter)
+    # turnaround frame (position -1) before, between and after the sweeps
+    x = np.array([-1, 0, 1, 2, -1, 2, 1, 0, -1, 0, 1])
+    outb1 = np.array([0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0])
+    outc1 = np.array([0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0])
+
+    sweeps_added = splitter.add_frames({"x": x, "outb1": outb1, "outc1": outc1})
+    assert sweeps_added == sweeps
+    assert len(sweeps) == 2
+    assert [s.reversed for s in sweeps] == [False, True]
+    for sweep in sweeps:
+        np.testing.assert_array_equal(sweep.data["x"], [0, 1, 2])
+
+    partial_sweep = splitter.flush()
+    assert partial_sweep is not None
+    assert not partial_sweep.complete
+    np.testing.assert_array_equal(partial_sweep.data["x"], [0, 1])
+
+
+def test_splitter_needs_sweep_length_or_marker():
+    with pytest.raises(ValueError):
+        SweepSplitter()
+
+
+def test_end_marker_outside_sweep_discards_frames():
+    splitter = SweepSplitter(end_marker_key="outc1", start_marker_key="outb1")
+    sweeps = collect_sweeps(splitter)
+    # spurious end marker in the turnaround frames between the sweeps
+    x = np.array([0, 1, 2, -1, -1, 2, 1, 0])
+    outb1 = np.array([1, 0, 0, 0, 0, 1, 0, 0])
+    outc1 = np.array([0, 0, 1, 0, 1, 0, 0, 1])
+
+    splitter.add_frames({"x": x, "outb1": outb1, "outc1": outc1})
+    assert len(sweeps) == 2
+    for sweep in sweeps:
+        np.testing.assert_array_equal(sweep.data["x"], [0, 1, 2])
+    assert splitter.flush() is None
+
+
+def write_hdf_file(filename, datasets: dict[str, np.ndarray]):
+    with h5py.File(filename, "w", libver="latest") as f:
+        for key, values in datasets.items():
+            f.create_dataset(key, data=values)
+
+
+def compose_stream(run, filename, object_keys: dict[str, list[str]], **kwargs):
+    """Descriptor for stream data from some detectors (keyed by detector name),
+    and a stream resource for each data key"""
+    data_keys = {
+        key: {"source": name, "dtype": "number", "shape": [], "external": "STREAM:"}
+        for name, keys in object_keys.items()
+        for key in keys
+    }
+    descriptor = run.compose_descriptor(
+        data_keys=data_keys, object_keys=object_keys, **kwargs
+    )
+    resources = {
+        key: run.compose_stream_resource(
+            mimetype="application/x-hdf5",
+            uri=f"file://localhost{filename}",
+            data_key=key,
+            parameters={"dataset": f"/{key}"},
+        )
+        for key in data_keys
+    }
+    return descriptor, resources
+
+
+def send_stream_datum(callback, descriptor, resources, keys, start, stop):
+    for key in keys:
+        datum = resources[key].compose_stream_datum(
+            indices={"start": start, "stop": stop},
+            descriptor=descriptor.descriptor_doc,
+        )
+        callback("stream_datum", datum)
+
+
+def test_callback_reads_stream_datum(tmp_path):
+    positions = snaked_positions()
+    filename = tmp_path / "panda.h5"
+    write_hdf_file(filename, {"x": positions, "counts": 10 * positions})
+
+    splitter = SweepSplitter(frames_per_sweep=FRAMES_PER_SWEEP, position_key="x")
+    sweeps = collect_sweeps(splitter)
+    callback = SweepSplitterCallback(splitter)
+
+    run = compose_run()
+    callback("start", run.start_doc)
+    descriptor, resources = compose_stream(
+        run, filename, {"panda": ["x", "counts"]}, name="primary"
+    )
+    callback("descriptor", descriptor.descriptor_doc)
+    for resource in resources.values():
+        callback("stream_resource", resource.stream_resource_doc)
+
+    # collect 8 frames at a time
+    for start in range(0, len(positions), 8):
+        stop = min(start + 8, len(positions))
+        send_stream_datum(callback, descriptor, resources, resources, start, stop)
+
+    callback("stop", run.compose_stop())
+
+    assert len(sweeps) == NUM_SWEEPS
+    for sweep in sweeps:
+        np.testing.assert_array_equal(sweep.data["x"], np.arange(FRAMES_PER_SWEEP))
+        np.testing.assert_array_equal(sweep.data["counts"], 10 * sweep.data["x"])
+
+
+@pytest.mark.parametrize("detector_name", [None, "panda1", "panda2"])
+def test_callback_uses_one_detector(tmp_path, caplog, detector_name):
+    positions = snaked_positions()
+    filename = tmp_path / "panda.h5"
+    write_hdf_file(
+        filename, {"x": positions, "y": positions + 100, "z": positions + 200}
+    )
+
+    splitter = SweepSplitter(frames_per_sweep=FRAMES_PER_SWEEP)
+    sweeps = collect_sweeps(splitter)
+    callback = SweepSplitterCallback(splitter, detector_name=detector_name)
+
+    run = compose_run()
+    callback("start", run.start_doc)
+    descriptor, resources = compose_stream(
+        run, filename, {"panda1": ["x"], "panda2": ["y"]}, name="primary"
+    )
+    # stream resource for a different stream
+    other_descriptor, other_resources = compose_stream(
+        run, filename, {"panda3": ["z"]}, name="other"
+    )
+    for doc in (descriptor, other_descriptor):
+        callback("descriptor", doc.descriptor_doc)
+    for resource in [*resources.values(), *other_resources.values()]:
+        callback("stream_resource", resource.stream_resource_doc)
+
+    # the detectors are collected in different sized chunks
+    for start in range(0, len(positions), 8):
+        stop = min(start + 8, len(positions))
+        send_stream_datum(callback, descriptor, resources, ["x"], start, stop)
+    for start in range(0, len(positions), 6):
+        stop = min(start + 6, len(positions))
+        send_stream_datum(callback, descriptor, resources, ["y"], start, stop)
+
+    callback("stop", run.compose_stop())
+
+    key = "y" if detector_name == "panda2" else "x"
+    assert len(sweeps) == NUM_SWEEPS
+    for sweep in sweeps:
+        assert list(sweep.data) == [key]
+    offset = 100 if key == "y" else 0
+    np.testing.assert_array_equal(
+        np.concatenate([s.data[key] for s in sweeps]),
+        np.tile(np.arange(FRAMES_PER_SWEEP), NUM_SWEEPS) + offset,
+    )
+    assert "not used for sweeps" not in caplog.text
+
+
+def test_callback_warns_about_incomplete_frames(tmp_path, caplog):
+    positions = snaked_positions()
+    filename = tmp_path / "panda.h5"
+    write_hdf_file(filename, {"x": positions, "counts": 10 * positions})
+
+    splitter = SweepSplitter(frames_per_sweep=FRAMES_PER_SWEEP)
+    sweeps = collect_sweeps(splitter)
+    callback = SweepSplitterCallback(splitter)
+
+    run = compose_run()
+    callback("start", run.start_doc)
+    descriptor, resources = compose_stream(
+        run, filename, {"panda": ["x", "counts"]}, name="primary"
+    )
+    callback("descriptor", descriptor.descriptor_doc)
+    for resource in resources.values():
+        callback("stream_resource", resource.stream_resource_doc)
+
+    send_stream_datum(callback, descriptor, resources, ["x", "counts"], 0, 10)
+    # counts for the last frames are never received
+    send_stream_datum(callback, descriptor, resources, ["x"], 10, 20)
+    callback("stop", run.compose_stop())
+
+    assert len(sweeps) == 2
+    assert "Frames 10 to 20 of panda not used for sweeps" in caplog.text
@@ -0,0 +1,115 @@
+import numpy as np
+
+from spectroscopy_bluesky.common.callbacks import (
+    NormalisedFrames,
+    SweepSplitter,
+    XasNormaliser,
+)
+from spectroscopy_bluesky.common.callbacks.xas_normalisation import RunningPolyFit
+
+E0 = 7112.0
+EDGE_STEP = 1.5
+
+
+def absorption(energy):
+    """Linear background with a sharp edge at E0"""
+    return 0.2 + 1e-4 * (energy - E0) + EDGE_STEP * (energy > E0)
+
+
+def make_frames(energy, noise: float = 0.0, seed: int = 0):
+    i0 = np.full(len(energy), 1000.0)
+    mu = absorption(energy)
+    if noise > 0:
+        mu = mu + np.random.default_rng(seed).normal(0, noise, len(energy))
+    return {"energy": energy, "I0": i0, "It": i0 * np.exp(-mu), "If": i0 * mu}
+
+
+def test_running_fit_matches_polyfit():
+    rng = np.random.default_rng(0)
+    x = np.linspace(-10, 10, 50)
+    y = 1.0 + 2.0 * x - 0.5 * x**2 + rng.normal(0, 0.1, len(x))
+    fit = RunningPolyFit(order=2)
+    assert fit.coefficients() is None
+    for chunk in np.array_split(np.arange(len(x)), 4):
+        fit.add(x[chunk], y[chunk])
+
+    expected = np.polynomial.polynomial.polyfit(x, y, 2)
+    np.testing.assert_allclose(fit.coefficients(), expected)
+
+
+def test_running_fit_scaled_abscissa():
+    # post-edge range powers up to 300**4 : fit x/300 instead
+    x = np.linspace(50, 300, 200)
+    y = 1.0 + 1e-3 * x - 2e-6 * x**2 + 3e-9 * x**3
+    fit = RunningPolyFit(order=3, scale=300)
+    fit.add(x, y)
+    np.testing.assert_allclose(fit.coefficients(), [1.0, 1e-3, -2e-6, 3e-9])
+    assert fit.coverage((50, 300)) == 1.0
+    assert fit.coverage((0, 500)) == 0.5
+
+
+def test_absorption():
+    normaliser = XasNormaliser(E0, if_key="If")
+    energy = np.array([7000.0, 7200.0])
+    mu = normaliser.absorption(make_frames(energy))
+    np.testing.assert_allclose(mu["mu_trans"], absorption(energy))
+    np.testing.assert_allclose(mu["mu_fluo"], absorption(energy))
+
+
+def test_edge_step_normalisation_per_sweep():
+    energy = np.linspace(E0 - 200, E0 + 400, 601)
+    num_sweeps = 2
+    frames = make_frames(energy)
+
+    splitter = SweepSplitter(frames_per_sweep=len(energy), position_key="energy")
+    normaliser = XasNormaliser(E0, if_key="If")
+    normaliser.attach(splitter)
+    results: list[NormalisedFrames] = []
+    normaliser.callbacks.append(results.append)
+
+    for sweep in range(num_sweeps):
+        order = slice(None) if sweep % 2 == 0 else slice(None, None, -1)
+        sweep_frames = {k: v[order] for k, v in frames.items()}
+        for block in np.array_split(np.arange(len(energy)), 6):
+            splitter.add_frames({k: v[block] for k, v in sweep_frames.items()})
+
+    for signal in ["mu_trans", "mu_fluo"]:
+        np.testing.assert_allclose(normaliser.edge_steps[signal].step, EDGE_STEP)
+
+    # first block of the second sweep is normalised using the first sweep's fits
+    first_block = [r for r in results if r.sweep_index == 1][0]
+    assert "mu_trans_norm" in first_block.data
+    expected = (energy > E0)[::-1][: len(first_block.energy)]
+    np.testing.assert_allclose(first_block.data["mu_trans_norm"], expected, atol=1e-9)
+
+
+def test_noisy_sweep_uses_previous_edge_step_until_fits_cover_range():
+    energy = np.linspace(E0 - 200, E0 + 400, 601)
+    splitter = SweepSplitter(frames_per_sweep=len(energy), position_key="energy")
+    normaliser = XasNormaliser(E0)
+    normaliser.attach(splitter)
+    results: list[NormalisedFrames] = []
+    normaliser.callbacks.append(results.append)
+
+    blocks = np.array_split(np.arange(len(energy)), 20)
+    for sweep in range(3):
+        frames = make_frames(energy, noise=0.01, seed=sweep)
+        for block in blocks:
+            splitter.add_frames({k: v[block] for k, v in frames.items()})
+
+    step = normaliser.edge_steps["mu_trans"].step
+    np.testing.assert_allclose(step, EDGE_STEP, rtol=0.02)
+
+    # first sweep is only normalised once the post-edge range is mostly covered
+    first_sweep = [r for r in results if r.sweep_index == 0]
+    normalised = ["mu_trans_norm" in r.data for r in first_sweep]
+    assert not any(normalised[:14])
+    assert all(normalised[-2:])
+
+    # later sweeps use the edge step of the previous sweep until then, so the
+    # post-edge of the normalised spectrum stays close to 1
+    for result in results[len(blocks) :]:
+        post_edge = (result.energy - E0) > 50
+        if np.any(post_edge):
+            norm = result.data["mu_trans_norm"][post_edge]
+            assert abs(np.mean(norm) - 1) < 0.02
@@ -0,0 +1,347 @@
+import numpy as np
+import pytest
+from bluesky.preprocessors import subs_decorator
+from bluesky.run_engine import RunEngine
+from event_model import compose_run
+from ophyd.sim import SynAxis, SynGauss
+from scipy.optimize import curve_fit
+
+from spectroscopy_bluesky.i18.plans.curve_fitting import (
+    FitCurves,
+    StreamingFitCurves,
+    fit_curve,
+    fit_curves_vectorized,
+    fit_polynomial,
+    fit_quadratic_curve,
+    gaussian_bounds_provider,
+    gaussian_estimate,
+    quadratic,
+    trial_gaussian,
+)
+from spectroscopy_bluesky.i18.plans.undulator_lookuptable_plan import (
+    gap_scan_until_peak_found,
+)
+
+NUM_ROWS = 4
+POINTS_PER_ROW = 41
+PEAK_CENTRES = np.linspace(4.0, 6.0, NUM_ROWS)
+
+
+def run_grid_scan(fit_curves, last_params=None):
+    """Pass documents from a grid scan of Gaussian peaks to the callback
+    (optionally setting the last fit parameters after the start document)"""
+    rng = np.random.default_rng(1)
+    x = np.linspace(0, 10, POINTS_PER_ROW)
+    run = compose_run(
+        metadata={
+            "motors": ["outer", "inner"],
+            "detectors": ["det"],
+            "shape": [NUM_ROWS, POINTS_PER_ROW],
+        }
+    )
+    fit_curves("start", run.start_doc)
+    if last_params is not None:
+        fit_curves.last_params = last_params
+    data_keys = {
+        name: {"source": "sim", "dtype": "number", "shape": []}
+        for name in ["inner", "det"]
+    }
+    descriptor = run.compose_descriptor(name="primary", data_keys=data_keys)
+    fit_curves("descriptor", descriptor.descriptor_doc)
+    for centre in PEAK_CENTRES:
+        y = trial_gaussian(x, 10.0, 0.8, centre) + rng.normal(0, 0.05, len(x))
+        for xval, yval in zip(x, y, strict=True):
+            event = descriptor.compose_event(
+                data={"inner": xval, "det": yval},
+                timestamps={"inner": 0, "det": 0},
+            )
+            fit_curves("event", event)
+    fit_curves("stop", run.compose_stop())
+
+
+def make_fit_curves(backend: str) -> FitCurves:
+    fit_curves = FitCurves()
+    fit_curves.fit_function = trial_gaussian
+    fit_curves.bounds_provider = gaussian_bounds_provider
+    fit_curves.fit_backend = backend
+    fit_curves.max_workers = 2
+    return fit_curves
+
+
+@pytest.mark.parametrize("warm_start_fails", [False, True])
+@pytest.mark.parametrize("backend", ["thread", "process", "vectorized"])
+def test_fit_backends_match_serial(backend: str, warm_start_fails: bool):
+    fits = {}
+    for name in ("serial", backend):
+        fits[name] = make_fit_curves(name)
+        last_params = None
+        if warm_start_fails:
+            # fit from these parameters fails (residuals are not finite), so
+            # the first row is fitted again from the estimate
+            fits[name].estimator = gaussian_estimate
+            fits[name].warm_start = True
+            last_params = np.array([np.nan, np.nan, np.nan])
+        run_grid_scan(fits[name], last_params)
+    serial, other = fits["serial"], fits[backend]
+
+    assert len(other.results) == NUM_ROWS
+    for (param, cov), (expected_param, expected_cov) in zip(
+        other.results, serial.results, strict=True
+    ):
+        np.testing.assert_allclose(param, expected_param, rtol=1e-4)
+        np.testing.assert_allclose(cov, expected_cov, rtol=1e-2, atol=1e-10)
+
+    centres = [param[2] for param, _ in other.results]
+    np.testing.assert_allclose(centres, PEAK_CENTRES, atol=0.02)
+    # last parameters are updated in this process
+    np.testing.assert_allclose(other.last_params, other.results[-1][0])
+    other.close()
+
+
+def test_process_pool_kept_between_runs():
+    fit_curves = make_fit_curves("process")
+    run_grid_scan(fit_curves)
+    executor = fit_curves.executor()
+    assert executor._mp_context.get_start_method() == "spawn"
+    run_grid_scan(fit_curves)
+    assert fit_curves.executor() is executor
+
+    # new pool if the backend changes
+    fit_curves.fit_backend = "thread"
+    run_grid_scan(fit_curves)
+    assert fit_curves.executor() is not executor
+    fit_curves.close()
+    assert fit_curves._executor is None
+
+
+def test_fit_curve():
+    x = np.linspace(0, 10, 41)
+    y = trial_gaussian(x, 10.0, 0.8, 5.3)
+    param, cov = fit_curve(
+        trial_gaussian, x, y, p0=[5.0, 0.5, 20.0], bounds=([0, 0, 0], [20, 2, 10])
+    )
+    np.testing.assert_allclose(param, [10.0, 0.8, 5.3], rtol=1e-6)
+    assert cov.shape == (3, 3)
+
+
+def test_event_values_stored_in_columns():
+    fit_curves = make_fit_curves("serial")
+    run_grid_scan(fit_curves)
+
+    # columns allocated from scan shape, events not kept
+    assert len(fit_curves._xvals) == NUM_ROWS * POINTS_PER_ROW
+    assert len(fit_curves._events) == 0
+    xvals, yvals = fit_curves.extract_data()
+    assert xvals.shape == yvals.shape == (NUM_ROWS * POINTS_PER_ROW,)
+    np.testing.assert_array_equal(xvals[:POINTS_PER_ROW], np.linspace(0, 10, 41))
+
+
+def test_columns_grow_if_more_events_than_expected():
+    fit_curves = FitCurves()
+    fit_curves("start", {"uid": "1", "time": 0, "motors": ["x"], "detectors": ["det"]})
+    for i in range(5):
+        fit_curves("event", {"data": {"x": i, "det_value": 2 * i}, "descriptor": ""})
+    xvals, yvals = fit_curves.extract_data()
+    np.testing.assert_array_equal(xvals, np.arange(5))
+    np.testing.assert_array_equal(yvals, 2 * np.arange(5))
+
+
+def test_unknown_backend():
+    fit_curves = make_fit_curves("gpu")
+    with pytest.raises(ValueError):
+        run_grid_scan(fit_curves)
+
+
+def test_vectorized_fit_without_bounds():
+    x = np.tile(np.linspace(-2, 2, 20), (3, 1))
+    y = 1.0 + 2.0 * x + np.arange(3)[:, None]
+
+    def line(x, a, b):
+        return a + b * x
+
+    results = fit_curves_vectorized(line, list(x), list(y))
+    for row, (param, _) in enumerate(results):
+        np.testing.assert_allclose(param, [1.0 + row, 2.0], atol=1e-8)
+
+
+def make_streaming_fit_curves() -> StreamingFitCurves:
+    fit_curves = StreamingFitCurves()
+    fit_curves.fit_function = trial_gaussian
+    fit_curves.bounds_provider = gaussian_bounds_provider
+    fit_curves.peak_tolerance = 0.05
+    return fit_curves
+
+
+def test_streaming_fit_provisional_peak_each_row():
+    fit_curves = make_streaming_fit_curves()
+    provisional_peaks = []
+
+    # record the provisional peak at the end of each row
+    def record_peak(name, doc):
+        if name == "event" and len(fit_curves.current_row()[0]) == POINTS_PER_ROW:
+            provisional_peaks.append(fit_curves.peak_position)
+
+    def callback(name, doc):
+        fit_curves(name, doc)
+        record_peak(name, doc)
+
+    run_grid_scan(callback)
+    np.testing.assert_allclose(provisional_peaks, PEAK_CENTRES, atol=0.02)
+    assert len(fit_curves.results) == NUM_ROWS
+
+
+def test_streaming_fit_warm_start_from_complete_rows():
+    fit_curves = make_streaming_fit_curves()
+    fit_curves.estimator = gaussian_estimate
+    fit_curves.warm_start = True
+
+    # starting parameters of the final fit of each row
+    final_p0 = []
+    initial_params = fit_curves.initial_params
+    compute = fit_curves.compute
+
+    def recording_initial_params(xvals, yvals):
+        final_p0.append(initial_params(xvals, yvals))
+        return final_p0[-1]
+
+    def recording_compute():
+        fit_curves.initial_params = recording_initial_params
+        compute()
+
+    fit_curves.compute = recording_compute
+    run_grid_scan(fit_curves)
+
+    assert fit_curves.provisional_fit is not None
+    assert len(final_p0) == NUM_ROWS
+    # first row starts from the estimate (not from a provisional fit), the
+    # others from the final fit of the row before
+    x = np.linspace(0, 10, POINTS_PER_ROW)
+    y0 = fit_curves._yvals[:POINTS_PER_ROW]
+    np.testing.assert_allclose(final_p0[0], gaussian_estimate(x, y0)[0])
+    for p0, (param, _) in zip(final_p0[1:], fit_curves.results[:-1], strict=True):
+        np.testing.assert_allclose(p0, param)
+
+
+def test_gap_scan_stops_when_peak_found():
+    RE = RunEngine(call_returns_result=True)
+    gap = SynAxis(name="gap")
+    det = SynGauss("det", gap, "gap", center=5.0, Imax=10.0, sigma=0.5, noise="none")
+    fit_curves = make_streaming_fit_curves()
+    points = np.linspace(3.0, 8.0, 51)
+
+    num_points = []
+
+    @subs_decorator(fit_curves)
+    def plan():
+        num = yield from gap_scan_until_peak_found(det, gap, points, fit_curves)
+        num_points.append(num)
+
+    RE(plan())
+    assert num_points[0] < len(points)
+    assert fit_curves.peak_found()
+    assert fit_curves.peak_position == pytest.approx(5.0, abs=0.05)
+    assert fit_curves.results[0][0][-1] == pytest.approx(5.0, abs=0.05)
+
+
+def test_gaussian_estimate():
+    x = np.linspace(0, 10, 41)
+    params = [10.0, 0.8, 5.3]
+    param, cov = gaussian_estimate(list(x), list(trial_gaussian(x, *params)))
+    np.testing.assert_allclose(param, params)
+    assert cov.shape == (3, 3)
+
+    with pytest.raises(ValueError):
+        # no peak
+        gaussian_estimate(list(x), list(np.exp(x)))
+
+
+@pytest.mark.parametrize("refine", [True, False])
+def test_fit_with_estimator(refine: bool):
+    fit_curves = FitCurves()
+    fit_curves.fit_function = trial_gaussian
+    fit_curves.estimator = gaussian_estimate
+    fit_curves.refine_estimate = refine
+    run_grid_scan(fit_curves)
+
+    centres = [param[2] for param, _ in fit_curves.results]
+    np.testing.assert_allclose(centres, PEAK_CENTRES, atol=0.02)
+    np.testing.assert_allclose(fit_curves.last_params, fit_curves.results[-1][0])
+
+
+def test_fit_polynomial_matches_curve_fit():
+    rng = np.random.default_rng(2)
+    x = np.linspace(-1, 3, 30)
+    y = quadratic(x, 1.0, -2.0, 0.5) + rng.normal(0, 0.05, len(x))
+    sigma = np.full(len(x), 0.05)
+
+    param, cov = fit_polynomial(x, y, 2, weights=1 / sigma)
+    expected_param, expected_cov = curve_fit(quadratic, x, y, sigma=sigma)
+    np.testing.assert_allclose(param, expected_param, rtol=1e-6)
+    np.testing.assert_allclose(cov, expected_cov, rtol=1e-4)
+
+
+def test_fit_polynomial_batched_and_bounded():
+    x = np.tile(np.linspace(0, 1, 10), (3, 1))
+    offsets = np.array([[0.0], [1.0], [2.0]])
+    y = offsets + 3.0 * x
+
+    param, cov = fit_polynomial(x, y, 1)
+    assert param.shape == (3, 2)
+    assert cov.shape == (3, 2, 2)
+    np.testing.assert_allclose(param[:, 0], offsets[:, 0], atol=1e-10)
+    np.testing.assert_allclose(param[:, 1], 3.0)
+
+    # limit the gradient : bounded solution for each curve
+    param, _ = fit_polynomial(x, y, 1, bounds=([-10, 0], [10, 2]))
+    np.testing.assert_allclose(param[:, 1], 2.0)
+    expected_offsets = offsets[:, 0] + 0.5
+    np.testing.assert_allclose(param[:, 0], expected_offsets, atol=1e-6)
+
+
+def test_fit_quadratic_curve():
+    x = list(np.linspace(10, 20, 11))
+    y = list(quadratic(np.array(x), 5.0, 0.2, 0.01))
+    param, cov = fit_quadratic_curve(x, y)
+    np.testing.assert_allclose(param, [5.0, 0.2, 0.01], atol=1e-8)
+    assert cov.shape == (3, 3)
+
+
+def make_counting_estimator(calls: list):
+    def counting_estimate(xvals, yvals):
+        calls.append(len(xvals))
+        return gaussian_estimate(xvals, yvals)
+
+    return counting_estimate
+
+
+def test_warm_start_uses_last_params():
+    estimator_calls = []
+    fit_curves = FitCurves()
+    fit_curves.fit_function = trial_gaussian
+    fit_curves.estimator = make_counting_estimator(estimator_calls)
+    fit_curves.warm_start = True
+    run_grid_scan(fit_curves)
+
+    # only the first row is started from the estimate
+    assert len(estimator_calls) == 1
+    centres = [param[2] for param, _ in fit_curves.results]
+    np.testing.assert_allclose(centres, PEAK_CENTRES, atol=0.02)
+
+    # next run is not warm started from the last fit of this one
+    run_grid_scan(fit_curves)
+    assert len(estimator_calls) == 2
+
+
+def test_warm_start_uses_estimate_after_failed_fit():
+    estimator_calls = []
+    fit_curves = FitCurves()
+    fit_curves.fit_function = trial_gaussian
+    fit_curves.estimator = make_counting_estimator(estimator_calls)
+    fit_curves.warm_start = True
+    fit_curves.bounds_provider = gaussian_bounds_provider
+    # fit from these parameters fails (residuals are not finite)
+    run_grid_scan(fit_curves, last_params=np.array([np.nan, np.nan, np.nan]))
+
+    assert len(estimator_calls) == 1
+    centres = [param[2] for param, _ in fit_curves.results]
+    np.testing.assert_allclose(centres, PEAK_CENTRES, atol=0.02)
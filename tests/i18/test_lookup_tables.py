@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.interpolate import CubicSpline
+
+from spectroscopy_bluesky.common.lookup_tables import lookup_table_cache
+from spectroscopy_bluesky.common.quantity_conversion import (
+    bragg_angle_to_energy,
+    si_111_lattice_spacing,
+)
+from spectroscopy_bluesky.i18.plans.harmonic_lookup_tables import HarmonicLookupTables
+from spectroscopy_bluesky.i18.plans.lookup_tables import (
+    InverseLookup,
+    inverse_lookup,
+    load_lookuptable_curve,
+    lookup_value,
+    lookup_values,
+    lookuptable_curve,
+)
+
+
+def gap_curve():
+    # decreasing gap(Bragg) curve, similar to the i18 harmonic lookup tables
+    bragg = np.linspace(11, 18, 50)
+    return CubicSpline(bragg, 40 / bragg - 0.05 * bragg + 4)
+
+
+def test_inverse_lookup_array():
+    curve = gap_curve()
+    bragg = np.random.default_rng(1).uniform(11, 18, 5000)
+    gaps = curve(bragg)
+
+    inverse = InverseLookup(curve, 11, 18, tolerance=1e-9)
+    np.testing.assert_allclose(inverse(gaps), bragg, atol=1e-6)
+    np.testing.assert_allclose(curve(inverse(gaps)), gaps, atol=1e-9)
+
+
+def test_inverse_lookup_increasing_and_out_of_range():
+    result = lookup_values([[1.0, 4.0], [9.0, 50.0]], lambda x: x**2, 0, 5)
+    assert result.shape == (2, 2)
+    np.testing.assert_allclose(result[0], [1.0, 2.0], atol=1e-6)
+    assert result[1, 0] == pytest.approx(3.0, abs=1e-6)
+    assert np.isnan(result[1, 1])
+
+
+def test_inverse_lookup_not_monotonic():
+    with pytest.raises(ValueError):
+        InverseLookup(lambda x: (x - 2) ** 2, 0, 5)
+
+
+def test_lookup_value_scalar():
+    curve = gap_curve()
+    bragg = lookup_value(float(curve(14.5)), curve, 11, 18)
+    assert isinstance(bragg, float)
+    assert bragg == pytest.approx(14.5, abs=1e-5)
+
+
+def test_lookup_value_out_of_range():
+    curve = gap_curve()
+    with pytest.raises(ValueError, match="outside the range"):
+        lookup_value(float(curve(10.0)), curve)
+    with pytest.raises(ValueError, match="single y value"):
+        lookup_value([1.0, 2.0], curve)
+
+
+def test_inverse_lookup_reused_over_curve_range():
+    # non-monotonic outside of the table range, so default 0-100 range would fail
+    bragg = np.linspace(11, 18, 50)
+    curve = CubicSpline(bragg, (bragg - 5) ** 2)
+    inverse = inverse_lookup(curve)
+    np.testing.assert_allclose(inverse.x_grid[[0, -1]], [11, 18])
+    assert inverse_lookup(curve) is inverse
+
+    gaps = curve([12.0, 16.5])
+    np.testing.assert_allclose(lookup_values(gaps, curve), [12.0, 16.5], atol=1e-6)
+    assert lookup_value(float(gaps[0]), curve) == pytest.approx(12.0, abs=1e-6)
+
+
+def test_inverse_lookup_quadratic_fit_range():
+    bragg = np.linspace(11, 18, 20)
+    fit = lookuptable_curve(np.column_stack([bragg, (bragg - 5) ** 2]), False)
+    assert fit.x_range == (11.0, 18.0)
+    assert lookup_value(fit(15.0), fit) == pytest.approx(15.0, abs=1e-5)
+
+
+def write_lookup_table(filename, bragg, gap):
+    with open(filename, "w") as f:
+        f.write("# bragg\tidgap\nUnits\tDeg\tmm\n")
+        for b, g in zip(bragg, gap, strict=True):
+            f.write(f"{b:.3f} {g:.5f}\n")
+
+
+def test_load_lookuptable_curve_cached(tmp_path):
+    filename = tmp_path / "lookuptable.txt"
+    bragg = np.linspace(18, 11, 36)
+    write_lookup_table(filename, bragg, 20 - bragg)
+
+    lookup_table_cache.clear()
+    curve = load_lookuptable_curve(filename)
+    assert curve(15.0) == pytest.approx(5.0)
+    assert load_lookuptable_curve(filename) is curve
+    assert (lookup_table_cache.hits, lookup_table_cache.misses) == (1, 1)
+
+    # quadratic fit is cached separately
+    fit = load_lookuptable_curve(filename, interpolate=False)
+    assert fit(15.0) == pytest.approx(5.0, abs=1e-3)
+    assert lookup_table_cache.hits == 2
+
+    # modified file is reloaded
+    write_lookup_table(filename, bragg, 21 - bragg)
+    stat = filename.stat()
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    new_curve = load_lookuptable_curve(filename)
+    assert new_curve is not curve
+    assert new_curve(15.0) == pytest.approx(6.0)
+    assert lookup_table_cache.misses == 2
+    lookup_table_cache.clear()
+
+
+def test_harmonic_lookup_tables(tmp_path):
+    # harmonic 3 covers 10-20 degrees, harmonic 5 covers 15-30 degrees
+    for harmonic, (start, stop) in {3: (10, 20), 5: (15, 30)}.items():
+        bragg = np.linspace(start, stop, 21)
+        write_lookup_table(
+            tmp_path / f"Si111_harmonic{harmonic}.txt", bragg, harmonic + 0.1 * bragg
+        )
+    (tmp_path / "notes.txt").write_text("not a lookup table")
+
+    tables = HarmonicLookupTables.from_directory(tmp_path)
+    np.testing.assert_array_equal(tables.harmonics, [3, 5])
+
+    bragg = np.array([5.0, 10.0, 14.0, 17.5, 20.0, 25.0, 30.0, 31.0])
+    harmonics, gaps = tables.lookup(bragg)
+    np.testing.assert_array_equal(harmonics, [0, 3, 3, 3, 3, 5, 5, 0])
+    np.testing.assert_allclose(gaps[1:-1], harmonics[1:-1] + 0.1 * bragg[1:-1])
+    assert np.isnan(gaps[[0, -1]]).all()
+
+    energies = bragg_angle_to_energy(si_111_lattice_spacing, bragg[1:-1])
+    angles, energy_harmonics, energy_gaps = tables.lookup_energy(energies)
+    np.testing.assert_allclose(angles, bragg[1:-1])
+    np.testing.assert_array_equal(energy_harmonics, harmonics[1:-1])
+    np.testing.assert_allclose(energy_gaps, gaps[1:-1])
+
+    segments = tables.segments(harmonics)
+    assert [(s.harmonic, s.start, s.stop) for s in segments] == [
+        (0, 0, 1),
+        (3, 1, 5),
+        (5, 5, 7),
+        (0, 7, 8),
+    ]
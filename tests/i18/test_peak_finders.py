@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from spectroscopy_bluesky.i18.plans.curve_fitting import trial_gaussian
+from spectroscopy_bluesky.i18.plans.peak_finder_benchmark import (
+    BenchmarkResult,
+    benchmark_peak_finders,
+    choose_peak_finder,
+    format_benchmark,
+)
+from spectroscopy_bluesky.i18.plans.peak_finders import (
+    FitCurvesPeakFinder,
+    get_peak_finder,
+    peak_finders,
+)
+
+X = np.linspace(0, 10, 41)
+CENTRE = 5.13
+
+
+@pytest.mark.parametrize(
+    "name, tolerance",
+    [
+        ("argmax", 0.125),
+        ("centroid", 0.05),
+        ("parabola", 0.05),
+        ("spline", 0.01),
+        ("gaussian", 1e-6),
+        ("gaussian_estimate", 1e-6),
+    ],
+)
+def test_peak_finders(name: str, tolerance: float):
+    y = trial_gaussian(X, 10.0, 0.8, CENTRE)
+    assert get_peak_finder(name)(X, y) == pytest.approx(CENTRE, abs=tolerance)
+
+
+def test_unknown_peak_finder():
+    with pytest.raises(ValueError):
+        get_peak_finder("not_a_peak_finder")
+
+
+def test_fit_curves_peak_finder():
+    fit_curves = FitCurvesPeakFinder("parabola")
+    param, cov = fit_curves.do_fitting(X, trial_gaussian(X, 10.0, 0.8, CENTRE))
+    assert param[-1] == pytest.approx(CENTRE, abs=0.05)
+    assert cov is None
+
+
+def test_benchmark_all_peak_finders():
+    results = benchmark_peak_finders(num_curves=5, noise=0.1)
+    assert [r.name for r in results] == list(peak_finders)
+    for result in results:
+        assert result.num_curves == 5
+        assert result.time_per_fit > 0
+    assert len(format_benchmark(results).splitlines()) == len(results) + 1
+
+
+def test_choose_peak_finder():
+    results = [
+        BenchmarkResult("slow", 1, 1e-3, 1e-4, 1e-4),
+        BenchmarkResult("fast", 1, 1e-6, 1e-2, 1e-2),
+        BenchmarkResult("fast_but_fails", 1, 1e-7, 1e-4, 1e-4, failures=1),
+    ]
+    assert choose_peak_finder(results, 0.1).name == "fast"
+    assert choose_peak_finder(results, 1e-3).name == "slow"
+    assert choose_peak_finder(results, 1e-5) is None
@@ -0,0 +1,238 @@
+import inspect
+
+import numpy as np
+import pytest
+from bluesky.run_engine import RunEngine
+from ophyd import SoftPositioner
+from ophyd.sim import SynAxis, SynGauss
+
+from spectroscopy_bluesky.i18.plans.curve_fitting import (
+    FitCurves,
+    StreamingFitCurves,
+    gaussian_bounds_provider,
+    gaussian_estimate,
+    trial_gaussian,
+)
+from spectroscopy_bluesky.i18.plans.undulator_lookuptable_plan import (
+    NEXT_POSITION_GROUP,
+    adaptive_gap_search,
+    fly_gap_scan,
+    undulator_lookuptable_scan,
+)
+
+PEAK_GAP = 5.137
+
+
+def make_devices(delay: float = 0):
+    # readback is updated 50 times during each move
+    gap = SynAxis(name="gap", delay=delay, events_per_move=50)
+    det = SynGauss("det", gap, "gap", center=PEAK_GAP, Imax=10, sigma=0.3)
+    return gap, det
+
+
+def count_events(RE: RunEngine) -> list[int]:
+    num_events = []
+
+    def count(name, doc):
+        if name == "start":
+            num_events.append(0)
+        elif name == "event":
+            num_events[-1] += 1
+
+    RE.subscribe(count)
+    return num_events
+
+
+def test_adaptive_gap_search():
+    RE = RunEngine(call_returns_result=True)
+    num_events = count_events(RE)
+    gap, det = make_devices()
+
+    tolerance = 0.005
+    result = RE(adaptive_gap_search(det, gap, 3.0, 5.0, tolerance))
+    assert result.plan_result == pytest.approx(PEAK_GAP, abs=tolerance)
+    # fixed step scan would need 1000 points
+    assert num_events[0] < 50
+
+
+def test_lookuptable_scan_adaptive(tmp_path):
+    RE = RunEngine(call_returns_result=True)
+    gap, det = make_devices()
+    bragg = SynAxis(name="bragg")
+    output_file = tmp_path / "gap_scan.txt"
+
+    result = RE(
+        undulator_lookuptable_scan(
+            10.0,
+            0.5,
+            3,
+            4.0,
+            2.0,
+            0.01,
+            bragg,
+            gap,
+            det,
+            output_file=str(output_file),
+            adaptive_tolerance=0.01,
+        )
+    )
+    fit_results = np.array(result.plan_result)
+    np.testing.assert_allclose(fit_results[:, 1], PEAK_GAP, atol=0.01)
+    assert len(output_file.read_text().splitlines()) == 4
+
+
+def test_fly_gap_scan_fits_peak():
+    RE = RunEngine(call_returns_result=True)
+    gap, det = make_devices(delay=0.5)
+    gap.velocity.put(2.0)
+    fit_callback = FitCurves()
+    fit_callback.fit_function = trial_gaussian
+    fit_callback.bounds_provider = gaussian_bounds_provider
+    RE.subscribe(fit_callback)
+
+    result = RE(fly_gap_scan(det, gap, 4.0, 6.0, sweep_time=0.5, read_period=0.01))
+    assert result.plan_result > 10
+    assert gap.position == pytest.approx(6.0)
+    # original velocity restored after the sweep
+    assert gap.velocity.get() == 2.0
+
+    peak = fit_callback.results[0][0][-1]
+    assert peak == pytest.approx(PEAK_GAP, abs=0.05)
+
+
+def test_fly_gap_scan_needs_velocity_for_sweep_time():
+    RE = RunEngine()
+    _, det = make_devices()
+    gap = SoftPositioner(name="gap", init_pos=4.0)
+
+    with pytest.raises(ValueError, match="no velocity"):
+        RE(fly_gap_scan(det, gap, 4.0, 6.0, sweep_time=0.5))
+    assert gap.position == 4.0
+
+
+def test_lookuptable_scan_moves_bragg_before_fitting(tmp_path):
+    RE = RunEngine(call_returns_result=True)
+    messages = []
+    RE.msg_hook = messages.append
+    gap, det = make_devices()
+    bragg = SynAxis(name="bragg")
+
+    result = RE(
+        undulator_lookuptable_scan(
+            10.0, 0.5, 3, 4.0, 2.0, 0.05, bragg, gap, det, adaptive_tolerance=0.01
+        )
+    )
+    fit_results = np.array(result.plan_result)
+    np.testing.assert_allclose(fit_results[:, 1], PEAK_GAP, atol=0.01)
+
+    commands = [(m.command, m.obj.name if m.obj else None) for m in messages]
+    close_runs = [i for i, c in enumerate(commands) if c[0] == "close_run"]
+    # move to next Bragg angle is started just before first 2 runs are closed
+    for i in close_runs[:2]:
+        assert commands[i - 1] == ("set", "bragg")
+    assert commands[close_runs[2] - 1] != ("set", "bragg")
+
+    # last gap scan is centred on the peak extrapolated from first two scans
+    gap_sets = [m for m in messages if m.command == "set" and m.obj is gap]
+    last_start = [
+        m.args[0] for m in gap_sets if m.kwargs.get("group") == NEXT_POSITION_GROUP
+    ][-1]
+    assert last_start == pytest.approx(PEAK_GAP - 1.0, abs=0.01)
+
+
+def test_lookuptable_scan_list_scan_fits_after_bragg_move():
+    RE = RunEngine(call_returns_result=True)
+    messages = []
+    RE.msg_hook = messages.append
+    gap, det = make_devices()
+    bragg = SynAxis(name="bragg")
+
+    fit_callback = FitCurves()
+    fit_callback.fit_function = trial_gaussian
+    # no bounds provider : the second scan starts at the first peak, so the
+    # weighted centre of the scan is not close to the peak
+    fit_callback.estimator = gaussian_estimate
+    # number of messages processed when each fit is made
+    fit_times = []
+    compute = fit_callback.compute
+
+    def recording_compute():
+        fit_times.append(len(messages))
+        compute()
+
+    fit_callback.compute = recording_compute
+
+    result = RE(
+        undulator_lookuptable_scan(
+            10.0,
+            0.5,
+            3,
+            4.0,
+            2.0,
+            0.05,
+            bragg,
+            gap,
+            det,
+            curve_fit_callback=fit_callback,
+        )
+    )
+    fit_results = np.array(result.plan_result)
+    np.testing.assert_allclose(fit_results[:, 1], PEAK_GAP, atol=0.01)
+    assert len(fit_times) == 3
+
+    # each gap scan is a list scan, and the move to the next Bragg angle is
+    # started before the peak of the scan is fitted
+    assert sum(m.command == "open_run" for m in messages) == 3
+    bragg_moves = [
+        i
+        for i, m in enumerate(messages)
+        if m.command == "set"
+        and m.obj is bragg
+        and m.kwargs.get("group") == NEXT_POSITION_GROUP
+    ]
+    assert len(bragg_moves) == 2
+    for move, fit_time in zip(bragg_moves, fit_times, strict=False):
+        assert move < fit_time
+
+
+def test_lookuptable_scan_options_are_keyword_only():
+    parameters = inspect.signature(undulator_lookuptable_scan).parameters
+    for name in ("stop_at_peak", "adaptive_tolerance", "fly_sweep_time"):
+        assert parameters[name].kind == inspect.Parameter.KEYWORD_ONLY
+
+
+def streaming_fit_curves(peak_tolerance: float | None) -> StreamingFitCurves:
+    fit_curves = StreamingFitCurves()
+    fit_curves.peak_tolerance = peak_tolerance
+    return fit_curves
+
+
+@pytest.mark.parametrize(
+    "curve_fit_callback, options",
+    [
+        (FitCurves(), {}),
+        (streaming_fit_curves(None), {}),
+        (streaming_fit_curves(0.01), {"adaptive_tolerance": 0.01}),
+    ],
+)
+def test_lookuptable_scan_stop_at_peak_needs_streaming_fit(curve_fit_callback, options):
+    RE = RunEngine()
+    gap, det = make_devices()
+    bragg = SynAxis(name="bragg")
+    with pytest.raises(ValueError, match="stop_at_peak"):
+        RE(
+            undulator_lookuptable_scan(
+                10.0,
+                0.5,
+                3,
+                4.0,
+                2.0,
+                0.05,
+                bragg,
+                gap,
+                det,
+                curve_fit_callback=curve_fit_callback,
+                stop_at_peak=True,
+                **options,
+            )
+        )
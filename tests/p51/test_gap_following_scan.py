@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from ophyd.sim import SynAxis
+
+from spectroscopy_bluesky.common.adaptive_flush import AdaptiveFlushPolicy
+from spectroscopy_bluesky.p51.plans import seq_table_scans
+from spectroscopy_bluesky.p51.plans.seq_table_scans import (
+    calculate_energy_scan_angles,
+    seq_table_energy_scan,
+)
+
+
+def test_energy_scan_gap_following(tmp_path, monkeypatch):
+    # lookup table only covers part of the Bragg angle range of the scan
+    filename = tmp_path / "lookuptable.txt"
+    bragg = np.linspace(15.0, 16.0, 11)
+    with open(filename, "w") as f:
+        f.write("# bragg\tidgap\nUnits\tDeg\tmm\n")
+        for b in bragg:
+            f.write(f"{b:.3f} {30 - b:.5f}\n")
+
+    position_scan_kwargs = {}
+
+    def position_scan(*args, **kwargs):
+        position_scan_kwargs.update(kwargs)
+        yield from []
+
+    monkeypatch.setattr(seq_table_scans, "seq_table_position_scan", position_scan)
+
+    bragg_motor = SynAxis(name="bragg")
+    gap = SynAxis(name="gap")
+    flush_policy = AdaptiveFlushPolicy(target_frames=100)
+    list(
+        seq_table_energy_scan(
+            "Fe",
+            "K",
+            10.0,
+            bragg_motor,
+            None,
+            flush_policy=flush_policy,
+            undulator_gap=gap,
+            gap_lookup_table=str(filename),
+        )
+    )
+
+    follower = position_scan_kwargs["gap_follower"]
+    assert follower.gap_device is gap
+    assert follower.bragg_motor is bragg_motor
+    assert follower.angle_limits == pytest.approx((15.0, 16.0))
+    assert position_scan_kwargs["flush_policy"] is flush_policy
+
+    # recorded gap positions use the nearest end of the table outside of its range
+    angles = calculate_energy_scan_angles("Fe", "K")
+    gap_positions = position_scan_kwargs["scan_params_dict"]["gap_positions"]
+    np.testing.assert_allclose(gap_positions, 30 - np.clip(angles, 15.0, 16.0))
+
+
+def test_energy_scan_without_gap_following(monkeypatch):
+    position_scan_kwargs = {}
+
+    def position_scan(*args, **kwargs):
+        position_scan_kwargs.update(kwargs)
+        yield from []
+
+    monkeypatch.setattr(seq_table_scans, "seq_table_position_scan", position_scan)
+    list(seq_table_energy_scan("Fe", "K", 10.0, SynAxis(name="bragg"), None))
+    assert position_scan_kwargs["gap_follower"] is None
+    assert "gap_positions" not in position_scan_kwargs["scan_params_dict"]
@@ -0,0 +1,66 @@
+import asyncio
+
+import bluesky.preprocessors as bpp
+import pytest
+from bluesky.run_engine import RunEngine
+from ophyd_async.core import soft_signal_rw
+
+from spectroscopy_bluesky.p51.plans import seq_table_scans
+from spectroscopy_bluesky.p51.plans.seq_table_scans import prepare_pv_monitoring
+
+READABLE_PVS = {
+    "ring_current": {"read_pv": "SR-DI-DCCT-01:SIGNAL", "pv_datatype": "float"},
+    "ring_current_copy": {"read_pv": "SR-DI-DCCT-01:SIGNAL", "pv_datatype": "float"},
+}
+
+
+@pytest.fixture
+def created_signals(monkeypatch):
+    # soft signals instead of EPICS signals, so they connect without an IOC
+    created = []
+
+    def soft_epics_signal_r(datatype, read_pv, name=""):
+        signal = soft_signal_rw(datatype, name=name)
+        created.append(signal)
+        return signal
+
+    monkeypatch.setattr(seq_table_scans, "epics_signal_r", soft_epics_signal_r)
+    monkeypatch.setattr(seq_table_scans, "_monitored_signals", {})
+    return created
+
+
+def monitored_names(RE: RunEngine) -> list[str]:
+    descriptors = []
+    RE.subscribe(
+        lambda name, doc: descriptors.append(doc) if name == "descriptor" else None
+    )
+    RE(bpp.run_wrapper(prepare_pv_monitoring(READABLE_PVS)))
+    return sorted(d["name"] for d in descriptors)
+
+
+def test_same_pv_monitored_with_two_names(created_signals):
+    RE = RunEngine()
+    names = ["ring_current", "ring_current_copy"]
+    assert monitored_names(RE) == names
+    assert [s.name for s in created_signals] == names
+
+    # signals are reused in the next run
+    assert monitored_names(RE) == names
+    assert len(created_signals) == 2
+
+
+def test_signals_cached_for_each_event_loop(created_signals):
+    closed_loop = asyncio.new_event_loop()
+    closed_loop.close()
+    seq_table_scans._monitored_signals[closed_loop] = {}
+
+    monitored_names(RunEngine(loop=asyncio.new_event_loop()))
+    assert len(created_signals) == 2
+
+    # new signals are made for a RunEngine with a different event loop
+    monitored_names(RunEngine())
+    assert len(created_signals) == 4
+
+    # cache for the closed event loop has been removed
+    assert len(seq_table_scans._monitored_signals) == 2
+    assert closed_loop not in seq_table_scans._monitored_signals
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from spectroscopy_bluesky.p51.plans.scan_estimator import (
+    SEQ_TABLE_MAX_ROWS,
+    estimate_seq_table_energy_scan,
+    estimate_seq_table_position_scan,
+    estimate_seq_table_uniform_scan,
+    estimate_trajectory_fly_scan,
+)
+from spectroscopy_bluesky.p51.plans.seq_table_scans import calculate_energy_scan_angles
+
+
+def test_uniform_scan_estimate():
+    estimate = estimate_seq_table_uniform_scan(
+        0, 10, 0.5, 2.0, number_of_sweeps=4, acceleration_time=0.1
+    )
+    assert estimate.triggers_per_sweep == 21
+    assert estimate.total_triggers == 84
+    # one back-and-forth sweep in the table, repeated twice
+    assert estimate.seq_table_rows == 42
+    assert estimate.seq_table_repeats == 2
+    assert estimate.sweep_time == pytest.approx(2.0)
+    assert estimate.turnaround_time == pytest.approx(0.2)
+    # ramp up + ramp down, 4 sweeps, 3 turnarounds
+    assert estimate.total_duration == pytest.approx(0.2 + 8.0 + 0.6)
+    # panda captures an event for each position trigger of each sweep
+    assert estimate.panda_capture_events == 84
+    assert estimate.data_volume_bytes == 84 * 4 * 8
+    assert estimate.warnings == []
+
+
+def test_explicit_ramp_and_turnaround_times():
+    estimate = estimate_seq_table_position_scan(
+        0,
+        1,
+        1.0,
+        np.linspace(0, 1, 11),
+        number_of_sweeps=2,
+        ramp_time=0.5,
+        turnaround_time=0.3,
+    )
+    assert estimate.total_duration == pytest.approx(1.0 + 2.0 + 0.3)
+    assert estimate.overhead_fraction == pytest.approx(1.3 / 3.3)
+
+
+def test_too_many_seq_table_rows_warning():
+    estimate = estimate_seq_table_position_scan(
+        0, 1, 1.0, np.linspace(0, 1, SEQ_TABLE_MAX_ROWS), number_of_sweeps=2
+    )
+    assert estimate.seq_table_rows == 2 * SEQ_TABLE_MAX_ROWS
+    assert estimate.panda_capture_events == 2 * SEQ_TABLE_MAX_ROWS
+    assert any("Sequence table" in w for w in estimate.warnings)
+
+
+def test_trajectory_fly_scan_estimate():
+    estimate = estimate_trajectory_fly_scan(0, 1, 100, 0.01, acceleration_time=0.2)
+    assert estimate.total_triggers == 100
+    assert estimate.sweep_time == pytest.approx(1.0)
+    assert estimate.total_duration == pytest.approx(1.4)
+    assert estimate.warnings == []
+
+
+def test_energy_scan_estimate():
+    angles = calculate_energy_scan_angles("Fe", "K")
+    estimate = estimate_seq_table_energy_scan(
+        "Fe", "K", 10.0, number_of_sweeps=3, add_sweep_triggers=True
+    )
+    assert estimate.scan_name == "seq_table_energy_scan"
+    assert estimate.triggers_per_sweep == len(angles)
+    assert estimate.total_triggers == 3 * len(angles)
+    assert estimate.seq_table_rows == 2 * len(angles)
+    assert estimate.seq_table_repeats == 2
+    # last repeat of the table only makes the forward sweep
+    assert estimate.panda_capture_events == 3 * len(angles)
+    assert estimate.data_volume_bytes == 3 * len(angles) * 4 * 8
+    assert estimate.sweep_time == pytest.approx(10.0)
+    assert estimate.warnings == []
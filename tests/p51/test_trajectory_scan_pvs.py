@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from bluesky.run_engine import RunEngine
+from ophyd_async.core import soft_signal_rw
+
+from spectroscopy_bluesky.p51.plans import common
+
+
+@pytest.fixture
+def RE():
+    return RunEngine()
+
+
+@pytest.fixture
+def trajectory_signals(RE, monkeypatch):
+    cs_axis = soft_signal_rw(str, "Y", name="cs_axis_label")
+    profile_name = soft_signal_rw(str, "PMAC6CS3", name="cs_profile_name")
+    monkeypatch.setattr(
+        common, "_trajectory_scan_signals", {RE.loop: {"TEST": (cs_axis, profile_name)}}
+    )
+
+    # record the values written to each signal
+    writes = {cs_axis.name: [], profile_name.name: []}
+    for signal in (cs_axis, profile_name):
+
+        def recording_set(value, *args, _set=signal.set, _name=signal.name, **kw):
+            writes[_name].append(value)
+            return _set(value, *args, **kw)
+
+        monkeypatch.setattr(signal, "set", recording_set)
+    return cs_axis, profile_name, writes
+
+
+def test_only_changed_values_written(RE, trajectory_signals):
+    cs_axis, profile_name, writes = trajectory_signals
+
+    RE(common.setup_trajectory_scan_pvs("TEST"))
+    # profile name was already correct, so only the axis label is written
+    assert writes == {"cs_axis_label": ["X"], "cs_profile_name": []}
+
+    # second call : both values already set, nothing written
+    RE(common.setup_trajectory_scan_pvs("TEST"))
+    assert writes == {"cs_axis_label": ["X"], "cs_profile_name": []}
+
+    RE(common.setup_trajectory_scan_pvs("TEST", cs_profile_name="PMAC6CS2"))
+    assert writes == {"cs_axis_label": ["X"], "cs_profile_name": ["PMAC6CS2"]}
+    # cached signals for the prefix were used for every call
+    assert common._trajectory_scan_signals[RE.loop]["TEST"] == (cs_axis, profile_name)
+
+
+def test_signals_cached_per_event_loop(monkeypatch):
+    # soft signals instead of EPICS signals, so they connect without an IOC
+    created = []
+
+    def soft_epics_signal_rw(datatype, read_pv, name=""):
+        signal = soft_signal_rw(datatype, "X" if "CsAxis" in read_pv else "PMAC6CS3")
+        signal.set_name(name)
+        created.append(signal)
+        return signal
+
+    monkeypatch.setattr(common, "epics_signal_rw", soft_epics_signal_rw)
+    monkeypatch.setattr(common, "_trajectory_scan_signals", {})
+
+    RE1 = RunEngine()
+    RE1(common.setup_trajectory_scan_pvs("TEST"))
+    RE1(common.setup_trajectory_scan_pvs("TEST"))
+    assert len(created) == 2
+
+    # a RunEngine on another event loop gets its own signals
+    RE2 = RunEngine(loop=asyncio.new_event_loop())
+    RE2(common.setup_trajectory_scan_pvs("TEST"))
+    assert len(created) == 4
+    assert set(common._trajectory_scan_signals) == {RE1.loop, RE2.loop}
+    assert created[2] not in common._trajectory_scan_signals[RE1.loop]["TEST"]
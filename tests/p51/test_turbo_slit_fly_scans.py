@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from ophyd_async.fastcs.panda import PandaPcompDirection
+
+from spectroscopy_bluesky.p51.plans.common import get_encoder_counts
+from spectroscopy_bluesky.p51.plans.turbo_slit_fly_scans import (
+    both_ways_pcomp_infos,
+    continuous_sweep_scan_info,
+)
+
+
+def test_continuous_sweep_spec_matches_pcomp():
+    start, stop, num, duration = 1.0, 3.0, 21, 0.05
+    scan_info = continuous_sweep_scan_info(
+        "x", start, stop, num, duration, number_of_sweeps=3, runup=0.2
+    )
+    frames = scan_info.spec.frames()
+    forward = np.linspace(start, stop, num)
+    # runup is not added to the trajectory points
+    np.testing.assert_allclose(
+        frames.midpoints["x"], np.concatenate([forward, forward[::-1], forward])
+    )
+    np.testing.assert_allclose(frames.duration, duration)
+    # velocity = 2 / (20 * 0.05) = 2 units per second, 0.2 runup -> 0.2 seconds
+    assert scan_info.ramp_time == pytest.approx(0.2)
+
+    forward_pcomp, reverse_pcomp = both_ways_pcomp_infos(start, stop, num)
+    step = abs(get_encoder_counts(0.1, 0))
+    for pcomp, sweep_start in [(forward_pcomp, start), (reverse_pcomp, stop)]:
+        assert pcomp.number_of_pulses == num
+        assert pcomp.rising_edge_step == pytest.approx(step, abs=1)
+        assert pcomp.start_postion == pytest.approx(
+            get_encoder_counts(sweep_start), abs=1
+        )
+    # encoder counts decrease with position (MRES < 0)
+    assert forward_pcomp.direction == PandaPcompDirection.NEGATIVE
+    assert reverse_pcomp.direction == PandaPcompDirection.POSITIVE
+
+
+def test_continuous_sweep_explicit_ramp_time():
+    scan_info = continuous_sweep_scan_info(
+        "x", 0, 1, 11, 0.1, 2, runup=0.5, ramp_time=0.3, turnaround_time=0.1
+    )
+    assert scan_info.ramp_time == 0.3
+    assert scan_info.turnaround_time == 0.1